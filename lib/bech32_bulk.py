@@ -0,0 +1,174 @@
+import numpy as np
+
+try:
+    import polars as pl
+except ImportError:  # polars is only needed for Series input/output
+    pl = None
+
+CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+GENERATOR = np.array([0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3], dtype=np.uint32)
+KEY_BYTES = 32
+DATA_LEN = (KEY_BYTES * 8 + 4) // 5
+CHECKSUM_LEN = 6
+
+_CHARSET_BYTES = np.frombuffer(CHARSET.encode(), dtype=np.uint8)
+_CHARSET_REV = np.full(256, 255, dtype=np.uint8)
+_CHARSET_REV[_CHARSET_BYTES] = np.arange(32, dtype=np.uint8)
+_BIT_WEIGHTS = np.array([16, 8, 4, 2, 1], dtype=np.uint8)
+
+
+def _hrp_expand(prefix):
+    return [ord(c) >> 5 for c in prefix] + [0] + [ord(c) & 31 for c in prefix]
+
+
+def _polymod(values):
+    """Vectorized bech32 polymod over the columns of an (N, L) array of 5-bit values."""
+    chk = np.ones(values.shape[0], dtype=np.uint32)
+    for i in range(values.shape[1]):
+        top = chk >> 25
+        chk = ((chk & 0x1ffffff) << 5) ^ values[:, i].astype(np.uint32)
+        for j in range(5):
+            chk ^= np.where((top >> j) & 1, GENERATOR[j], 0).astype(np.uint32)
+    return chk
+
+
+def _with_hrp(prefix, values):
+    hrp = np.array(_hrp_expand(prefix), dtype=np.uint8)
+    return np.hstack([np.broadcast_to(hrp, (values.shape[0], len(hrp))), values])
+
+
+def _to_array(values):
+    """Return (list of values, is_polars, name) for a numpy array, list or polars Series."""
+    if pl is not None and isinstance(values, pl.Series):
+        return values.to_list(), True, values.name
+    return list(values), False, None
+
+
+def _from_array(values, is_polars, name):
+    if is_polars:
+        return pl.Series(name, values, dtype=pl.String)
+    return np.array(values, dtype=object)
+
+
+def to_bech32_many(prefix, hex_array):
+    """
+    Convert many 32-byte hex keys to Bech32 format at once.
+
+    Equivalent to [to_bech32(prefix, h) for h in hex_array], but the 8 -> 5 bit
+    regrouping and the checksum are computed on NumPy arrays for all keys.
+
+    Parameters:
+    - prefix (str): The prefix for the Bech32 encoding (e.g., 'npub', 'note').
+    - hex_array (np.ndarray | list | pl.Series): 64-character hex strings; None/null allowed.
+
+    Example:
+    >>> to_bech32_many('npub', ['7e7e9c42a91bfef19fa929e5fda1b72e0ebc1a4c1141673e2794234d86addf4e'])
+    array(['npub10elfcs4fr0l0r8af98jlmgdh9c8tcxjvz9qkw038js35mp4dma8qzvjptg'], dtype=object)
+
+    Returns:
+    - np.ndarray | pl.Series: Bech32 strings (None where the input is not a
+      64-character hex string); a polars Series when a Series is given.
+
+    Raises:
+    - None
+    """
+    values, is_polars, name = _to_array(hex_array)
+    valid = np.array([isinstance(v, str) and len(v) == 2 * KEY_BYTES for v in values], dtype=bool)
+    keys = np.zeros((len(values), KEY_BYTES), dtype=np.uint8)
+    rows = np.flatnonzero(valid)
+    try:
+        keys[rows] = np.frombuffer(bytes.fromhex(''.join(values[i] for i in rows)), dtype=np.uint8).reshape(-1, KEY_BYTES)
+    except ValueError:
+        for i in rows:
+            try:
+                keys[i] = np.frombuffer(bytes.fromhex(values[i]), dtype=np.uint8)
+            except ValueError:
+                valid[i] = False
+    bits = np.unpackbits(keys, axis=1)
+    bits = np.pad(bits, ((0, 0), (0, DATA_LEN * 5 - bits.shape[1])))
+    data = bits.reshape(len(values), DATA_LEN, 5) @ _BIT_WEIGHTS
+    data = data.astype(np.uint8)
+    padded = np.hstack([_with_hrp(prefix, data), np.zeros((len(values), CHECKSUM_LEN), dtype=np.uint8)])
+    mod = _polymod(padded) ^ 1
+    shifts = np.array([5 * (5 - i) for i in range(CHECKSUM_LEN)], dtype=np.uint32)
+    checksum = ((mod[:, None] >> shifts) & 31).astype(np.uint8)
+    chars = _CHARSET_BYTES[np.hstack([data, checksum])]
+    head = np.frombuffer((prefix + '1').encode(), dtype=np.uint8)
+    chars = np.hstack([np.broadcast_to(head, (len(values), len(head))), chars])
+    strings = np.ascontiguousarray(chars).view(f'S{chars.shape[1]}').ravel().astype(str)
+    result = [s if ok else None for s, ok in zip(strings.tolist(), valid)]
+    return _from_array(result, is_polars, name)
+
+
+def to_hex_many(bech32_array, prefix=None):
+    """
+    Convert many Bech32 strings encoding 32-byte keys to hex format at once.
+
+    Parameters:
+    - bech32_array (np.ndarray | list | pl.Series): Bech32 strings; None/null allowed.
+    - prefix (str, optional): Expected prefix; strings with another prefix are rejected.
+
+    Example:
+    >>> to_hex_many(['npub10elfcs4fr0l0r8af98jlmgdh9c8tcxjvz9qkw038js35mp4dma8qzvjptg'])
+    array(['7e7e9c42a91bfef19fa929e5fda1b72e0ebc1a4c1141673e2794234d86addf4e'], dtype=object)
+
+    Returns:
+    - np.ndarray | pl.Series: Hex strings (None where the input is not a valid
+      Bech32 32-byte key); a polars Series when a Series is given.
+
+    Raises:
+    - None
+    """
+    values, is_polars, name = _to_array(bech32_array)
+    result = [None] * len(values)
+    # Group by prefix, so that every group has the same string length
+    groups = {}
+    for i, v in enumerate(values):
+        if not isinstance(v, str) or (v.lower() != v and v.upper() != v):
+            continue
+        v = v.lower()
+        pos = v.rfind('1')
+        if pos < 1 or len(v) - pos - 1 != DATA_LEN + CHECKSUM_LEN:
+            continue
+        if prefix is not None and v[:pos] != prefix:
+            continue
+        groups.setdefault(v[:pos], []).append((i, v))
+    for hrp, items in groups.items():
+        rows = np.array([i for i, _ in items])
+        raw = np.frombuffer(''.join(v[len(hrp) + 1:] for _, v in items).encode('ascii', 'replace'), dtype=np.uint8)
+        data = _CHARSET_REV[raw].reshape(len(items), DATA_LEN + CHECKSUM_LEN)
+        ok = (data != 255).all(axis=1)
+        data = np.where(data == 255, 0, data).astype(np.uint8)
+        ok &= _polymod(_with_hrp(hrp, data)) == 1
+        payload = data[:, :DATA_LEN]
+        bits = ((payload[:, :, None] >> np.arange(4, -1, -1, dtype=np.uint8)) & 1).reshape(len(items), -1)
+        ok &= ~bits[:, KEY_BYTES * 8:].any(axis=1)
+        keys = np.packbits(bits[:, :KEY_BYTES * 8].astype(np.uint8), axis=1)
+        hexes = keys.tobytes().hex()
+        for j, row in enumerate(rows):
+            if ok[j]:
+                result[row] = hexes[j * 2 * KEY_BYTES:(j + 1) * 2 * KEY_BYTES]
+    return _from_array(result, is_polars, name)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from utils import to_bech32, to_hex
+    keys = [os.urandom(KEY_BYTES).hex() for _ in range(100000)]
+    start = time.perf_counter()
+    scalar = [to_bech32('npub', k) for k in keys]
+    scalar_time = time.perf_counter() - start
+    start = time.perf_counter()
+    bulk = to_bech32_many('npub', keys)
+    bulk_time = time.perf_counter() - start
+    assert list(bulk) == scalar
+    print(f"to_bech32: {len(keys) / scalar_time:,.0f} keys/s, to_bech32_many: {len(keys) / bulk_time:,.0f} keys/s")
+    start = time.perf_counter()
+    scalar_hex = [to_hex(b) for b in scalar]
+    scalar_time = time.perf_counter() - start
+    start = time.perf_counter()
+    bulk_hex = to_hex_many(scalar)
+    bulk_time = time.perf_counter() - start
+    assert list(bulk_hex) == scalar_hex == keys
+    print(f"to_hex: {len(keys) / scalar_time:,.0f} keys/s, to_hex_many: {len(keys) / bulk_time:,.0f} keys/s")
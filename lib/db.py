@@ -0,0 +1,350 @@
+import os
+import re
+import json
+import time
+import hashlib
+import decimal
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+from psycopg2.pool import ThreadedConnectionPool
+
+TOKEN_PATTERN = re.compile(r"""'(?:[^']|'')*'|"[^"]*"|[a-z_][\w$]*|\S""", re.IGNORECASE)
+# words that end a FROM list, and words that end a FROM item (so they are not taken for an alias)
+FROM_END_KEYWORDS = {
+    'where', 'group', 'having', 'window', 'order', 'limit', 'offset', 'fetch', 'for', 'union', 'intersect',
+    'except', 'returning', 'select', 'set', 'values',
+}
+CLAUSE_KEYWORDS = FROM_END_KEYWORDS | {
+    'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'on', 'using', 'tablesample', 'with',
+}
+DEFAULT_TTL = 3600
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize a SQL statement for use as a cache key.
+
+    Runs of whitespace outside string literals collapse to one space, and
+    leading/trailing whitespace and trailing semicolons are removed.
+
+    Parameters:
+    - sql: str, the SQL statement
+
+    Returns:
+    - str, the normalized statement
+    """
+    parts = sql.split("'")
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i])
+    return "'".join(parts).strip().rstrip(';').strip()
+
+
+def _closing_parenthesis(tokens: List[str], i: int) -> int:
+    """Return the index of the parenthesis closing the one at tokens[i]."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        depth += {'(': 1, ')': -1}.get(tokens[j], 0)
+        if depth == 0:
+            return j
+    return len(tokens)
+
+
+def _is_identifier(token: str) -> bool:
+    return re.match(r'[a-z_"]', token, re.IGNORECASE) is not None
+
+
+def _from_item(tokens: List[str], lower: List[str], i: int, names: List[str]):
+    """Parse the FROM item starting at tokens[i] into names; return the index after it and False if it may read other tables."""
+    while i < len(tokens) and lower[i] in ('lateral', 'only'):
+        i += 1
+    if i >= len(tokens):
+        return i, False
+    complete = True
+    if tokens[i] == '(':
+        # subquery, or parenthesized FROM list / join
+        end = _closing_parenthesis(tokens, i)
+        inner = tokens[i + 1:end]
+        if inner and lower[i + 1] not in ('select', 'with', 'values'):
+            inner = ['from'] + inner
+        complete = _scan_tables(inner, names)
+        i = end + 1
+    elif _is_identifier(tokens[i]):
+        name = tokens[i].replace('"', '').lower()
+        i += 1
+        while i + 1 < len(tokens) and tokens[i] == '.':
+            name += '.' + tokens[i + 1].replace('"', '').lower()
+            i += 2
+        if i < len(tokens) and tokens[i] == '(':
+            # set-returning function: it may read any table
+            complete = False
+            i = _closing_parenthesis(tokens, i) + 1
+        elif name not in names:
+            names.append(name)
+    else:
+        return i, False
+    if i < len(tokens) and lower[i] == 'as':
+        i += 1
+    if i < len(tokens) and _is_identifier(tokens[i]) and lower[i] not in CLAUSE_KEYWORDS:
+        i += 1
+        if i < len(tokens) and tokens[i] == '(':
+            i = _closing_parenthesis(tokens, i) + 1
+    return i, complete
+
+
+def _scan_tables(tokens: List[str], names: List[str]) -> bool:
+    """Append to names the relations of every FROM list and JOIN in tokens; return False if some may be missing."""
+    lower = [token.lower() for token in tokens]
+    complete = True
+    depth = 0
+    from_depth = None  # parenthesis depth of the FROM list being read, where a comma starts another item
+    i = 0
+    while i < len(tokens):
+        token = lower[i]
+        if token in ('from', 'join') or (token == ',' and from_depth == depth):
+            i, item_complete = _from_item(tokens, lower, i + 1, names)
+            complete &= item_complete
+            from_depth = depth
+            continue
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+            if from_depth is not None and depth < from_depth:
+                from_depth = None
+        elif token in FROM_END_KEYWORDS and from_depth == depth:
+            from_depth = None
+        i += 1
+    return complete
+
+
+def referenced_tables(sql: str):
+    """
+    Return the relation names read by sql and whether the list is known to be complete.
+
+    Every FROM list (comma-separated items, with optional aliases), JOIN
+    target and subquery is parsed. A function in a FROM item, or an item the
+    parser does not recognize, may read other tables, so the list is then
+    reported as incomplete.
+
+    Parameters:
+    - sql: str, the SQL statement
+
+    Example:
+    >>> referenced_tables("SELECT * FROM events e, events_relays er WHERE e.id = er.event_id")
+    (['events', 'events_relays'], True)
+
+    Returns:
+    - tuple, (list of names lower-cased and without quotes, bool complete)
+    """
+    tokens = [token for token in TOKEN_PATTERN.findall(normalize_sql(sql)) if not token.startswith("'")]
+    names = []
+    complete = _scan_tables(tokens, names)
+    return names, complete
+
+
+def cache_key(sql: str, params=None) -> str:
+    """Return the hex sha256 of the normalized sql and its JSON-encoded parameters."""
+    payload = json.dumps([normalize_sql(sql), params], default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _to_arrow(columns: List[str], rows: list):
+    """Build an Arrow table from DB rows; dict and list values are stored as JSON strings."""
+    arrays = []
+    json_columns = []
+    for i, name in enumerate(columns):
+        values = [row[i] for row in rows]
+        if any(isinstance(v, (dict, list)) for v in values):
+            values = [None if v is None else json.dumps(v) for v in values]
+            json_columns.append(name)
+        elif any(isinstance(v, (decimal.Decimal, memoryview)) for v in values):
+            values = [float(v) if isinstance(v, decimal.Decimal) else bytes(v) if isinstance(v, memoryview) else v
+                      for v in values]
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if v is None else str(v) for v in values]))
+    return pa.Table.from_arrays(arrays, names=columns), json_columns
+
+
+def _to_pandas(table, json_columns: Sequence[str]) -> pd.DataFrame:
+    df = table.to_pandas()
+    for name in json_columns:
+        df[name] = [None if v is None else json.loads(v) for v in table.column(name).to_pylist()]
+    return df
+
+
+class Database:
+    """
+    Class to represent a pooled connection to the bigbrotr database with a local query result cache.
+
+    Results of query() are stored as Arrow (feather, zstd) files keyed by the
+    normalized SQL and its parameters. Every entry records a change stamp of
+    the tables it reads, taken from pg_stat_user_tables (n_tup_ins,
+    n_tup_upd, n_tup_del and the relation file node, which changes on
+    TRUNCATE), so an entry is served again as long as its tables have not
+    changed. Queries that read no user table (e.g. information_schema), or
+    whose tables cannot all be parsed, are also bounded by ttl seconds.
+
+    Attributes:
+    - pool: ThreadedConnectionPool, the connection pool
+    - cache_folder: Optional[str], folder of the cached results (None disables the cache)
+
+    Methods:
+    - connection() -> Iterator[connection]: borrow a connection from the pool
+    - execute(sql: str, params) -> tuple: run a statement without cache, return (columns, rows)
+    - table_stamps(tables: Sequence[str]) -> dict: change stamp of every user table in tables
+    - query(sql: str, params, tables, ttl, refresh) -> pd.DataFrame: run a query through the cache
+    - clear_cache() -> int: delete all cached results
+    - close() -> None: close all connections
+    """
+
+    def __init__(self, minconn: int = 1, maxconn: int = 8, cache_folder: Optional[str] = None, **connect_kwargs) -> None:
+        self.pool = ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self.cache_folder = cache_folder
+        if cache_folder is not None:
+            os.makedirs(cache_folder, exist_ok=True)
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def execute(self, sql: str, params=None):
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description is None:
+                return [], []
+            return [column.name for column in cursor.description], cursor.fetchall()
+
+    def table_stamps(self, tables: Sequence[str]) -> Dict[str, list]:
+        """
+        Return the change stamp of every user table in tables (others are ignored).
+
+        Parameters:
+        - tables: Sequence[str], table names, optionally schema-qualified (public by default)
+
+        Returns:
+        - dict, 'schema.table' -> [n_tup_ins, n_tup_upd, n_tup_del, relfilenode]
+        """
+        names = [name if '.' in name else 'public.' + name for name in tables]
+        if not names:
+            return {}
+        _, rows = self.execute("""
+            SELECT schemaname || '.' || relname, n_tup_ins, n_tup_upd, n_tup_del, pg_relation_filenode(relid)
+            FROM pg_stat_user_tables
+            WHERE schemaname || '.' || relname = ANY(%s)
+        """, (names,))
+        return {row[0]: [int(v or 0) for v in row[1:]] for row in rows}
+
+    def _paths(self, key: str):
+        return os.path.join(self.cache_folder, key + '.arrow'), os.path.join(self.cache_folder, key + '.json')
+
+    def query(self, sql: str, params=None, tables: Optional[Sequence[str]] = None, ttl: Optional[float] = None, refresh: bool = False) -> pd.DataFrame:
+        """
+        Run a query, serving it from the local cache when the tables it reads have not changed.
+
+        Parameters:
+        - sql: str, the query
+        - params: optional query parameters (psycopg2 style)
+        - tables: Optional[Sequence[str]], tables the query depends on (parsed from FROM/JOIN if None)
+        - ttl: Optional[float], maximum age in seconds of a cached result (DEFAULT_TTL when no user table is read or the
+          parsed tables may be incomplete, unlimited otherwise)
+        - refresh: bool, ignore the cached result
+
+        Example:
+        >>> db = get_database()
+        >>> relays = db.query("SELECT url, network FROM relays")
+
+        Returns:
+        - pd.DataFrame, the result (JSON columns are decoded to Python objects)
+
+        Raises:
+        - psycopg2.Error: if the query fails
+        """
+        if self.cache_folder is None:
+            return _to_pandas(*_to_arrow(*self.execute(sql, params)))
+        complete = True
+        if tables is None:
+            tables, complete = referenced_tables(sql)
+        stamps = self.table_stamps(tables)
+        if ttl is None and (not stamps or not complete):
+            ttl = DEFAULT_TTL
+        key = cache_key(sql, params)
+        data_path, meta_path = self._paths(key)
+        if not refresh and os.path.exists(meta_path) and os.path.exists(data_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            fresh = ttl is None or time.time() - meta['created_at'] <= ttl
+            if fresh and meta['stamps'] == stamps:
+                return _to_pandas(feather.read_table(data_path), meta['json_columns'])
+        table, json_columns = _to_arrow(*self.execute(sql, params))
+        feather.write_feather(table, data_path + '.tmp', compression='zstd')
+        os.replace(data_path + '.tmp', data_path)
+        meta = {'sql': normalize_sql(sql), 'stamps': stamps, 'json_columns': json_columns, 'created_at': time.time()}
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        return _to_pandas(table, json_columns)
+
+    def clear_cache(self) -> int:
+        if self.cache_folder is None:
+            return 0
+        removed = 0
+        for name in os.listdir(self.cache_folder):
+            if name.endswith(('.arrow', '.json')):
+                os.remove(os.path.join(self.cache_folder, name))
+                removed += 1
+        return removed
+
+    def close(self) -> None:
+        self.pool.closeall()
+
+    def __enter__(self) -> "Database":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> Database:
+    """
+    Return the process-wide Database built from the .env settings.
+
+    The cache folder is DB_CACHE_FOLDER, or .db_cache inside DATA_FOLDER.
+
+    Returns:
+    - Database, the shared instance
+    """
+    global _database
+    with _database_lock:
+        if _database is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+            cache_folder = os.getenv("DB_CACHE_FOLDER")
+            if cache_folder is None and os.getenv("DATA_FOLDER"):
+                cache_folder = os.path.join(os.getenv("DATA_FOLDER"), '.db_cache')
+            _database = Database(
+                cache_folder=cache_folder,
+                host=os.getenv("DB_HOST"),
+                port=os.getenv("DB_PORT"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                dbname=os.getenv("DB_NAME")
+            )
+        return _database
@@ -0,0 +1,267 @@
+import math
+import numpy as np
+from typing import Optional, Tuple
+
+CHUNK = 1 << 22
+LINEAR_BINS = 1 << 16
+
+
+def _as_array(data) -> np.ndarray:
+    """Return a 1-D numpy view of a numpy array, list, pandas or polars Series, without NaN."""
+    if hasattr(data, "to_numpy"):
+        data = data.to_numpy()
+    data = np.asarray(data).ravel()
+    if data.dtype == bool:
+        data = data.astype(np.int8)
+    if data.dtype.kind == "f":
+        data = data[~np.isnan(data)]
+    elif data.dtype.kind not in "iu":
+        data = data.astype(np.float64)
+        data = data[~np.isnan(data)]
+    return data
+
+
+class EcdfSketch:
+    """
+    Class to represent a mergeable log-binned histogram with bounded relative error.
+
+    Positive and negative values fall in the buckets (gamma^(k-1), gamma^k]
+    with gamma = (1 + a) / (1 - a), so every quantile is returned within a
+    relative error a of the exact one, whatever the number of values (the
+    DDSketch construction). Zeros are counted apart.
+
+    Attributes:
+    - relative_accuracy: float, relative error a of the quantiles
+    - count: int, number of values added
+
+    Methods:
+    - update(data) -> EcdfSketch: add values (numpy array, list, pandas or polars Series)
+    - merge(other: EcdfSketch) -> EcdfSketch: add the counts of another sketch
+    - quantile(q: float) -> float: value at quantile q
+    - knots() -> Tuple[np.ndarray, np.ndarray]: bucket upper bounds and cumulative fractions
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be in (0, 1), not {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zeros = 0
+        self.count = 0
+        self._stores = {1: [None, 0], -1: [None, 0]}  # sign -> [counts, offset of counts[0]]
+
+    def _add(self, sign: int, keys: np.ndarray, counts: Optional[np.ndarray] = None, offset: Optional[int] = None) -> None:
+        if counts is None:
+            if len(keys) == 0:
+                return
+            offset = int(keys.min())
+            counts = np.bincount(keys - offset)
+        store = self._stores[sign]
+        if store[0] is None:
+            store[0], store[1] = counts.astype(np.int64), offset
+            return
+        low = min(store[1], offset)
+        high = max(store[1] + len(store[0]), offset + len(counts))
+        merged = np.zeros(high - low, dtype=np.int64)
+        merged[store[1] - low:store[1] - low + len(store[0])] += store[0]
+        merged[offset - low:offset - low + len(counts)] += counts
+        store[0], store[1] = merged, low
+
+    def update(self, data) -> "EcdfSketch":
+        data = _as_array(data)
+        for start in range(0, len(data), CHUNK):
+            chunk = data[start:start + CHUNK]
+            if len(chunk) and chunk.min() > 0:
+                self._add(1, self._keys(chunk))
+            else:
+                self.zeros += int(np.count_nonzero(chunk == 0))
+                self._add(1, self._keys(chunk[chunk > 0]))
+                self._add(-1, self._keys(-chunk[chunk < 0]))
+            self.count += len(chunk)
+        return self
+
+    def _keys(self, values: np.ndarray) -> np.ndarray:
+        logs = np.log(values, dtype=np.float64)
+        logs *= 1 / self._log_gamma
+        return np.ceil(logs, out=logs).astype(np.int64)
+
+    def merge(self, other: "EcdfSketch") -> "EcdfSketch":
+        if other.gamma != self.gamma:
+            raise ValueError("sketches with different relative accuracy cannot be merged")
+        for sign in (1, -1):
+            counts, offset = other._stores[sign]
+            if counts is not None:
+                self._add(sign, None, counts, offset)
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def _buckets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (upper bound, representative value, count) of every non empty bucket, in increasing order."""
+        uppers, values, counts = [], [], []
+        neg, neg_offset = self._stores[-1]
+        if neg is not None:
+            keys = np.arange(neg_offset, neg_offset + len(neg))[::-1]
+            uppers.append(-self.gamma ** (keys - 1))
+            values.append(-2 * self.gamma ** keys / (self.gamma + 1))
+            counts.append(neg[::-1])
+        if self.zeros:
+            uppers.append(np.zeros(1))
+            values.append(np.zeros(1))
+            counts.append(np.array([self.zeros]))
+        pos, pos_offset = self._stores[1]
+        if pos is not None:
+            keys = np.arange(pos_offset, pos_offset + len(pos))
+            uppers.append(self.gamma ** keys)
+            values.append(2 * self.gamma ** keys / (self.gamma + 1))
+            counts.append(pos)
+        if not counts:
+            return np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64)
+        uppers, values, counts = np.concatenate(uppers), np.concatenate(values), np.concatenate(counts)
+        keep = counts > 0
+        return uppers[keep], values[keep], counts[keep]
+
+    def quantile(self, q: float) -> float:
+        """
+        Return the value at quantile q, within the relative accuracy of the sketch.
+
+        Parameters:
+        - q: float, quantile in [0, 1]
+
+        Returns:
+        - float, the quantile (nan if the sketch is empty)
+
+        Raises:
+        - ValueError: if q is not in [0, 1]
+        """
+        if not 0 <= q <= 1:
+            raise ValueError(f"q must be in [0, 1], not {q}")
+        _, values, counts = self._buckets()
+        if len(counts) == 0:
+            return float("nan")
+        rank = q * (self.count - 1)
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side="right")])
+
+    def knots(self) -> Tuple[np.ndarray, np.ndarray]:
+        uppers, _, counts = self._buckets()
+        return uppers, np.cumsum(counts) / max(self.count, 1)
+
+
+def _linear_knots(data: np.ndarray, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact CDF at the upper bounds of equal-width right-closed bins (width 1 for small integer ranges)."""
+    low, high = data.min(), data.max()
+    width = (float(high) - float(low)) / bins
+    if data.dtype.kind in "iu":
+        width = max(1.0, math.ceil(width))
+    elif width == 0:
+        width = 1.0
+    n_bins = int(math.ceil((float(high) - float(low)) / width)) + 1
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for start in range(0, len(data), CHUNK):
+        chunk = data[start:start + CHUNK].astype(np.float64) - float(low)
+        keys = np.minimum(np.ceil(chunk / width).astype(np.int64), n_bins - 1)
+        counts += np.bincount(keys, minlength=n_bins)
+    uppers = float(low) + np.arange(n_bins) * width
+    keep = counts > 0
+    return uppers[keep], np.cumsum(counts)[keep] / len(data)
+
+
+def _thin(x: np.ndarray, y: np.ndarray, max_points: int, lower: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the knots with y >= lower where the CDF crosses a multiple of (1 - lower) / max_points."""
+    start = np.searchsorted(y, lower, side="left")
+    x, y = x[start:], y[start:]
+    if len(x) <= max_points:
+        return x, y
+    step = (1.0 - lower) / max_points
+    levels = np.floor((y - lower) / step).astype(np.int64)
+    keep = np.r_[True, levels[1:] != levels[:-1]]
+    keep[-1] = True
+    return x[keep], y[keep]
+
+
+def ecdf(
+    data,
+    max_points: int = 2000,
+    scale: str = "auto",
+    relative_accuracy: float = 0.005,
+    lower: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the knots of an empirical CDF without sorting the data.
+
+    Values are counted in right-closed bins in one pass, so every knot
+    (x, y) is exact (y is the fraction of values <= x). With scale 'log' the
+    bins are the EcdfSketch buckets (x is off by at most relative_accuracy
+    between knots), with 'linear' they have equal width (width 1 for integer
+    data with a small range, i.e. exact). Knots are then thinned so that y
+    grows by at most (1 - lower) / max_points between two of them.
+
+    Parameters:
+    - data: numpy array, list, pandas or polars Series (NaN are dropped)
+    - max_points: int, approximate maximum number of knots
+    - scale: str, 'log', 'linear' or 'auto' (log for non negative data spanning more than 3 decades)
+    - relative_accuracy: float, bucket relative width of the log scale
+    - lower: float, only return knots with y >= lower (tail zoom, e.g. 0.99)
+
+    Example:
+    >>> x, y = ecdf(events_per_pubkey)
+    >>> plt.step(x, y, where="post")
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray], knot values and cumulative fractions
+
+    Raises:
+    - ValueError: if scale is not 'log', 'linear' or 'auto', or lower is not in [0, 1)
+    """
+    if scale not in ("log", "linear", "auto"):
+        raise ValueError(f"scale must be 'log', 'linear' or 'auto', not {scale}")
+    if not 0 <= lower < 1:
+        raise ValueError(f"lower must be in [0, 1), not {lower}")
+    data = _as_array(data)
+    if len(data) == 0:
+        return np.zeros(0), np.zeros(0)
+    if scale == "auto":
+        low, high = data.min(), data.max()
+        smallest = np.min(data, where=data > 0, initial=high) if low <= 0 else low
+        scale = "log" if low >= 0 and high > 0 and high / smallest > 1e3 else "linear"
+    if scale == "log":
+        x, y = EcdfSketch(relative_accuracy).update(data).knots()
+    else:
+        x, y = _linear_knots(data, max(LINEAR_BINS, 16 * max_points))
+    return _thin(x, y, max_points, lower)
+
+
+def plot_cdf(data, label: Optional[str] = None, ax=None, complementary: bool = False, **kwargs):
+    """
+    Plot the ECDF (or CCDF) of data as a step line from at most about max_points knots.
+
+    Parameters:
+    - data: numpy array, list, pandas or polars Series
+    - label: Optional[str], legend label
+    - ax: Optional[matplotlib.axes.Axes], axes to draw on (current axes if None)
+    - complementary: bool, plot 1 - CDF (for log-log tail plots)
+    - kwargs: arguments of ecdf (max_points, scale, relative_accuracy, lower)
+
+    Returns:
+    - list, the matplotlib lines
+    """
+    import matplotlib.pyplot as plt
+    ax = ax if ax is not None else plt.gca()
+    x, y = ecdf(data, **kwargs)
+    if complementary:
+        return ax.step(x, 1 - y, where="pre", label=label)
+    return ax.step(x, y, where="post", label=label)
+
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(0)
+    data = rng.lognormal(3, 2, 10_000_000)
+    start = time.perf_counter()
+    x, y = ecdf(data)
+    elapsed = time.perf_counter() - start
+    exact = np.sort(data)
+    error = np.abs(np.searchsorted(exact, x, side="right") / len(exact) - y).max()
+    print(f"{len(data)} values -> {len(x)} knots in {elapsed:.2f}s "
+          f"(np.sort: {time.perf_counter() - start - elapsed:.2f}s), max knot error {error:.2e}")
@@ -1,5 +1,7 @@
-from typing import List
+from typing import List, Optional
 from utils import calc_event_id, verify_sig
+from verified_cache import VerifiedCache
+from profiling import profiled, section
 import json
 
 
@@ -17,13 +19,14 @@ class Event:
     - sig: str, signature of the event
 
     Methods:
-    - __init__(id: str, pubkey: str, created_at: int, kind: int, tags: List[List[str]], content: str, sig: str) -> None: initialize the Event object
+    - __init__(id: str, pubkey: str, created_at: int, kind: int, tags: List[List[str]], content: str, sig: str, verified_cache: Optional[VerifiedCache] = None) -> None: initialize the Event object
     - __repr__() -> str: return the string representation of the Event object
-    - from_dict(data: dict) -> Event: create an Event object from a dictionary
+    - from_dict(data: dict, verified_cache: Optional[VerifiedCache] = None) -> Event: create an Event object from a dictionary
     - to_dict() -> dict: return the Event object as a dictionary
     """
 
-    def __init__(self, id: str, pubkey: str, created_at: int, kind: int, tags: List[List[str]], content: str, sig: str) -> "Event":
+    @profiled()
+    def __init__(self, id: str, pubkey: str, created_at: int, kind: int, tags: List[List[str]], content: str, sig: str, verified_cache: Optional[VerifiedCache] = None) -> "Event":
         """
         Initialize an Event object.
 
@@ -35,6 +38,7 @@ class Event:
         - tags: List[List[str]], tags of the event
         - content: str, content of the event
         - sig: str, signature of the event
+        - verified_cache: Optional[VerifiedCache], cache of already verified (id, sig) pairs; the signature check is skipped for cached pairs and successful checks are added to it
 
         Example:
         >>> id = "0x123"
@@ -57,6 +61,7 @@ class Event:
         - TypeError: if tags is not a list of lists of str
         - TypeError: if content is not a str
         - TypeError: if sig is not a str
+        - TypeError: if verified_cache is not a VerifiedCache or None
         - ValueError: if kind is not between 0 and 65535
         - ValueError: if the event id is invalid
         - ValueError: if the event signature is invalid
@@ -83,6 +88,9 @@ class Event:
             raise TypeError(f"content must be a str, not {type(content)}")
         if not isinstance(sig, str):
             raise TypeError(f"sig must be a str, not {type(sig)}")
+        if verified_cache is not None and not isinstance(verified_cache, VerifiedCache):
+            raise TypeError(
+                f"verified_cache must be a VerifiedCache or None, not {type(verified_cache)}")
         if kind < 0 or kind > 65535:
             raise ValueError(f"kind must be between 0 and 65535, not {kind}")
         if created_at < 0:
@@ -96,14 +104,18 @@ class Event:
         if len(sig) != 128:
             raise ValueError(
                 f"sig must be 128 characters long, not {len(sig)}")
-        if "\\u0000" in json.dumps(tags):
-            raise ValueError("tags cannot contain null characters")
-        if "\\u0000" in json.dumps(content):
-            raise ValueError("content cannot contain null characters")
+        with section('Event.null_check'):
+            if "\\u0000" in json.dumps(tags):
+                raise ValueError("tags cannot contain null characters")
+            if "\\u0000" in json.dumps(content):
+                raise ValueError("content cannot contain null characters")
         if calc_event_id(pubkey, created_at, kind, tags, content) != id:
             raise ValueError(f"Invalid event id: {id}")
-        if verify_sig(id, pubkey, sig) != True:
-            raise ValueError(f"Invalid event signature: {sig}")
+        if verified_cache is None or not verified_cache.contains(id, sig):
+            if verify_sig(id, pubkey, sig) != True:
+                raise ValueError(f"Invalid event signature: {sig}")
+            if verified_cache is not None:
+                verified_cache.add(id, sig)
         self.id = id
         self.pubkey = pubkey
         self.created_at = created_at
@@ -134,12 +146,13 @@ class Event:
         return f"Event(id={self.id}, pubkey={self.pubkey}, created_at={self.created_at}, kind={self.kind}, tags={self.tags}, content={self.content}, sig={self.sig})"
 
     @staticmethod
-    def from_dict(data: dict) -> "Event":
+    def from_dict(data: dict, verified_cache: Optional[VerifiedCache] = None) -> "Event":
         """
         Create an Event object from a dictionary.
 
         Parameters:
         - data: dict, dictionary representation of the Event object
+        - verified_cache: Optional[VerifiedCache], cache of already verified (id, sig) pairs
 
         Example:
         >>> data = {"id": "0x123", "pubkey": "0x123", "created_at": 1612137600, "kind": 0, "tags": [["tag1", "tag2"]], "content": "content", "sig": "0x123"}
@@ -158,7 +171,7 @@ class Event:
         for key in ["id", "pubkey", "created_at", "kind", "tags", "content", "sig"]:
             if key not in data:
                 raise KeyError(f"data must contain key {key}")
-        return Event(data["id"], data["pubkey"], data["created_at"], data["kind"], data["tags"], data["content"], data["sig"])
+        return Event(data["id"], data["pubkey"], data["created_at"], data["kind"], data["tags"], data["content"], data["sig"], verified_cache)
 
     def to_dict(self) -> dict:
         """
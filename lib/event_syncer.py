@@ -0,0 +1,368 @@
+import io
+import os
+import csv
+import json
+import time
+import uuid
+import asyncio
+import aiohttp
+from typing import Callable, Iterable, List, Optional
+from event import Event
+from relay import Relay
+from verified_cache import VerifiedCache
+
+
+class SyncStats:
+    """
+    Class to represent the counters of a sync run.
+
+    Attributes:
+    - received: int, number of EVENT messages received
+    - duplicates: int, number of events already seen from another relay (or page)
+    - invalid: int, number of events rejected by validation
+    - new_events: int, number of distinct valid events
+    - rows: int, number of (event_id, relay_url, seen_at) rows emitted
+    - relay_errors: dict, error message per relay url that failed
+    - started_at: float, time.perf_counter() at creation
+
+    Methods:
+    - events_per_second() -> float: received events per second
+    - to_dict() -> dict: return the counters as a dictionary
+    """
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.new_events = 0
+        self.rows = 0
+        self.relay_errors = {}
+        self.started_at = time.perf_counter()
+
+    def events_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started_at
+        return self.received / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "new_events": self.new_events,
+            "rows": self.rows,
+            "relay_errors": dict(self.relay_errors),
+            "events_per_second": self.events_per_second(),
+        }
+
+    def __repr__(self) -> str:
+        return f"SyncStats({self.to_dict()})"
+
+
+class PostgresSink:
+    """
+    Bulk writer of synced events into the events and events_relays tables.
+
+    Every batch is COPied into temporary tables and moved with
+    INSERT ... ON CONFLICT DO NOTHING, in one transaction.
+    """
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        with conn.cursor() as cur:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS sync_events (LIKE events INCLUDING DEFAULTS)")
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS sync_events_relays (LIKE events_relays INCLUDING DEFAULTS)")
+        conn.commit()
+
+    @staticmethod
+    def _copy(cur, table: str, columns: List[str], rows: Iterable[tuple]) -> None:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH CSV", buf)
+
+    def __call__(self, events: List[Event], rows: List[tuple]) -> None:
+        with self.conn.cursor() as cur:
+            event_columns = ["id", "pubkey", "created_at", "kind", "tags", "content", "sig"]
+            self._copy(cur, "sync_events", event_columns, (
+                (e.id, e.pubkey, e.created_at, e.kind, json.dumps(e.tags), e.content, e.sig) for e in events))
+            self._copy(cur, "sync_events_relays", ["event_id", "relay_url", "seen_at"], rows)
+            cur.execute(f"""
+                INSERT INTO events ({', '.join(event_columns)})
+                SELECT {', '.join(event_columns)} FROM sync_events
+                ON CONFLICT DO NOTHING;
+                INSERT INTO events_relays (event_id, relay_url, seen_at)
+                SELECT event_id, relay_url, seen_at FROM sync_events_relays
+                ON CONFLICT DO NOTHING;
+                TRUNCATE sync_events, sync_events_relays;
+            """)
+        self.conn.commit()
+
+
+class CsvSink:
+    """
+    Append synced events_relays rows (and events) to csv files in a folder, for offline runs and benchmarks.
+
+    The files have the header and columns of the ones written by generate_data.py,
+    so they can be read by its stages.
+    """
+
+    def __init__(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+
+    def _append(self, name: str, header: List[str], rows: Iterable[tuple]) -> None:
+        path = os.path.join(self.folder, name)
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(header)
+            writer.writerows(rows)
+
+    def __call__(self, events: List[Event], rows: List[tuple]) -> None:
+        self._append("events.csv", ["id", "pubkey", "created_at", "kind"],
+                     ((e.id, e.pubkey, e.created_at, e.kind) for e in events))
+        self._append("events_relays.csv", ["event_id", "relay_url", "seen_at"], rows)
+
+
+class EventSyncer:
+    """
+    Class to download events from many relays at once and feed events_relays.
+
+    Every relay is paged backwards in time with REQ filters bounded by
+    since/until. Incoming events are deduplicated by id in memory, so each
+    distinct valid event is validated once, while one (event_id, relay_url, seen_at)
+    row is emitted per relay that served it. Only successful validations are
+    remembered: a copy failing validation (e.g. tampered content under a
+    genuine id) must not make the genuine copies of that id count as duplicates.
+    Validation runs in a worker thread, so signature checks do not stall the
+    websockets of the other relays. Rows are handed to the sink in batches by
+    a single writer task running in a thread, and stamped with seen_at when
+    their batch is written.
+
+    Backpressure: each relay coroutine stops reading its socket while the
+    bounded writer queue is full, so slow sinks slow down readers instead of
+    growing memory.
+
+    Attributes:
+    - sink: Callable[[List[Event], List[tuple]], None], bulk writer (e.g. PostgresSink)
+    - filters: dict, base NIP-01 filter (e.g. {"kinds": [1]})
+    - page_size: int, limit of every REQ
+    - batch_size: int, number of rows per sink call
+    - concurrency: int, maximum number of relays synced at the same time
+    - timeout: float, seconds to wait for a relay message
+    - scheme: str, 'wss' or 'ws' (plain, for local stand-in relays)
+    - verified_cache: Optional[VerifiedCache], cache of verified (id, sig) pairs
+    - stats: SyncStats, counters of the run
+
+    Methods:
+    - run(relays: Iterable[Relay], since: int, until: int) -> SyncStats: sync all relays
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[List[Event], List[tuple]], None],
+        filters: Optional[dict] = None,
+        page_size: int = 500,
+        batch_size: int = 10000,
+        concurrency: int = 100,
+        timeout: float = 30,
+        scheme: str = "wss",
+        max_pending_batches: int = 4,
+        verified_cache: Optional[VerifiedCache] = None
+    ) -> None:
+        if page_size <= 0 or batch_size <= 0 or concurrency <= 0:
+            raise ValueError("page_size, batch_size and concurrency must be positive")
+        if scheme not in ("ws", "wss"):
+            raise ValueError(f"scheme must be 'ws' or 'wss', not {scheme}")
+        self.sink = sink
+        self.filters = dict(filters or {})
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.scheme = scheme
+        self.max_pending_batches = max_pending_batches
+        self.verified_cache = verified_cache
+        self.stats = SyncStats()
+        self._seen = set()
+        self._events = []
+        self._rows = []
+
+    def _validate(self, batch: List[dict]) -> List[Optional[Event]]:
+        """Build the Event of every dictionary of batch, or None if it is invalid (runs in a worker thread)."""
+        events = []
+        for data in batch:
+            try:
+                events.append(Event.from_dict(data, self.verified_cache))
+            except (TypeError, KeyError, ValueError):
+                events.append(None)
+        return events
+
+    async def _accept(self, relay: Relay, batch: List[dict], queue: asyncio.Queue) -> None:
+        """Deduplicate and validate incoming events of a relay, buffer their rows and flush full batches."""
+        self.stats.received += len(batch)
+        keyed = []
+        for data in batch:
+            try:
+                keyed.append((bytes.fromhex(data["id"]), data))
+            except (KeyError, TypeError, ValueError):
+                self.stats.invalid += 1
+        pending = [key not in self._seen for key, _ in keyed]
+        # signature checks run off the event loop, one batch at a time (the verified cache is not thread-safe)
+        async with self._validation_lock:
+            checked = iter(await asyncio.to_thread(
+                self._validate, [data for (_, data), new in zip(keyed, pending) if new]))
+        for (key, data), new in zip(keyed, pending):
+            event = next(checked) if new else None
+            if key in self._seen:
+                self.stats.duplicates += 1
+            elif event is None:
+                # not cached: the id is only claimed by the payload
+                self.stats.invalid += 1
+                continue
+            else:
+                self._seen.add(key)
+                self._events.append(event)
+                self.stats.new_events += 1
+            self._rows.append((data["id"], relay.url))
+            self.stats.rows += 1
+        await self._flush(queue)
+
+    async def _flush(self, queue: asyncio.Queue, force: bool = False) -> None:
+        if len(self._rows) >= self.batch_size or (force and self._rows):
+            events, rows = self._events, self._rows
+            self._events, self._rows = [], []
+            await queue.put((events, rows))
+
+    async def _sync_relay(self, session: aiohttp.ClientSession, relay: Relay, since: int, until: int, queue: asyncio.Queue) -> None:
+        url = self.scheme + "://" + relay.url.removeprefix("wss://")
+        async with session.ws_connect(url, heartbeat=None, max_msg_size=0) as ws:
+            boundary = set()
+            while until >= since:
+                sub_id = uuid.uuid4().hex
+                flt = dict(self.filters, since=since, until=until, limit=self.page_size)
+                await ws.send_str(json.dumps(["REQ", sub_id, flt]))
+                count = 0
+                oldest = None
+                page = []
+                received = []
+                try:
+                    while True:
+                        msg = await asyncio.wait_for(ws.receive(), self.timeout)
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                return
+                            continue
+                        message = json.loads(msg.data)
+                        if not isinstance(message, list) or len(message) < 2 or message[1] != sub_id:
+                            continue
+                        if message[0] == "EVENT" and len(message) >= 3 and isinstance(message[2], dict):
+                            count += 1
+                            created_at = message[2].get("created_at")
+                            if isinstance(created_at, int):
+                                oldest = created_at if oldest is None else min(oldest, created_at)
+                                page.append((created_at, message[2].get("id")))
+                            if message[2].get("id") in boundary:
+                                continue
+                            received.append(message[2])
+                            if len(received) >= self.page_size:
+                                await self._accept(relay, received, queue)
+                                received = []
+                        elif message[0] in ("EOSE", "CLOSED"):
+                            break
+                finally:
+                    # the events received before a timeout or a closed socket are kept
+                    if received:
+                        await self._accept(relay, received, queue)
+                await ws.send_str(json.dumps(["CLOSE", sub_id]))
+                if count < self.page_size or oldest is None:
+                    return
+                # A full page: continue from its oldest timestamp. Events at
+                # that same second may be cut, so it is re-requested (skipping
+                # the ids already received) unless the whole page had that
+                # timestamp.
+                if oldest < until:
+                    boundary = {event_id for created_at, event_id in page if created_at == oldest}
+                    until = oldest
+                else:
+                    boundary = set()
+                    until = oldest - 1
+
+    async def _writer(self, queue: asyncio.Queue) -> None:
+        while (item := await queue.get()) is not None:
+            events, rows = item
+            # seen_at is the time the batch is written, not the time its first event arrived,
+            # so a row is never committed long after rows with a later seen_at
+            seen_at = int(time.time())
+            await asyncio.to_thread(self.sink, events, [(event_id, relay_url, seen_at) for event_id, relay_url in rows])
+
+    async def run_async(self, relays: Iterable[Relay], since: int = 0, until: Optional[int] = None) -> SyncStats:
+        until = int(time.time()) if until is None else until
+        queue = asyncio.Queue(maxsize=self.max_pending_batches)
+        self._validation_lock = asyncio.Lock()
+        writer = asyncio.create_task(self._writer(queue))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(session, relay):
+            async with semaphore:
+                try:
+                    await self._sync_relay(session, relay, since, until, queue)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, OSError) as e:
+                    self.stats.relay_errors[relay.url] = f"{type(e).__name__}: {e}"
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(guarded(session, relay) for relay in relays))
+        await self._flush(queue, force=True)
+        await queue.put(None)
+        await writer
+        return self.stats
+
+    def run(self, relays: Iterable[Relay], since: int = 0, until: Optional[int] = None) -> SyncStats:
+        """
+        Sync the events published between since and until from all relays.
+
+        Parameters:
+        - relays: Iterable[Relay], relays to sync
+        - since: int, oldest created_at to fetch
+        - until: Optional[int], newest created_at to fetch (now if None)
+
+        Example:
+        >>> syncer = EventSyncer(PostgresSink(bigbrotr), filters={"kinds": [1]})
+        >>> syncer.run(relays, since=1700000000)
+
+        Returns:
+        - SyncStats, counters of the run
+
+        Raises:
+        - None
+        """
+        return asyncio.run(self.run_async(relays, since, until))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync events from relays into events_relays.")
+    parser.add_argument("relays", nargs="+", help="relay urls")
+    parser.add_argument("--since", type=int, default=0)
+    parser.add_argument("--until", type=int, default=None)
+    parser.add_argument("--scheme", default="wss", choices=["ws", "wss"])
+    parser.add_argument("--csv", help="write csv files to this folder instead of Postgres")
+    args = parser.parse_args()
+    if args.csv:
+        sink = CsvSink(args.csv)
+    else:
+        import psycopg2
+        from dotenv import load_dotenv
+        load_dotenv()
+        sink = PostgresSink(psycopg2.connect(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            dbname=os.getenv("DB_NAME")
+        ))
+    syncer = EventSyncer(sink, scheme=args.scheme)
+    stats = syncer.run([Relay(url) for url in args.relays], args.since, args.until)
+    print(json.dumps(stats.to_dict(), indent=2))
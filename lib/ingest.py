@@ -0,0 +1,274 @@
+import io
+import os
+import gzip
+import json
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, List, Optional
+from event import Event
+from utils import sanitize
+from profiling import failure_reason, drain, merge, reset, is_enabled
+from verified_cache import VerifiedCache
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # fall back to the standard library parser
+    _loads = json.loads
+
+NULL_ESCAPE = b'\\u0000'
+
+
+class IngestStats:
+    """
+    Class to represent the counters of an ingestion run.
+
+    Attributes:
+    - lines: int, number of non empty lines read
+    - parse_errors: int, number of lines that are not valid JSON events
+    - sanitized: int, number of events that contained null characters
+    - accepted: int, number of valid events
+    - rejected: Counter, number of invalid events per rejection reason
+    - started_at: float, time.perf_counter() at creation
+
+    Methods:
+    - elapsed() -> float: seconds since creation
+    - rows_per_second() -> float: lines read per second
+    - to_dict() -> dict: return the counters as a dictionary
+    """
+
+    def __init__(self) -> None:
+        self.lines = 0
+        self.parse_errors = 0
+        self.sanitized = 0
+        self.accepted = 0
+        self.rejected = Counter()
+        self.started_at = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return self.lines / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "lines": self.lines,
+            "parse_errors": self.parse_errors,
+            "sanitized": self.sanitized,
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "elapsed": self.elapsed(),
+            "rows_per_second": self.rows_per_second(),
+        }
+
+    def __repr__(self) -> str:
+        return f"IngestStats({self.to_dict()})"
+
+
+def _open_lines(source) -> Iterator[bytes]:
+    """Yield raw lines from a path (optionally .gz) or from a text/binary stream."""
+    if isinstance(source, (str, os.PathLike)):
+        opener = gzip.open if str(source).endswith('.gz') else open
+        with opener(source, 'rb') as f:
+            yield from f
+    elif isinstance(source, io.TextIOBase):
+        for line in source:
+            yield line.encode('utf-8')
+    else:
+        yield from source
+
+
+def parse_lines(lines, stats: IngestStats) -> Iterator[dict]:
+    """
+    Parse NDJSON lines into event dictionaries.
+
+    Lines can contain either a bare event or a relay message ["EVENT", sub_id, event].
+    Null characters are stripped with sanitize only when the raw line contains
+    an escaped null, so clean lines are never copied.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        stats.lines += 1
+        try:
+            data = _loads(line)
+        except ValueError:
+            stats.parse_errors += 1
+            continue
+        if isinstance(data, list) and len(data) == 3 and data[0] == "EVENT":
+            data = data[2]
+        if not isinstance(data, dict):
+            stats.parse_errors += 1
+            continue
+        if NULL_ESCAPE in line:
+            clean = sanitize(data)
+            if clean is not data:
+                stats.sanitized += 1
+            data = clean
+        yield data
+
+
+def validate_chunk(chunk: List[dict], verified_cache: Optional[VerifiedCache] = None):
+    """
+    Build Event objects from a chunk of event dictionaries.
+
+    Parameters:
+    - chunk: List[dict], event dictionaries
+    - verified_cache: Optional[VerifiedCache], cache of verified (id, sig) pairs
+
+    Returns:
+    - tuple, (list of Event, list of rejection reasons)
+    """
+    events = []
+    reasons = []
+    for data in chunk:
+        try:
+            events.append(Event.from_dict(data, verified_cache))
+        except (TypeError, KeyError, ValueError) as e:
+            reasons.append(failure_reason(e))
+    return events, reasons
+
+
+def _validate_chunk_profiled(chunk: List[dict]):
+    """validate_chunk in a worker process, returning also the profiling counters of the worker (to merge in the parent)."""
+    events, reasons = validate_chunk(chunk)
+    return events, reasons, drain()
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_ndjson(
+    source,
+    batch_size: int = 10000,
+    workers: Optional[int] = None,
+    verified_cache: Optional[VerifiedCache] = None,
+    stats: Optional[IngestStats] = None
+) -> Iterator[List[Event]]:
+    """
+    Stream NDJSON relay dumps into batches of validated Event objects.
+
+    The pipeline is: read lines -> JSON parse -> sanitize (only lines with
+    escaped nulls) -> validation. Events whose (id, sig) pair is already in
+    verified_cache are validated in this process without signature checks;
+    the others are validated in a process pool. At most 2 * workers chunks are
+    in flight, so memory stays bounded by the batch size.
+
+    Parameters:
+    - source: str | os.PathLike | file object, NDJSON file (optionally .gz) or stream
+    - batch_size: int, number of events per chunk and per yielded batch (at most)
+    - workers: Optional[int], number of validation processes (None = os.cpu_count(), 0 = no pool)
+    - verified_cache: Optional[VerifiedCache], cache of verified (id, sig) pairs, updated with new events
+    - stats: Optional[IngestStats], counters to update (a new one is created if None)
+
+    Example:
+    >>> stats = IngestStats()
+    >>> for events in ingest_ndjson("dump.jsonl.gz", stats=stats):
+    ...     process(events)
+    >>> stats.rows_per_second()
+
+    Returns:
+    - Iterator[List[Event]], batches of valid events
+
+    Raises:
+    - TypeError: if batch_size is not an int
+    - ValueError: if batch_size is not positive
+    """
+    if not isinstance(batch_size, int):
+        raise TypeError(f"batch_size must be an int, not {type(batch_size)}")
+    if batch_size <= 0:
+        raise ValueError(f"batch_size must be positive, not {batch_size}")
+    stats = stats if stats is not None else IngestStats()
+    workers = os.cpu_count() if workers is None else workers
+    chunks = _chunks(parse_lines(_open_lines(source), stats), batch_size)
+
+    def collect(events, reasons, profile=None):
+        if profile:
+            merge(profile)
+        stats.accepted += len(events)
+        stats.rejected.update(reasons)
+        if verified_cache is not None:
+            for event in events:
+                verified_cache.add(event.id, event.sig)
+        return events
+
+    if workers == 0:
+        for chunk in chunks:
+            events = collect(*validate_chunk(chunk, verified_cache))
+            if events:
+                yield events
+        return
+    # forked workers inherit the counters of this process: reset them, so that drain() only ships their own calls
+    with ProcessPoolExecutor(max_workers=workers, initializer=reset) as pool:
+        pending = set()
+        for chunk in chunks:
+            if verified_cache is not None:
+                known, unknown = [], []
+                for data in chunk:
+                    is_known = verified_cache.contains(str(data.get("id")), str(data.get("sig")))
+                    (known if is_known else unknown).append(data)
+                chunk = unknown
+                if known:
+                    events = collect(*validate_chunk(known, verified_cache))
+                    if events:
+                        yield events
+            if chunk:
+                pending.add(pool.submit(_validate_chunk_profiled if is_enabled() else validate_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    events = collect(*future.result())
+                    if events:
+                        yield events
+        for future in pending:
+            events = collect(*future.result())
+            if events:
+                yield events
+
+
+def ingest_to_parquet(source, output_dir: str, batch_size: int = 100000, **kwargs) -> IngestStats:
+    """
+    Ingest an NDJSON dump into columnar parquet files, one per batch.
+
+    Parameters:
+    - source: str | os.PathLike | file object, NDJSON file (optionally .gz) or stream
+    - output_dir: str, folder where part-00000.parquet, part-00001.parquet, ... are written
+    - batch_size: int, number of events per file (at most)
+    - kwargs: other arguments of ingest_ndjson
+
+    Returns:
+    - IngestStats, the counters of the run
+
+    Raises:
+    - ImportError: if polars is not installed
+    """
+    import polars as pl
+    os.makedirs(output_dir, exist_ok=True)
+    stats = kwargs.pop("stats", None) or IngestStats()
+    for i, events in enumerate(ingest_ndjson(source, batch_size=batch_size, stats=stats, **kwargs)):
+        pl.DataFrame(
+            [event.to_dict() for event in events],
+            schema={
+                "id": pl.String, "pubkey": pl.String, "created_at": pl.Int64, "kind": pl.Int32,
+                "tags": pl.List(pl.List(pl.String)), "content": pl.String, "sig": pl.String
+            }
+        ).write_parquet(os.path.join(output_dir, f"part-{i:05d}.parquet"))
+    return stats
+
+
+if __name__ == "__main__":
+    import sys
+    stats = ingest_to_parquet(sys.argv[1], sys.argv[2])
+    print(json.dumps(stats.to_dict(), indent=2))
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import atexit
+import functools
+from collections import Counter
+from contextlib import contextmanager
+
+# counters of the instrumented functions and sections: name -> [calls, seconds, failures (Counter of reasons)]
+_stats = {}
+_enabled = os.getenv("BIGBROTR_PROFILE", "false").lower() in ("1", "true")
+
+
+def failure_reason(e: Exception) -> str:
+    """Return the reason of a failure: exception type and message up to the first ':' (ids and values are dropped)."""
+    return f"{type(e).__name__}: {str(e).split(':')[0]}"
+
+
+def _entry(name: str) -> list:
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = [0, 0.0, Counter()]
+    return entry
+
+
+def profiled(name: str = None):
+    """
+    Decorator counting the calls, cumulative time and failures of a function while profiling is enabled.
+
+    When profiling is disabled the wrapper only checks a flag and calls the
+    function, so it can stay on hot paths.
+
+    Parameters:
+    - name: str, name in the report (the qualified name of the function by default)
+
+    Example:
+    >>> @profiled()
+    ... def calc_event_id(pubkey, created_at, kind, tags, content): ...
+    """
+    def decorator(func):
+        key = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            entry = _entry(key)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                entry[2][failure_reason(e)] += 1
+                raise
+            finally:
+                entry[0] += 1
+                entry[1] += time.perf_counter() - start
+        return wrapper
+    return decorator
+
+
+class _Section:
+    """Context manager timing a block of code under a name; a failure is recorded with its reason and re-raised."""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        entry = _entry(self.name)
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.start
+        if exc is not None and isinstance(exc, Exception):
+            entry[2][failure_reason(exc)] += 1
+        return False
+
+
+class _NoSection:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NO_SECTION = _NoSection()
+
+
+def section(name: str):
+    """
+    Return a context manager timing a block inside a function (a shared no-op one when profiling is disabled).
+
+    Parameters:
+    - name: str, name in the report
+
+    Example:
+    >>> with section('Event.null_check'):
+    ...     check_nulls(tags, content)
+    """
+    return _Section(name) if _enabled else _NO_SECTION
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    _stats.clear()
+
+
+@contextmanager
+def profile(reset_stats: bool = True):
+    """
+    Enable profiling inside a with block, restoring the previous state afterwards.
+
+    Parameters:
+    - reset_stats: bool, clear the counters when entering the block
+
+    Example:
+    >>> with profile():
+    ...     events = [Event.from_dict(data) for data in batch]
+    >>> print(table())
+    """
+    global _enabled
+    previous = _enabled
+    if reset_stats:
+        reset()
+    _enabled = True
+    try:
+        yield
+    finally:
+        _enabled = previous
+
+
+def stats() -> dict:
+    """
+    Return the counters as a dictionary.
+
+    Returns:
+    - dict, name -> {'calls', 'seconds', 'mean_us', 'failures' (reason -> count)}
+    """
+    return {
+        name: {
+            'calls': calls,
+            'seconds': seconds,
+            'mean_us': seconds / calls * 1e6 if calls else 0.0,
+            'failures': dict(failures),
+        }
+        for name, (calls, seconds, failures) in _stats.items()
+    }
+
+
+def drain() -> dict:
+    """Return the counters and reset them (to ship the counters of a worker process to its parent)."""
+    result = stats()
+    reset()
+    return result
+
+
+def merge(other: dict) -> None:
+    """
+    Add counters returned by stats() or drain() (e.g. of another process) to the counters of this process.
+
+    Parameters:
+    - other: dict, counters as returned by stats()
+    """
+    for name, values in other.items():
+        entry = _entry(name)
+        entry[0] += values['calls']
+        entry[1] += values['seconds']
+        entry[2].update(values['failures'])
+
+
+def table() -> str:
+    """
+    Return the counters as a text table, by cumulative time.
+
+    Times are cumulative: a function calling other instrumented functions
+    (Event.__init__ calls calc_event_id and verify_sig) includes their time.
+
+    Returns:
+    - str, one line per function or section, then one line per failure reason
+    """
+    rows = sorted(stats().items(), key=lambda item: item[1]['seconds'], reverse=True)
+    width = max([len(name) for name, _ in rows] + [8])
+    lines = [f"{'function':<{width}} {'calls':>10} {'seconds':>10} {'mean us':>10} {'failures':>10}"]
+    for name, row in rows:
+        lines.append(f"{name:<{width}} {row['calls']:>10} {row['seconds']:>10.3f} {row['mean_us']:>10.1f} {sum(row['failures'].values()):>10}")
+    for name, row in rows:
+        for reason, count in sorted(row['failures'].items(), key=lambda item: -item[1]):
+            lines.append(f"  {name}: {reason} ({count})")
+    return '\n'.join(lines)
+
+
+def to_json(path: str = None) -> str:
+    """
+    Return the counters as JSON, and write them to path if given.
+
+    Parameters:
+    - path: str, file to write
+
+    Returns:
+    - str, the JSON document
+    """
+    document = json.dumps(stats(), indent=1)
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(document)
+    return document
+
+
+def _report_at_exit() -> None:
+    if not _stats:
+        return
+    output = os.getenv("BIGBROTR_PROFILE_OUTPUT")
+    if output:
+        to_json(output)
+    else:
+        print(table())
+
+
+if _enabled:
+    # BIGBROTR_PROFILE=1: print the table (or write BIGBROTR_PROFILE_OUTPUT) when the process ends
+    atexit.register(_report_at_exit)
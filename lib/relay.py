@@ -1,4 +1,5 @@
 import utils
+from profiling import profiled
 
 
 class Relay:
@@ -16,6 +17,7 @@ class Relay:
     - to_dict() -> dict: return the Relay object as a dictionary
     """
 
+    @profiled()
     def __init__(self, url: str) -> None:
         """
         Initialize a Relay object.
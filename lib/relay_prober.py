@@ -0,0 +1,278 @@
+import time
+import json
+import uuid
+import asyncio
+import aiohttp
+from typing import AsyncIterator, Iterable, List, Optional
+from relay import Relay
+from relay_metadata import RelayMetadata
+from utils import generate_event, generate_nostr_keypair
+
+NIP11_FIELDS = ["name", "description", "banner", "icon", "pubkey", "contact", "supported_nips",
+                "software", "version", "privacy_policy", "terms_of_service", "limitation"]
+NIP11_STR_FIELDS = ["name", "description", "banner", "icon", "pubkey", "contact",
+                    "software", "version", "privacy_policy", "terms_of_service"]
+
+
+def _elapsed_ms(start: float) -> int:
+    return int((time.perf_counter() - start) * 1000)
+
+
+def parse_nip11(data) -> Optional[dict]:
+    """
+    Map a NIP-11 document to RelayMetadata keyword arguments.
+
+    Fields with a type RelayMetadata does not accept are dropped, and unknown
+    fields go to extra_fields.
+
+    Parameters:
+    - data: the decoded JSON document
+
+    Returns:
+    - Optional[dict], keyword arguments, or None if data is not a JSON object
+    """
+    if not isinstance(data, dict):
+        return None
+    result = {}
+    for key in NIP11_STR_FIELDS:
+        if isinstance(data.get(key), str):
+            result[key] = data[key]
+    nips = data.get("supported_nips")
+    if isinstance(nips, list):
+        result["supported_nips"] = [nip for nip in nips if isinstance(nip, (int, str)) and not isinstance(nip, bool)]
+    if isinstance(data.get("limitation"), dict):
+        result["limitation"] = data["limitation"]
+    extra = {k: v for k, v in data.items() if k not in NIP11_FIELDS and isinstance(k, str)}
+    if extra:
+        result["extra_fields"] = extra
+    return result
+
+
+async def fetch_nip11(session: aiohttp.ClientSession, relay: Relay, scheme: str = "wss", timeout: float = 10) -> Optional[dict]:
+    """
+    Fetch the NIP-11 information document of a relay.
+
+    Parameters:
+    - session: aiohttp.ClientSession, the HTTP session
+    - relay: Relay, the relay to query
+    - scheme: str, 'wss' to use https, 'ws' to use http
+    - timeout: float, timeout in seconds
+
+    Returns:
+    - Optional[dict], RelayMetadata keyword arguments, or None on failure
+    """
+    url = ("https://" if scheme == "wss" else "http://") + relay.url.removeprefix("wss://")
+    try:
+        async with session.get(
+            url,
+            headers={"Accept": "application/nostr+json"},
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if response.status != 200:
+                return None
+            return parse_nip11(json.loads(await response.text()))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, UnicodeDecodeError):
+        return None
+
+
+async def _wait_for(ws, predicate, timeout: float):
+    """Read messages from ws until predicate(message) returns a non None value."""
+    async def loop():
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    return None
+                continue
+            try:
+                message = json.loads(msg.data)
+            except ValueError:
+                continue
+            result = predicate(message)
+            if result is not None:
+                return result
+        return None
+    return await asyncio.wait_for(loop(), timeout)
+
+
+async def probe_connection(session: aiohttp.ClientSession, relay: Relay, sec: str, pub: str, scheme: str = "wss", timeout: float = 10) -> dict:
+    """
+    Measure open, read and write capabilities and round-trip times of a relay.
+
+    Read is tested with a REQ for one event (answered by EVENT or EOSE), write
+    by publishing a kind 30166 event signed with the prober key and waiting
+    for the OK message.
+
+    Parameters:
+    - session: aiohttp.ClientSession, the HTTP session
+    - relay: Relay, the relay to probe
+    - sec: str, private key used to sign the write test event
+    - pub: str, public key used to sign the write test event
+    - scheme: str, 'wss' or 'ws'
+    - timeout: float, timeout in seconds of every step
+
+    Returns:
+    - dict, RelayMetadata keyword arguments (connection_success, openable, readable, writable, rtt_*)
+    """
+    result = {"connection_success": False}
+    url = scheme + "://" + relay.url.removeprefix("wss://")
+    start = time.perf_counter()
+    try:
+        ws = await asyncio.wait_for(session.ws_connect(url, heartbeat=None), timeout)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, OSError):
+        return result
+    result.update(connection_success=True, openable=True, rtt_open=_elapsed_ms(start))
+    sub_id = uuid.uuid4().hex
+    event = generate_event(sec, pub, 30166, [["d", relay.url]], "")
+
+    def read_answer(message):
+        if isinstance(message, list) and len(message) >= 2 and message[1] == sub_id:
+            if message[0] in ("EVENT", "EOSE"):
+                return True
+            if message[0] == "CLOSED":
+                return False
+        return None
+
+    def write_answer(message):
+        if isinstance(message, list) and len(message) >= 3 and message[0] == "OK" and message[1] == event["id"]:
+            return message[2] is True
+        return None
+
+    try:
+        # read and write are tested separately: a relay that does not answer the REQ may still accept events
+        try:
+            start = time.perf_counter()
+            await ws.send_str(json.dumps(["REQ", sub_id, {"limit": 1}]))
+            result["readable"] = bool(await _wait_for(ws, read_answer, timeout))
+            if result["readable"]:
+                result["rtt_read"] = _elapsed_ms(start)
+            await ws.send_str(json.dumps(["CLOSE", sub_id]))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError):
+            result["readable"] = False
+        try:
+            start = time.perf_counter()
+            await ws.send_str(json.dumps(["EVENT", event]))
+            result["writable"] = bool(await _wait_for(ws, write_answer, timeout))
+            if result["writable"]:
+                result["rtt_write"] = _elapsed_ms(start)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError):
+            result["writable"] = False
+    finally:
+        await ws.close()
+    return result
+
+
+async def probe_relay(session: aiohttp.ClientSession, relay: Relay, sec: str, pub: str, scheme: str = "wss", timeout: float = 10) -> RelayMetadata:
+    """
+    Probe a relay (NIP-11 and connection tests run concurrently) and build its RelayMetadata.
+
+    Parameters:
+    - session: aiohttp.ClientSession, the HTTP session
+    - relay: Relay, the relay to probe
+    - sec: str, private key used to sign the write test event
+    - pub: str, public key used to sign the write test event
+    - scheme: str, 'wss' or 'ws'
+    - timeout: float, timeout in seconds of every step
+
+    Returns:
+    - RelayMetadata, the probe result
+    """
+    generated_at = int(time.time())
+    nip11, connection = await asyncio.gather(
+        fetch_nip11(session, relay, scheme, timeout),
+        probe_connection(session, relay, sec, pub, scheme, timeout)
+    )
+    try:
+        return RelayMetadata(relay, generated_at, nip11_success=nip11 is not None, **connection, **(nip11 or {}))
+    except (TypeError, ValueError):
+        return RelayMetadata(relay, generated_at, nip11_success=False, **connection)
+
+
+async def probe_relays(
+    relays: Iterable[Relay],
+    concurrency: int = 500,
+    timeout: float = 10,
+    batch_size: int = 1000,
+    scheme: str = "wss",
+    connector: Optional[aiohttp.BaseConnector] = None
+) -> AsyncIterator[List[RelayMetadata]]:
+    """
+    Probe many relays concurrently and yield RelayMetadata batches.
+
+    A fixed pool of `concurrency` worker tasks pulls relays from a queue, so the
+    number of open sockets is globally bounded; every probe is additionally
+    bounded by 3 * timeout seconds, and a probe that fails with any exception
+    is recorded as a failed connection. A probe holds up to two connections at
+    once (the NIP-11 request and the websocket), so the connector allows
+    2 * concurrency: with fewer, NIP-11 requests would wait for a slot held by
+    another relay's websocket and time out.
+
+    Parameters:
+    - relays: Iterable[Relay], the relays to probe
+    - concurrency: int, maximum number of relays probed at the same time
+    - timeout: float, timeout in seconds of every step of a probe
+    - batch_size: int, number of RelayMetadata per yielded batch (at most)
+    - scheme: str, 'wss' (default) or 'ws' for plain test servers
+    - connector: Optional[aiohttp.BaseConnector], e.g. a SOCKS connector to reach tor relays (its limit should be at least 2 * concurrency)
+
+    Example:
+    >>> async for batch in probe_relays(relays, concurrency=1000):
+    ...     save(batch)
+
+    Returns:
+    - AsyncIterator[List[RelayMetadata]], batches of probe results
+
+    Raises:
+    - ValueError: if concurrency or batch_size are not positive or scheme is not 'ws' or 'wss'
+    """
+    if concurrency <= 0 or batch_size <= 0:
+        raise ValueError("concurrency and batch_size must be positive")
+    if scheme not in ("ws", "wss"):
+        raise ValueError(f"scheme must be 'ws' or 'wss', not {scheme}")
+    sec, pub = generate_nostr_keypair()
+    queue = asyncio.Queue(maxsize=2 * concurrency)
+    results = asyncio.Queue()
+    connector = connector or aiohttp.TCPConnector(limit=2 * concurrency, ttl_dns_cache=300)
+
+    async def worker(session):
+        while True:
+            relay = await queue.get()
+            if relay is None:
+                return
+            try:
+                metadata = await asyncio.wait_for(probe_relay(session, relay, sec, pub, scheme, timeout), 3 * timeout)
+            except Exception:
+                # a timeout, or anything a hostile relay can trigger: record the relay as failed and go on
+                metadata = RelayMetadata(relay, int(time.time()), connection_success=False, nip11_success=False)
+            await results.put(metadata)
+
+    async def feed():
+        for relay in relays:
+            await queue.put(relay)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def run(session):
+        try:
+            await asyncio.gather(feed(), *(worker(session) for _ in range(concurrency)))
+        finally:
+            # the consumer stops on None, and gets the error (if any) from awaiting the runner
+            await results.put(None)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        runner = asyncio.create_task(run(session))
+        batch = []
+        while (metadata := await results.get()) is not None:
+            batch.append(metadata)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        await runner
+
+
+def run_probes(relays: Iterable[Relay], **kwargs) -> List[RelayMetadata]:
+    """Probe relays synchronously and return all RelayMetadata (see probe_relays for the arguments)."""
+    async def collect():
+        return [metadata async for batch in probe_relays(relays, **kwargs) for metadata in batch]
+    return asyncio.run(collect())
@@ -0,0 +1,251 @@
+import os
+import json
+import numpy as np
+import polars as pl
+from typing import Optional
+
+EVENTS_FILE = 'tag_index_events.parquet'
+VALUES_FILE = 'tag_index_values.parquet'
+POSTINGS_FILE = 'tag_index.parquet'
+META_FILE = 'tag_index_meta.json'
+MARKERS = ['root', 'reply', 'mention']
+
+
+def _write_parquet(df: pl.DataFrame, path: str) -> None:
+    df.write_parquet(path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+
+def _shredded(tags) -> pl.LazyFrame:
+    """Keep the single-letter tags with a value, lower-case 't' values and keep markers of 'e' tags only."""
+    return (
+        tags.lazy()
+        .filter(pl.col('name').str.contains('^[A-Za-z]$') & pl.col('value').is_not_null())
+        .with_columns(
+            pl.when(pl.col('name') == 't').then(pl.col('value').str.to_lowercase()).otherwise(pl.col('value')).alias('value'),
+            pl.when(pl.col('name') == 'e').then(pl.col('marker').cast(pl.String)).otherwise(None).alias('marker'),
+        )
+    )
+
+
+def _postings(folder: str, tags: pl.LazyFrame, events: pl.DataFrame, values: pl.Series) -> pl.DataFrame:
+    """
+    Encode shredded tags against the event and value dictionaries into sorted postings.
+
+    The encoding runs on the streaming engine and is written to a temporary
+    parquet, so only the integer columns of the postings are ever held in
+    memory, never the id, pubkey and value strings of every tag.
+    """
+    markers = pl.DataFrame({'marker': MARKERS, 'marker_code': np.arange(len(MARKERS), dtype=np.int8)})
+    path = os.path.join(folder, POSTINGS_FILE + '.run')
+    (
+        tags
+        .join(events.lazy().with_row_index('event_idx').select(['id', 'event_idx']), on='id', maintain_order='left')
+        .join(values.to_frame('value').lazy().with_row_index('value_idx'), on='value', maintain_order='left')
+        .join(markers.lazy(), on='marker', how='left', maintain_order='left')
+        .select([
+            pl.col('name').str.encode('hex').str.to_integer(base=16).cast(pl.UInt8).alias('tag'),
+            'value_idx',
+            'event_idx',
+            pl.col('marker_code').fill_null(-1).alias('marker'),
+        ])
+        .sink_parquet(path)
+    )
+    postings = pl.read_parquet(path).unique(['tag', 'value_idx', 'event_idx'], keep='first').sort(['tag', 'value_idx', 'event_idx'])
+    os.remove(path)
+    return postings
+
+
+class TagIndex:
+    """
+    Class to represent an inverted index of the single-letter tags of the events.
+
+    The index is made of three columnar files: a dictionary of the tagged
+    events (event_idx -> id, pubkey, created_at, kind), a sorted dictionary
+    of the tag values (value_idx -> value) and the postings (tag, value_idx,
+    event_idx, marker) sorted by tag and value. A lookup is a binary search
+    in the value dictionary followed by a binary search in the postings, so
+    no tag JSON is ever parsed after the export. New events are added by
+    extending the dictionaries and remapping the stored postings.
+
+    Attributes:
+    - folder: str, folder of the index files
+    - events: pl.DataFrame, the event dictionary
+    - values: pl.Series, the sorted value dictionary
+    - tags: np.ndarray, tag letter (as uint8) of every posting
+    - value_idx: np.ndarray, value index of every posting
+    - event_idx: np.ndarray, event index of every posting
+    - marker: np.ndarray, NIP-10 marker of every 'e' posting (index in MARKERS, -1 if none)
+    - meta: dict, sizes of the index and the source position it is up to date with
+
+    Methods:
+    - build(folder: str, tags: pl.LazyFrame, source: dict) -> TagIndex: write the index files from shredded tags
+    - exists(folder: str) -> bool: check if the index files exist
+    - merge(tags: pl.LazyFrame, source: dict) -> TagIndex: add the tags of events not yet indexed
+    - events_with(tag: str, value: str, marker: Optional[str]) -> pl.DataFrame: events having a tag value
+    - mentions(pubkey: str) -> pl.DataFrame: events with a 'p' tag for pubkey
+    - hashtag(hashtag: str) -> pl.DataFrame: events with a 't' tag for hashtag
+    - replies_to(event_id: str, marker: Optional[str]) -> pl.DataFrame: events with an 'e' tag for event_id
+    - value_counts(tag: str) -> pl.DataFrame: number of events per value of a tag
+    """
+
+    def __init__(self, folder: str) -> None:
+        """
+        Load the index files of a folder.
+
+        Parameters:
+        - folder: str, folder of the index files
+
+        Example:
+        >>> index = TagIndex(DATA_FOLDER)
+        >>> replies = index.replies_to(event_id, marker="reply")
+
+        Raises:
+        - FileNotFoundError: if the index has not been built
+        """
+        self.folder = folder
+        with open(os.path.join(folder, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.events = pl.read_parquet(os.path.join(folder, EVENTS_FILE))
+        self.values = pl.read_parquet(os.path.join(folder, VALUES_FILE))['value']
+        postings = pl.read_parquet(os.path.join(folder, POSTINGS_FILE))
+        self.tags = postings['tag'].to_numpy()
+        self.value_idx = postings['value_idx'].to_numpy()
+        self.event_idx = postings['event_idx'].to_numpy()
+        self.marker = postings['marker'].to_numpy()
+        self._keys = (self.tags.astype(np.uint64) << np.uint64(32)) | self.value_idx.astype(np.uint64)
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return all(os.path.exists(os.path.join(folder, name)) for name in (EVENTS_FILE, VALUES_FILE, POSTINGS_FILE, META_FILE))
+
+    @staticmethod
+    def _write(folder: str, events: pl.DataFrame, values: pl.Series, postings: pl.DataFrame, source: Optional[dict]) -> "TagIndex":
+        """Write the index files; the meta file is replaced last."""
+        _write_parquet(events, os.path.join(folder, EVENTS_FILE))
+        _write_parquet(values.to_frame('value'), os.path.join(folder, VALUES_FILE))
+        _write_parquet(postings, os.path.join(folder, POSTINGS_FILE))
+        path = os.path.join(folder, META_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'n_events': len(events), 'n_values': len(values), 'n_postings': len(postings), 'source': source}, f)
+        os.replace(path + '.tmp', path)
+        return TagIndex(folder)
+
+    @staticmethod
+    def build(folder: str, tags, source: Optional[dict] = None) -> "TagIndex":
+        """
+        Dictionary-encode shredded tags and write the index files.
+
+        't' values are lower-cased (NIP-24 hashtags); tag names other than a
+        single letter are ignored. The tags are read twice on the streaming
+        engine (dictionaries, then postings), so they can be larger than the
+        memory.
+
+        Parameters:
+        - folder: str, folder of the index files
+        - tags: pl.LazyFrame or pl.DataFrame, one row per tag with columns id, pubkey,
+          created_at, kind (of the event), name (tag[0]), value (tag[1]) and marker (tag[3])
+        - source: Optional[dict], position of the source the index is up to date with (stored for incremental updates)
+
+        Returns:
+        - TagIndex, the loaded index
+        """
+        tags = _shredded(tags)
+        events = tags.select(['id', 'pubkey', 'created_at', 'kind']).unique('id').sort('id').collect(engine='streaming')
+        values = tags.select('value').unique().sort('value').collect(engine='streaming')['value']
+        os.makedirs(folder, exist_ok=True)
+        return TagIndex._write(folder, events, values, _postings(folder, tags, events, values), source)
+
+    def merge(self, tags, source: Optional[dict] = None) -> "TagIndex":
+        """
+        Add the tags of events not yet indexed (tags of indexed events are ignored).
+
+        New events and values shift the indexes of the following ones, so the
+        stored postings are remapped with one lookup per dictionary and sorted
+        again with the new ones.
+
+        Parameters:
+        - tags: pl.LazyFrame or pl.DataFrame, shredded tags as for build
+        - source: Optional[dict], new source position (unchanged if None)
+
+        Returns:
+        - TagIndex, the reloaded index
+        """
+        source = self.meta['source'] if source is None else source
+        tags = _shredded(tags)
+        new_events = (
+            tags.select(['id', 'pubkey', 'created_at', 'kind']).unique('id').collect()
+            .join(self.events.select('id'), on='id', how='anti')
+        )
+        tags = tags.join(new_events.lazy().select('id'), on='id', how='semi')
+        events = pl.concat([self.events, new_events.cast(self.events.schema)]).sort('id')
+        values = pl.concat([self.values, tags.select('value').collect()['value']]).unique().sort()
+        event_remap = events['id'].search_sorted(self.events['id']).to_numpy()
+        value_remap = values.search_sorted(self.values).to_numpy()
+        stored = pl.DataFrame({
+            'tag': self.tags,
+            'value_idx': value_remap[self.value_idx].astype(self.value_idx.dtype),
+            'event_idx': event_remap[self.event_idx].astype(self.event_idx.dtype),
+            'marker': self.marker,
+        })
+        postings = pl.concat([stored, _postings(self.folder, tags, events, values)]).sort(['tag', 'value_idx', 'event_idx'])
+        return TagIndex._write(self.folder, events, values, postings, source)
+
+    def _range(self, tag: str, value: str):
+        """Return the (start, stop) postings range of a tag value (empty if the value is unknown)."""
+        position = int(self.values.search_sorted(value))
+        if position >= len(self.values) or self.values[position] != value:
+            return 0, 0
+        key = np.uint64((ord(tag) << 32) | position)
+        return int(np.searchsorted(self._keys, key, side='left')), int(np.searchsorted(self._keys, key, side='right'))
+
+    def events_with(self, tag: str, value: str, marker: Optional[str] = None) -> pl.DataFrame:
+        """
+        Return the events having a tag with the given value.
+
+        Parameters:
+        - tag: str, single-letter tag name
+        - value: str, tag value
+        - marker: Optional[str], only 'e' tags with this NIP-10 marker ('root', 'reply' or 'mention')
+
+        Returns:
+        - pl.DataFrame, columns id, pubkey, created_at, kind, sorted by created_at
+
+        Raises:
+        - ValueError: if marker is neither None nor one of MARKERS
+        """
+        start, stop = self._range(tag, value)
+        event_idx = self.event_idx[start:stop]
+        if marker is not None:
+            if marker not in MARKERS:
+                raise ValueError(f"marker must be one of {MARKERS}, not {marker}")
+            event_idx = event_idx[self.marker[start:stop] == MARKERS.index(marker)]
+        return self.events[event_idx].sort('created_at')
+
+    def mentions(self, pubkey: str) -> pl.DataFrame:
+        return self.events_with('p', pubkey)
+
+    def hashtag(self, hashtag: str) -> pl.DataFrame:
+        return self.events_with('t', hashtag.lstrip('#').lower())
+
+    def replies_to(self, event_id: str, marker: Optional[str] = None) -> pl.DataFrame:
+        return self.events_with('e', event_id, marker)
+
+    def value_counts(self, tag: str) -> pl.DataFrame:
+        """
+        Return the number of events per value of a tag.
+
+        Parameters:
+        - tag: str, single-letter tag name (e.g. 't' for the most used hashtags)
+
+        Returns:
+        - pl.DataFrame, columns value and events, sorted by events (descending)
+        """
+        start = int(np.searchsorted(self.tags, ord(tag), side='left'))
+        stop = int(np.searchsorted(self.tags, ord(tag), side='right'))
+        counts = np.bincount(self.value_idx[start:stop])
+        present = np.flatnonzero(counts)
+        return pl.DataFrame({
+            'value': self.values.gather(present),
+            'events': counts[present].astype(np.int64),
+        }).sort('events', descending=True)
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import asyncio
+import unittest
+from unittest import mock
+from aiohttp import web
+import relay_prober
+from relay import Relay
+from relay_prober import probe_relays
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from stub_relay import StubRelay  # noqa: E402
+
+TIMEOUT = 1.0
+
+
+class WriteOnlyRelay(StubRelay):
+    """Stub relay that never answers a REQ but accepts every published event."""
+
+    async def handle(self, request):
+        if request.headers.get('Upgrade', '').lower() != 'websocket':
+            return await super().handle(request)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            message = json.loads(msg.data)
+            if message[0] == 'EVENT':
+                await ws.send_str(json.dumps(['OK', message[1]['id'], True, '']))
+        return ws
+
+
+class RelayProberTest(unittest.IsolatedAsyncioTestCase):
+    """Probes of local stand-in relays (utils/stub_relay.py), reached with the 'ws' scheme."""
+
+    async def asyncSetUp(self):
+        self.stubs = []
+
+    async def asyncTearDown(self):
+        for stub in self.stubs:
+            await stub.stop()
+
+    async def start(self, stub):
+        self.stubs.append(stub)
+        return Relay(await stub.start())
+
+    async def probe(self, relays, **kwargs):
+        return [metadata async for batch in probe_relays(relays, scheme='ws', timeout=TIMEOUT, **kwargs) for metadata in batch]
+
+    async def test_stub_relays(self):
+        relays = [await self.start(StubRelay(name=f'stub {i}')) for i in range(5)]
+        results = await self.probe(relays, concurrency=2, batch_size=2)
+        self.assertEqual(sorted(m.relay.url for m in results), sorted(r.url for r in relays))
+        for metadata in results:
+            self.assertTrue(metadata.connection_success)
+            self.assertTrue(metadata.nip11_success)
+            self.assertTrue(metadata.readable)
+            self.assertTrue(metadata.writable)
+            self.assertTrue(metadata.name.startswith('stub '))
+
+    async def test_write_only_relay(self):
+        relay = await self.start(WriteOnlyRelay())
+        metadata, = await self.probe([relay])
+        self.assertTrue(metadata.connection_success)
+        self.assertFalse(metadata.readable)
+        self.assertTrue(metadata.writable)
+
+    async def test_unreachable_relay(self):
+        stub = StubRelay()
+        relay = await self.start(stub)
+        await stub.runner.cleanup()
+        self.stubs.remove(stub)
+        metadata, = await self.probe([relay])
+        self.assertFalse(metadata.connection_success)
+        self.assertFalse(metadata.nip11_success)
+
+    async def test_probe_error_does_not_stop_the_run(self):
+        relays = [await self.start(StubRelay()) for _ in range(3)]
+        probe_relay = relay_prober.probe_relay
+
+        async def failing_probe(session, relay, *args):
+            if relay.url == relays[1].url:
+                raise RecursionError("maximum recursion depth exceeded")
+            return await probe_relay(session, relay, *args)
+
+        with mock.patch.object(relay_prober, 'probe_relay', failing_probe):
+            results = await asyncio.wait_for(self.probe(relays, concurrency=2), 10 * TIMEOUT)
+        by_url = {m.relay.url: m for m in results}
+        self.assertEqual(len(by_url), 3)
+        self.assertFalse(by_url[relays[1].url].connection_success)
+        self.assertTrue(by_url[relays[0].url].connection_success)
+        self.assertTrue(by_url[relays[2].url].connection_success)
+
+
+if __name__ == "__main__":
+    unittest.main()
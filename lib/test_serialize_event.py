@@ -0,0 +1,111 @@
+import os
+import json
+import random
+import hashlib
+import unittest
+from utils import serialize_event, calc_event_id, calc_event_ids
+
+# SERIALIZE_TEST_SEED reproduces a failing run; SERIALIZE_TEST_CASES makes the run longer
+SEED = int(os.getenv("SERIALIZE_TEST_SEED", "0"))
+CASES = int(os.getenv("SERIALIZE_TEST_CASES", "5000"))
+
+ALPHABETS = [
+    [chr(c) for c in range(0x20, 0x7f)],                         # printable ASCII, with '"' and '\\'
+    [chr(c) for c in range(0x00, 0x20)] + ['\x7f'],              # control characters
+    ['é', 'ß', 'Ω', '中', '\xa0', '\u2028', '\u2029', '\ufeff', '\uffff'],  # BMP, with JS line separators
+    ['😀', '𝄞', '\U0001f9d1\u200d\U0001f4bb', '\U00010000', '\U0010ffff'],  # non-BMP
+]
+LONE_SURROGATES = ['\ud800', '\udbff', '\udc00', '\udfff']
+
+
+def random_str(rng: random.Random, surrogates: bool) -> str:
+    chars = []
+    for _ in range(rng.choice([0, 1, 2, 8, 40])):
+        chars.append(rng.choice(rng.choice(ALPHABETS)))
+        if surrogates and rng.random() < 0.02:
+            chars.append(rng.choice(LONE_SURROGATES))
+    return ''.join(chars)
+
+
+def random_value(rng: random.Random, surrogates: bool):
+    """A tag value: mostly strings, sometimes another JSON value."""
+    roll = rng.random()
+    if roll < 0.85:
+        return random_str(rng, surrogates)
+    return rng.choice([
+        rng.randint(-2 ** 70, 2 ** 70), rng.random() * 1e6, 0.1, None, True, False,
+        [random_str(rng, surrogates)], {'k': random_str(rng, surrogates)},
+    ])
+
+
+def random_event(rng: random.Random, surrogates: bool = True) -> dict:
+    tags = [[random_value(rng, surrogates) for _ in range(rng.randint(0, 4))] for _ in range(rng.randint(0, 5))]
+    if rng.random() < 0.05:
+        tags = tuple(tags)
+    return {
+        'pubkey': rng.choice(['ab' * 32, 'AB' * 32, random_str(rng, surrogates)]),
+        'created_at': rng.choice([rng.randint(0, 2 ** 40), -1, 2 ** 64, True, 1.5]),
+        'kind': rng.choice([rng.randint(0, 40000), 0, True]),
+        'tags': tags,
+        'content': random_str(rng, surrogates),
+    }
+
+
+def reference(event: dict) -> bytes:
+    """The NIP-01 serialization the fast path must reproduce."""
+    data = [0, event['pubkey'].lower(), event['created_at'], event['kind'], event['tags'], event['content']]
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def outcome(func, *args):
+    """Return ('ok', result) or ('error', exception type) of func(*args)."""
+    try:
+        return 'ok', func(*args)
+    except Exception as e:
+        return 'error', type(e)
+
+
+class SerializeEventTest(unittest.TestCase):
+    """Randomized byte-for-byte comparison of serialize_event, calc_event_id and calc_event_ids with json.dumps."""
+
+    def test_fixed_cases(self):
+        for event in [
+            {'pubkey': 'AB' * 32, 'created_at': 1, 'kind': 1, 'tags': [], 'content': ''},
+            {'pubkey': 'ab' * 32, 'created_at': 1, 'kind': 1, 'tags': [['e', 'x', '', 'root']], 'content': '"\\\x00\x1f\x7f'},
+            {'pubkey': 'ab' * 32, 'created_at': 1, 'kind': 1, 'tags': [['t', '😀\u2028']], 'content': '𝄞'},
+            {'pubkey': 'ab' * 32, 'created_at': 1, 'kind': 1, 'tags': [['amount', 21, None, 1.0]], 'content': 'x'},
+        ]:
+            self.assertEqual(bytes(serialize_event(**event)), reference(event))
+
+    def test_lone_surrogates_raise(self):
+        for event in [
+            {'pubkey': 'ab' * 32, 'created_at': 1, 'kind': 1, 'tags': [], 'content': 'a\ud800'},
+            {'pubkey': 'ab' * 32, 'created_at': 1, 'kind': 1, 'tags': [['t', '\udfff']], 'content': ''},
+            {'pubkey': 'ab' * 32, 'created_at': 1, 'kind': 1, 'tags': [['t', '\udfff', 1]], 'content': ''},
+        ]:
+            self.assertEqual(outcome(reference, event), ('error', UnicodeEncodeError))
+            self.assertRaises(UnicodeEncodeError, serialize_event, **event)
+
+    def test_random_events(self):
+        rng = random.Random(SEED)
+        buf = bytearray(b'stale bytes from a previous event')
+        for case in range(CASES):
+            event = random_event(rng)
+            expected = outcome(reference, event)
+            with self.subTest(case=case, seed=SEED, event=ascii(event)):
+                actual = outcome(lambda: bytes(serialize_event(**event, buf=buf)))
+                self.assertEqual(actual, expected)
+                if expected[0] == 'ok':
+                    self.assertEqual(calc_event_id(**event), hashlib.sha256(expected[1]).hexdigest())
+
+    def test_random_batches(self):
+        rng = random.Random(SEED + 1)
+        for case in range(CASES // 50):
+            batch = [random_event(rng, surrogates=False) for _ in range(50)]
+            expected = [hashlib.sha256(reference(event)).hexdigest() for event in batch]
+            with self.subTest(case=case, seed=SEED):
+                self.assertEqual(calc_event_ids(batch), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,275 @@
+import os
+import json
+import numpy as np
+import polars as pl
+from typing import Optional, Union
+
+PUBKEYS_FILE = 'timeline_pubkeys.parquet'
+META_FILE = 'timeline_meta.json'
+ARRAYS = {
+    'offsets': np.int64,
+    'created_at': np.int64,
+    'kind': np.int32,
+    'ids': np.uint8,
+}
+ID_SIZE = 32
+TIME_BITS = 34
+
+
+def _array_path(folder: str, name: str) -> str:
+    return os.path.join(folder, f'timeline_{name}.bin')
+
+
+def _sort_key(pubkey_ids: np.ndarray, created_at: np.ndarray) -> np.ndarray:
+    """Return an int64 key ordering events by (pubkey_id, created_at), created_at clipped to [0, 2^34)."""
+    return (pubkey_ids.astype(np.int64) << TIME_BITS) | np.clip(created_at, 0, (1 << TIME_BITS) - 1)
+
+
+class TimelineIndex:
+    """
+    Class to represent the events of every pubkey, sorted by (pubkey_id, created_at), in memory-mapped arrays.
+
+    The pubkeys are stored sorted in a dictionary (pubkey_id -> pubkey) and
+    offsets[i]:offsets[i + 1] is the range of the events of pubkey_id i in
+    the created_at, kind and ids arrays, so the timeline of a pubkey is a
+    slice of the maps. New events are added by sorting them into a run and
+    merging it with the stored arrays in one linear pass.
+
+    Attributes:
+    - folder: str, folder of the index files
+    - pubkeys: pl.Series, sorted pubkey dictionary
+    - offsets: np.memmap, int64 start of every pubkey (n_pubkeys + 1 entries)
+    - created_at: np.memmap, int64 created_at of every event
+    - kind: np.memmap, int32 kind of every event
+    - ids: np.memmap, uint8 (n_events, 32) event ids
+    - meta: dict, number of events and pubkeys and the source position it is up to date with
+
+    Methods:
+    - build(folder: str, events: pl.DataFrame, source: dict) -> TimelineIndex: write an index from events
+    - exists(folder: str) -> bool: check if the index files exist
+    - merge(events: pl.DataFrame, source: dict) -> TimelineIndex: add events to the index
+    - pubkey_id(pubkey: str) -> int: id of a pubkey (-1 if not indexed)
+    - timeline(pubkey) -> pl.DataFrame: events of a pubkey, sorted by created_at
+    - events_of(pubkeys) -> pl.DataFrame: events of several pubkeys
+    - interval_stats() -> pl.DataFrame: per-pubkey count, first/last event and inter-event interval stats
+    """
+
+    def __init__(self, folder: str) -> None:
+        """
+        Open the index files of a folder as read-only memory maps.
+
+        Parameters:
+        - folder: str, folder of the index files
+
+        Example:
+        >>> index = TimelineIndex(DATA_FOLDER)
+        >>> index.timeline(pubkey)
+
+        Raises:
+        - FileNotFoundError: if the index has not been built
+        """
+        self.folder = folder
+        with open(os.path.join(folder, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.pubkeys = pl.read_parquet(os.path.join(folder, PUBKEYS_FILE))['pubkey']
+        n_events, n_pubkeys = self.meta['n_events'], self.meta['n_pubkeys']
+        shapes = {'offsets': (n_pubkeys + 1,), 'created_at': (n_events,), 'kind': (n_events,), 'ids': (n_events, ID_SIZE)}
+        for name, dtype in ARRAYS.items():
+            if n_events == 0 and name != 'offsets':
+                setattr(self, name, np.zeros(shapes[name], dtype=dtype))
+            else:
+                setattr(self, name, np.memmap(_array_path(folder, name), dtype=dtype, mode='r', shape=shapes[name]))
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, META_FILE))
+
+    @staticmethod
+    def _write(folder: str, pubkeys: pl.Series, pubkey_ids: np.ndarray, created_at: np.ndarray, kind: np.ndarray, ids: np.ndarray, source: Optional[dict]) -> "TimelineIndex":
+        """Write sorted event arrays and their pubkey dictionary; the meta file is replaced last."""
+        os.makedirs(folder, exist_ok=True)
+        offsets = np.zeros(len(pubkeys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pubkey_ids, minlength=len(pubkeys)), out=offsets[1:])
+        arrays = {'offsets': offsets, 'created_at': created_at, 'kind': kind, 'ids': ids}
+        for name, dtype in ARRAYS.items():
+            path = _array_path(folder, name)
+            np.ascontiguousarray(arrays[name], dtype=dtype).tofile(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        path = os.path.join(folder, PUBKEYS_FILE)
+        pl.DataFrame({'pubkey': pubkeys}).write_parquet(path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+        path = os.path.join(folder, META_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'n_events': len(created_at), 'n_pubkeys': len(pubkeys), 'source': source}, f)
+        os.replace(path + '.tmp', path)
+        return TimelineIndex(folder)
+
+    @staticmethod
+    def _run(events: pl.DataFrame, pubkeys: pl.Series):
+        """Sort events into a run of (pubkey_ids, created_at, kind, ids) against a sorted pubkey dictionary."""
+        events = events.select([
+            pl.col('pubkey').cast(pl.String),
+            pl.col('created_at').cast(pl.Int64),
+            pl.col('kind').cast(pl.Int32),
+            pl.col('id').cast(pl.String),
+        ])
+        pubkey_ids = pubkeys.search_sorted(events['pubkey']).to_numpy().astype(np.int64)
+        created_at = events['created_at'].to_numpy()
+        order = np.argsort(_sort_key(pubkey_ids, created_at), kind='stable')
+        ids = np.frombuffer(b''.join(events['id'].str.decode('hex').to_list()), dtype=np.uint8).reshape(-1, ID_SIZE)
+        return pubkey_ids[order], created_at[order], events['kind'].to_numpy()[order], ids[order]
+
+    @staticmethod
+    def build(folder: str, events: pl.DataFrame, source: Optional[dict] = None) -> "TimelineIndex":
+        """
+        Write a new index from an events frame.
+
+        Parameters:
+        - folder: str, folder of the index files
+        - events: pl.DataFrame, columns id, pubkey, created_at, kind
+        - source: Optional[dict], position of the source the index is up to date with (stored for incremental updates)
+
+        Returns:
+        - TimelineIndex, the opened index
+        """
+        pubkeys = events['pubkey'].cast(pl.String).unique().sort()
+        return TimelineIndex._write(folder, pubkeys, *TimelineIndex._run(events, pubkeys), source)
+
+    def merge(self, events: pl.DataFrame, source: Optional[dict] = None) -> "TimelineIndex":
+        """
+        Add events to the index by merging their sorted run with the stored one.
+
+        The stored arrays are read sequentially once; new pubkeys shift the
+        ids of the following ones, which only remaps the dictionary.
+
+        Parameters:
+        - events: pl.DataFrame, columns id, pubkey, created_at, kind (not already indexed)
+        - source: Optional[dict], new source position (unchanged if None)
+
+        Returns:
+        - TimelineIndex, the reopened index
+        """
+        source = self.meta.get('source') if source is None else source
+        if events.is_empty():
+            path = os.path.join(self.folder, META_FILE)
+            with open(path + '.tmp', 'w') as f:
+                json.dump({**self.meta, 'source': source}, f)
+            os.replace(path + '.tmp', path)
+            self.meta['source'] = source
+            return self
+        pubkeys = pl.concat([self.pubkeys, events['pubkey'].cast(pl.String)]).unique().sort()
+        remap = pubkeys.search_sorted(self.pubkeys).to_numpy().astype(np.int64)
+        old_ids = np.repeat(remap, np.diff(self.offsets))
+        new_ids, created_at, kind, ids = TimelineIndex._run(events, pubkeys)
+        positions = np.searchsorted(_sort_key(old_ids, self.created_at), _sort_key(new_ids, created_at), side='right')
+        merged = (
+            np.insert(old_ids, positions, new_ids),
+            np.insert(self.created_at, positions, created_at),
+            np.insert(self.kind, positions, kind),
+            np.insert(self.ids, positions, ids, axis=0),
+        )
+        self.close()
+        return TimelineIndex._write(self.folder, pubkeys, *merged, source)
+
+    def close(self) -> None:
+        for name in ARRAYS:
+            array = getattr(self, name, None)
+            if isinstance(array, np.memmap):
+                array._mmap.close()
+            setattr(self, name, None)
+
+    def pubkey_id(self, pubkey: str) -> int:
+        position = int(self.pubkeys.search_sorted(pubkey))
+        if position < len(self.pubkeys) and self.pubkeys[position] == pubkey:
+            return position
+        return -1
+
+    def _frame(self, rows: Union[slice, np.ndarray], pubkey_ids: Optional[np.ndarray] = None) -> pl.DataFrame:
+        ids = np.ascontiguousarray(self.ids[rows])
+        columns = {
+            'id': pl.Series([row.tobytes() for row in ids], dtype=pl.Binary).bin.encode('hex'),
+            'created_at': np.asarray(self.created_at[rows]),
+            'kind': np.asarray(self.kind[rows]),
+        }
+        if pubkey_ids is not None:
+            columns = {'pubkey': self.pubkeys.gather(pubkey_ids), **columns}
+        return pl.DataFrame(columns)
+
+    def timeline(self, pubkey: Union[str, int]) -> pl.DataFrame:
+        """
+        Return the events of a pubkey, in one slice of the maps.
+
+        Parameters:
+        - pubkey: str or int, pubkey or pubkey id
+
+        Returns:
+        - pl.DataFrame, columns id, created_at, kind, sorted by created_at (empty if the pubkey is not indexed)
+        """
+        pubkey_id = self.pubkey_id(pubkey) if isinstance(pubkey, str) else int(pubkey)
+        if pubkey_id < 0:
+            return self._frame(slice(0, 0))
+        return self._frame(slice(int(self.offsets[pubkey_id]), int(self.offsets[pubkey_id + 1])))
+
+    def events_of(self, pubkeys) -> pl.DataFrame:
+        """
+        Return the events of several pubkeys.
+
+        Parameters:
+        - pubkeys: list or pl.Series of pubkeys (unknown pubkeys are ignored)
+
+        Returns:
+        - pl.DataFrame, columns pubkey, id, created_at, kind, sorted by pubkey and created_at
+        """
+        pubkeys = pl.Series(pubkeys, dtype=pl.String).unique().sort()
+        positions = self.pubkeys.search_sorted(pubkeys).to_numpy()
+        found = positions < len(self.pubkeys)
+        found[found] = (self.pubkeys.gather(positions[found]) == pubkeys.filter(pl.Series(found))).to_numpy()
+        pubkey_ids = positions[found].astype(np.int64)
+        starts, lengths = self.offsets[pubkey_ids], self.offsets[pubkey_ids + 1] - self.offsets[pubkey_ids]
+        # row numbers of the selected slices: starts repeated plus the position inside each slice
+        shifts = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+        rows = np.arange(int(lengths.sum()), dtype=np.int64) + shifts
+        return self._frame(rows, np.repeat(pubkey_ids, lengths))
+
+    def interval_stats(self) -> pl.DataFrame:
+        """
+        Return per-pubkey event counts and inter-event interval statistics, vectorized over the arrays.
+
+        Intervals are the differences between consecutive created_at of a
+        pubkey; their statistics are null for pubkeys with a single event.
+
+        Returns:
+        - pl.DataFrame, columns pubkey, event_count, first_eventdate, last_eventdate, lifespan,
+          mean_interval, median_interval, std_interval (sample standard deviation), max_interval
+        """
+        offsets = np.asarray(self.offsets)
+        counts = np.diff(offsets)
+        created_at = np.asarray(self.created_at)
+        first, last = created_at[offsets[:-1]], created_at[offsets[1:] - 1]
+        intervals = np.diff(created_at)
+        # drop the differences across two pubkeys: interval j belongs to the pubkey of event j + 1
+        keep = np.ones(len(intervals), dtype=bool)
+        keep[offsets[1:-1] - 1] = False
+        intervals = intervals[keep]
+        n = counts - 1
+        owner = np.repeat(np.arange(len(counts)), n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(n > 0, (last - first) / n, np.nan)
+            squares = np.bincount(owner, weights=(intervals - mean[owner]) ** 2, minlength=len(counts))
+            std = np.where(n > 1, np.sqrt(squares / (n - 1)), np.nan)
+        ordered = intervals[np.lexsort((intervals, owner))]
+        starts = np.r_[0, np.cumsum(n)[:-1]]
+        low = ordered[np.minimum(starts + (n - 1) // 2, len(ordered) - 1)] if len(ordered) else np.zeros(len(n))
+        high = ordered[np.minimum(starts + n // 2, len(ordered) - 1)] if len(ordered) else np.zeros(len(n))
+        valid = n > 0
+        return pl.DataFrame({
+            'pubkey': self.pubkeys,
+            'event_count': counts,
+            'first_eventdate': first,
+            'last_eventdate': last,
+            'lifespan': last - first,
+            'mean_interval': np.where(valid, mean, np.nan),
+            'median_interval': np.where(valid, (low + high) / 2, np.nan),
+            'std_interval': std,
+            'max_interval': np.where(valid, ordered[np.minimum(starts + n - 1, len(ordered) - 1)] if len(ordered) else np.nan, np.nan),
+        }).with_columns(pl.col(['mean_interval', 'median_interval', 'std_interval', 'max_interval']).fill_nan(None))
@@ -5,6 +5,10 @@ import secp256k1
 import os
 import re
 import time
+from profiling import profiled
+
+# C-accelerated string escaper used by json.dumps(..., ensure_ascii=False)
+_encode_str = json.encoder.encode_basestring
 
 # https://data.iana.org/TLD/tlds-alpha-by-domain.txt
 TLDS = ["AAA", "AARP", "ABB", "ABBOTT", "ABBVIE", "ABC", "ABLE", "ABOGADO", "ABUDHABI", "AC", "ACADEMY", "ACCENTURE", "ACCOUNTANT", "ACCOUNTANTS", "ACO", "ACTOR", "AD", "ADS", "ADULT", "AE", "AEG", "AERO", "AETNA", "AF", "AFL", "AFRICA", "AG", "AGAKHAN", "AGENCY", "AI", "AIG", "AIRBUS", "AIRFORCE", "AIRTEL", "AKDN", "AL", "ALIBABA", "ALIPAY", "ALLFINANZ", "ALLSTATE", "ALLY", "ALSACE", "ALSTOM", "AM", "AMAZON", "AMERICANEXPRESS", "AMERICANFAMILY", "AMEX", "AMFAM", "AMICA", "AMSTERDAM", "ANALYTICS", "ANDROID", "ANQUAN", "ANZ", "AO", "AOL", "APARTMENTS", "APP", "APPLE", "AQ", "AQUARELLE", "AR", "ARAB", "ARAMCO", "ARCHI", "ARMY", "ARPA", "ART", "ARTE", "AS", "ASDA", "ASIA", "ASSOCIATES", "AT", "ATHLETA", "ATTORNEY", "AU", "AUCTION", "AUDI", "AUDIBLE", "AUDIO", "AUSPOST", "AUTHOR", "AUTO", "AUTOS", "AW", "AWS", "AX", "AXA", "AZ", "AZURE", "BA", "BABY", "BAIDU", "BANAMEX", "BAND", "BANK", "BAR", "BARCELONA", "BARCLAYCARD", "BARCLAYS", "BAREFOOT", "BARGAINS", "BASEBALL", "BASKETBALL", "BAUHAUS", "BAYERN", "BB", "BBC", "BBT", "BBVA", "BCG", "BCN", "BD", "BE", "BEATS", "BEAUTY", "BEER", "BERLIN", "BEST", "BESTBUY", "BET", "BF", "BG", "BH", "BHARTI", "BI", "BIBLE", "BID", "BIKE", "BING", "BINGO", "BIO", "BIZ", "BJ", "BLACK", "BLACKFRIDAY", "BLOCKBUSTER", "BLOG", "BLOOMBERG", "BLUE", "BM", "BMS", "BMW", "BN", "BNPPARIBAS", "BO", "BOATS", "BOEHRINGER", "BOFA", "BOM", "BOND", "BOO", "BOOK", "BOOKING", "BOSCH", "BOSTIK", "BOSTON", "BOT", "BOUTIQUE", "BOX", "BR", "BRADESCO", "BRIDGESTONE", "BROADWAY", "BROKER", "BROTHER", "BRUSSELS", "BS", "BT", "BUILD", "BUILDERS", "BUSINESS", "BUY", "BUZZ", "BV", "BW", "BY", "BZ", "BZH", "CA", "CAB", "CAFE", "CAL", "CALL", "CALVINKLEIN", "CAM", "CAMERA", "CAMP", "CANON", "CAPETOWN", "CAPITAL", "CAPITALONE", "CAR", "CARAVAN", "CARDS", "CARE", "CAREER", "CAREERS", "CARS", "CASA", "CASE", "CASH", "CASINO", "CAT", "CATERING", "CATHOLIC", "CBA", "CBN", "CBRE", "CC", "CD", "CENTER", "CEO", "CERN", "CF", "CFA", "CFD", "CG", "CH", "CHANEL", "CHANNEL", "CHARITY", "CHASE", "CHAT", "CHEAP", "CHINTAI", "CHRISTMAS", "CHROME", "CHURCH", "CI", "CIPRIANI", "CIRCLE", "CISCO", "CITADEL", "CITI", "CITIC", "CITY", "CK", "CL", "CLAIMS", "CLEANING", "CLICK", "CLINIC", "CLINIQUE", "CLOTHING", "CLOUD", "CLUB", "CLUBMED", "CM", "CN", "CO", "COACH", "CODES", "COFFEE", "COLLEGE", "COLOGNE", "COM", "COMMBANK", "COMMUNITY", "COMPANY", "COMPARE", "COMPUTER", "COMSEC", "CONDOS", "CONSTRUCTION", "CONSULTING", "CONTACT", "CONTRACTORS", "COOKING", "COOL", "COOP", "CORSICA", "COUNTRY", "COUPON", "COUPONS", "COURSES", "CPA", "CR", "CREDIT", "CREDITCARD", "CREDITUNION", "CRICKET", "CROWN", "CRS", "CRUISE", "CRUISES", "CU", "CUISINELLA", "CV", "CW", "CX", "CY", "CYMRU", "CYOU", "CZ", "DAD", "DANCE", "DATA", "DATE", "DATING", "DATSUN", "DAY", "DCLK", "DDS", "DE", "DEAL", "DEALER", "DEALS", "DEGREE", "DELIVERY", "DELL", "DELOITTE", "DELTA", "DEMOCRAT", "DENTAL", "DENTIST", "DESI", "DESIGN", "DEV", "DHL", "DIAMONDS", "DIET", "DIGITAL", "DIRECT", "DIRECTORY", "DISCOUNT", "DISCOVER", "DISH", "DIY", "DJ", "DK", "DM", "DNP", "DO", "DOCS", "DOCTOR", "DOG", "DOMAINS", "DOT", "DOWNLOAD", "DRIVE", "DTV", "DUBAI", "DUNLOP", "DUPONT", "DURBAN", "DVAG", "DVR", "DZ", "EARTH", "EAT", "EC", "ECO", "EDEKA", "EDU", "EDUCATION", "EE", "EG", "EMAIL", "EMERCK", "ENERGY", "ENGINEER", "ENGINEERING", "ENTERPRISES", "EPSON", "EQUIPMENT", "ER", "ERICSSON", "ERNI", "ES", "ESQ", "ESTATE", "ET", "EU", "EUROVISION", "EUS", "EVENTS", "EXCHANGE", "EXPERT", "EXPOSED", "EXPRESS", "EXTRASPACE", "FAGE", "FAIL", "FAIRWINDS", "FAITH", "FAMILY", "FAN", "FANS", "FARM", "FARMERS", "FASHION", "FAST", "FEDEX", "FEEDBACK", "FERRARI", "FERRERO", "FI", "FIDELITY", "FIDO", "FILM", "FINAL", "FINANCE", "FINANCIAL", "FIRE", "FIRESTONE", "FIRMDALE", "FISH", "FISHING", "FIT", "FITNESS", "FJ", "FK", "FLICKR", "FLIGHTS", "FLIR", "FLORIST", "FLOWERS", "FLY", "FM", "FO", "FOO", "FOOD", "FOOTBALL", "FORD", "FOREX", "FORSALE", "FORUM", "FOUNDATION", "FOX", "FR", "FREE", "FRESENIUS", "FRL", "FROGANS", "FRONTIER", "FTR", "FUJITSU", "FUN", "FUND", "FURNITURE", "FUTBOL", "FYI", "GA", "GAL", "GALLERY", "GALLO", "GALLUP", "GAME", "GAMES", "GAP", "GARDEN", "GAY", "GB", "GBIZ", "GD", "GDN", "GE", "GEA", "GENT", "GENTING", "GEORGE", "GF", "GG", "GGEE", "GH", "GI", "GIFT", "GIFTS", "GIVES", "GIVING", "GL", "GLASS", "GLE", "GLOBAL", "GLOBO", "GM", "GMAIL", "GMBH", "GMO", "GMX", "GN", "GODADDY", "GOLD", "GOLDPOINT", "GOLF", "GOO", "GOODYEAR", "GOOG", "GOOGLE", "GOP", "GOT", "GOV", "GP", "GQ", "GR", "GRAINGER", "GRAPHICS", "GRATIS", "GREEN", "GRIPE", "GROCERY", "GROUP", "GS", "GT", "GU", "GUCCI", "GUGE", "GUIDE", "GUITARS", "GURU", "GW", "GY", "HAIR", "HAMBURG", "HANGOUT", "HAUS", "HBO", "HDFC", "HDFCBANK", "HEALTH", "HEALTHCARE", "HELP", "HELSINKI", "HERE", "HERMES", "HIPHOP", "HISAMITSU", "HITACHI", "HIV", "HK", "HKT", "HM", "HN", "HOCKEY", "HOLDINGS", "HOLIDAY", "HOMEDEPOT", "HOMEGOODS", "HOMES", "HOMESENSE", "HONDA", "HORSE", "HOSPITAL", "HOST", "HOSTING", "HOT", "HOTELS", "HOTMAIL", "HOUSE", "HOW", "HR", "HSBC", "HT", "HU", "HUGHES", "HYATT", "HYUNDAI", "IBM", "ICBC", "ICE", "ICU", "ID", "IE", "IEEE", "IFM", "IKANO", "IL", "IM", "IMAMAT", "IMDB", "IMMO", "IMMOBILIEN", "IN", "INC", "INDUSTRIES", "INFINITI", "INFO", "ING", "INK", "INSTITUTE", "INSURANCE", "INSURE", "INT", "INTERNATIONAL", "INTUIT", "INVESTMENTS", "IO", "IPIRANGA", "IQ", "IR", "IRISH", "IS", "ISMAILI", "IST", "ISTANBUL", "IT", "ITAU", "ITV", "JAGUAR", "JAVA", "JCB", "JE", "JEEP", "JETZT", "JEWELRY", "JIO", "JLL", "JM", "JMP", "JNJ", "JO", "JOBS", "JOBURG", "JOT", "JOY", "JP", "JPMORGAN", "JPRS", "JUEGOS", "JUNIPER", "KAUFEN", "KDDI", "KE", "KERRYHOTELS", "KERRYPROPERTIES", "KFH", "KG", "KH", "KI", "KIA", "KIDS", "KIM", "KINDLE", "KITCHEN", "KIWI", "KM", "KN", "KOELN", "KOMATSU", "KOSHER", "KP", "KPMG", "KPN", "KR", "KRD", "KRED", "KUOKGROUP", "KW", "KY", "KYOTO", "KZ", "LA", "LACAIXA", "LAMBORGHINI", "LAMER", "LAND", "LANDROVER", "LANXESS", "LASALLE", "LAT", "LATINO", "LATROBE", "LAW", "LAWYER", "LB", "LC", "LDS", "LEASE", "LECLERC", "LEFRAK", "LEGAL", "LEGO", "LEXUS", "LGBT", "LI", "LIDL", "LIFE", "LIFEINSURANCE", "LIFESTYLE", "LIGHTING", "LIKE", "LILLY", "LIMITED", "LIMO", "LINCOLN", "LINK", "LIVE", "LIVING", "LK", "LLC", "LLP", "LOAN", "LOANS", "LOCKER", "LOCUS", "LOL", "LONDON", "LOTTE", "LOTTO", "LOVE", "LPL", "LPLFINANCIAL", "LR", "LS", "LT", "LTD", "LTDA", "LU", "LUNDBECK", "LUXE", "LUXURY", "LV", "LY", "MA", "MADRID", "MAIF", "MAISON", "MAKEUP", "MAN", "MANAGEMENT", "MANGO", "MAP", "MARKET", "MARKETING", "MARKETS", "MARRIOTT", "MARSHALLS", "MATTEL", "MBA", "MC", "MCKINSEY", "MD", "ME", "MED", "MEDIA", "MEET", "MELBOURNE", "MEME", "MEMORIAL", "MEN", "MENU", "MERCKMSD", "MG", "MH", "MIAMI", "MICROSOFT", "MIL", "MINI", "MINT", "MIT", "MITSUBISHI", "MK", "ML", "MLB", "MLS", "MM", "MMA", "MN", "MO", "MOBI", "MOBILE", "MODA", "MOE", "MOI", "MOM", "MONASH", "MONEY", "MONSTER", "MORMON", "MORTGAGE", "MOSCOW",
@@ -103,6 +107,7 @@ URI_GENERIC_REGEX = r'''
 '''
 
 
+@profiled()
 def calc_event_id(pubkey: str, created_at: int, kind: int, tags: list, content: str) -> str:
     """
     Calculate the event ID based on the provided parameters.
@@ -124,9 +129,88 @@ def calc_event_id(pubkey: str, created_at: int, kind: int, tags: list, content:
     Raises:
     None
     """
+    return hashlib.sha256(serialize_event(pubkey, created_at, kind, tags, content)).hexdigest()
+
+
+def serialize_event(pubkey: str, created_at: int, kind: int, tags: list, content: str, buf: bytearray | None = None) -> bytearray:
+    """
+    Write the canonical NIP-01 serialization of an event into a bytearray.
+
+    The output is byte-for-byte identical to
+    json.dumps([0, pubkey.lower(), created_at, kind, tags, content], separators=(',', ':'), ensure_ascii=False).encode('utf-8').
+    Strings are escaped with the same C string encoder json uses; values that
+    are not plain ints, strs or lists of strs fall back to json.dumps.
+
+    Parameters:
+    - pubkey (str): The public key of the user.
+    - created_at (int): The timestamp of the event.
+    - kind (int): The kind of event.
+    - tags (list): A list of tags associated with the event.
+    - content (str): The content of the event.
+    - buf (bytearray, optional): Buffer to reuse; it is cleared before writing.
+
+    Example:
+    >>> bytes(serialize_event('pubkey', 1234567890, 1, [['tag1', 'tag2']], 'Hello, World!'))
+    b'[0,"pubkey",1234567890,1,[["tag1","tag2"]],"Hello, World!"]'
+
+    Returns:
+    - bytearray: The serialized event (buf itself when given).
+
+    Raises:
+    - UnicodeEncodeError: if a string contains lone surrogates
+    """
+    if buf is None:
+        buf = bytearray()
+    buf.clear()
+    if type(created_at) is int and type(kind) is int and type(tags) is list:
+        try:
+            buf += b'[0,'
+            buf += _encode_str(pubkey.lower()).encode('utf-8')
+            buf += b',%d,%d,[' % (created_at, kind)
+            for i, tag in enumerate(tags):
+                if type(tag) is not list:
+                    raise TypeError
+                if i:
+                    buf += b','
+                buf += b'['
+                buf += ','.join(map(_encode_str, tag)).encode('utf-8')
+                buf += b']'
+            buf += b'],'
+            buf += _encode_str(content).encode('utf-8')
+            buf += b']'
+            return buf
+        except (TypeError, AttributeError):
+            buf.clear()
     data = [0, pubkey.lower(), created_at, kind, tags, content]
-    data_str = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
-    return hashlib.sha256(data_str.encode('utf-8')).hexdigest()
+    buf += json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return buf
+
+
+@profiled()
+def calc_event_ids(batch) -> list:
+    """
+    Calculate the event IDs of many events, reusing one serialization buffer.
+
+    Parameters:
+    - batch (iterable): Events as dicts with pubkey, created_at, kind, tags and content keys.
+
+    Example:
+    >>> calc_event_ids([{'pubkey': 'pubkey', 'created_at': 1234567890, 'kind': 1, 'tags': [['tag1', 'tag2']], 'content': 'Hello, World!'}])
+    ['939de7d19587e3716e6340c2e87d4630bb3e9a6cd333d98d31ef9f1b8696c886']
+
+    Returns:
+    - list: The event IDs as hexadecimal strings, in input order.
+
+    Raises:
+    - KeyError: if an event is missing one of the required keys
+    """
+    buf = bytearray()
+    sha256 = hashlib.sha256
+    result = []
+    for event in batch:
+        serialize_event(event['pubkey'], event['created_at'], event['kind'], event['tags'], event['content'], buf)
+        result.append(sha256(buf).hexdigest())
+    return result
 
 
 def sig_event_id(event_id: str, private_key_hex: str) -> str:
@@ -153,6 +237,7 @@ def sig_event_id(event_id: str, private_key_hex: str) -> str:
     return sig.hex()
 
 
+@profiled()
 def verify_sig(event_id: str, pubkey: str, sig: str) -> bool:
     """
     Verify the signature of an event ID using the public key.
@@ -285,6 +370,7 @@ def test_keypair(seckey, pubkey):
     return generated_public_key == pubkey
 
 
+@profiled()
 def to_bech32(prefix, hex_str):
     """
     Convert a hex string to Bech32 format.
@@ -301,6 +387,7 @@ def to_bech32(prefix, hex_str):
     return bech32.bech32_encode(prefix, data)
 
 
+@profiled()
 def to_hex(bech32_str):
     """
     Convert a Bech32 string to hex format.
@@ -316,6 +403,7 @@ def to_hex(bech32_str):
     return bytes(byte_data).hex()
 
 
+@profiled()
 def find_websoket_relay_urls(text):
     """
     Find all WebSocket relays in the given text.
@@ -358,11 +446,42 @@ def find_websoket_relay_urls(text):
     return result
 
 
+@profiled()
 def sanitize(value):
+    """
+    Recursively remove null characters from strings, lists and dicts.
+
+    Structures without null characters are returned as is (no copy); only the
+    containers on the path to a modified string are rebuilt.
+
+    Parameters:
+    - value: The value to sanitize.
+
+    Example:
+    >>> sanitize({'content': 'a\x00b', 'tags': [['t', 'x']]})
+    {'content': 'ab', 'tags': [['t', 'x']]}
+
+    Returns:
+    - The sanitized value.
+
+    Raises:
+    None
+    """
+    return _sanitize(value)
+
+
+def _sanitize(value):
+    # recursive body of sanitize, kept out of the profiled wrapper so nested values are not counted as calls
     if isinstance(value, str):
-        value = value.replace('\x00', '')
+        if '\x00' in value:
+            value = value.replace('\x00', '')
     elif isinstance(value, list):
-        value = [sanitize(item) for item in value]
+        for i, item in enumerate(value):
+            clean = _sanitize(item)
+            if clean is not item:
+                return value[:i] + [clean] + [_sanitize(item) for item in value[i + 1:]]
     elif isinstance(value, dict):
-        value = {sanitize(key): sanitize(val) for key, val in value.items()}
+        for key, val in value.items():
+            if _sanitize(key) is not key or _sanitize(val) is not val:
+                return {_sanitize(key): _sanitize(val) for key, val in value.items()}
     return value
@@ -0,0 +1,277 @@
+import os
+import mmap
+import hashlib
+import numpy as np
+
+RECORD_SIZE = 16
+BLOOM_HASHES = 7
+BLOOM_BITS_PER_KEY = 10
+BLOOM_MIN_BITS = 1 << 20
+BLOCK_RECORDS = 1 << 20
+
+
+def cache_key(event_id: str, sig: str) -> bytes:
+    """
+    Return the 16-byte cache key of an (id, sig) pair.
+
+    Parameters:
+    - event_id (str): The event ID in hexadecimal format.
+    - sig (str): The signature in hexadecimal format.
+
+    Returns:
+    - bytes: The first 16 bytes of sha256(id || sig).
+
+    Raises:
+    - ValueError: if event_id or sig are not valid hexadecimal strings
+    """
+    return hashlib.sha256(bytes.fromhex(event_id) + bytes.fromhex(sig)).digest()[:RECORD_SIZE]
+
+
+class VerifiedCache:
+    """
+    Class to represent a persistent set of already verified (id, sig) pairs.
+
+    Keys are stored on disk as a sorted array of fixed 16-byte records that is
+    memory-mapped and searched with binary search. An in-memory Bloom filter,
+    persisted next to the array, answers most misses without touching the
+    array. New keys are buffered in memory and merged into the array on flush.
+    Merges and Bloom filter rebuilds work on numpy views of the array ('V16'
+    records compare as bytes), in blocks of BLOCK_RECORDS keys.
+
+    Attributes:
+    - path: str, path of the sorted key file
+    - pending: set, keys added since the last flush
+
+    Methods:
+    - __init__(path: str) -> None: open (or create) the cache
+    - __contains__(key: bytes) -> bool: check if a key is in the cache
+    - __len__() -> int: number of keys in the cache
+    - contains(event_id: str, sig: str) -> bool: check if an (id, sig) pair was verified
+    - add(event_id: str, sig: str) -> None: record a verified (id, sig) pair
+    - flush() -> None: merge pending keys into the on-disk array
+    - close() -> None: flush and release the memory map
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open a VerifiedCache, creating the files if they do not exist.
+
+        Parameters:
+        - path: str, path of the sorted key file (the Bloom filter is stored at path + '.bloom')
+
+        Example:
+        >>> cache = VerifiedCache("/data/verified.bin")
+
+        Returns:
+        - None
+
+        Raises:
+        - TypeError: if path is not a str
+        - ValueError: if the key file is corrupted
+        """
+        if not isinstance(path, str):
+            raise TypeError(f"path must be a str, not {type(path)}")
+        self.path = path
+        self.pending = set()
+        self._file = None
+        self._mmap = None
+        self._count = 0
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        self._open()
+
+    def _open(self) -> None:
+        size = os.path.getsize(self.path)
+        if size % RECORD_SIZE != 0:
+            raise ValueError(f"corrupted cache file: {self.path}")
+        self._count = size // RECORD_SIZE
+        if size > 0:
+            self._file = open(self.path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        bloom_path = self.path + '.bloom'
+        bits = max(BLOOM_MIN_BITS, (self._count * BLOOM_BITS_PER_KEY + 7) // 8 * 8)
+        if os.path.exists(bloom_path) and os.path.getsize(bloom_path) * 8 >= bits:
+            with open(bloom_path, 'rb') as f:
+                self._bloom = bytearray(f.read())
+        else:
+            self._bloom = bytearray(bits // 8)
+            disk = self._disk_array()
+            for start in range(0, self._count, BLOCK_RECORDS):
+                self._bloom_add_many(disk[start:start + BLOCK_RECORDS])
+            if self._count > 0:
+                self._write_bloom()
+
+    def _write_bloom(self) -> None:
+        with open(self.path + '.bloom.tmp', 'wb') as f:
+            f.write(self._bloom)
+        os.replace(self.path + '.bloom.tmp', self.path + '.bloom')
+
+    def _close_mmap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = None
+        self._file = None
+
+    def _bloom_positions(self, key: bytes):
+        h1 = int.from_bytes(key[:8], 'little')
+        h2 = int.from_bytes(key[8:], 'little') | 1
+        m = len(self._bloom) * 8
+        return [(h1 + i * h2) % m for i in range(BLOOM_HASHES)]
+
+    def _bloom_add(self, key: bytes) -> None:
+        for pos in self._bloom_positions(key):
+            self._bloom[pos >> 3] |= 1 << (pos & 7)
+
+    def _bloom_add_many(self, keys: np.ndarray) -> None:
+        # vectorized _bloom_add: (h1 + i * h2) % m is computed as (h1 % m + i * (h2 % m)) % m, which fits in uint64
+        halves = keys.view('<u8').reshape(-1, 2)
+        m = np.uint64(len(self._bloom) * 8)
+        h1 = halves[:, 0] % m
+        h2 = (halves[:, 1] | np.uint64(1)) % m
+        bloom = np.frombuffer(self._bloom, dtype=np.uint8)
+        for i in range(BLOOM_HASHES):
+            pos = (h1 + np.uint64(i) * h2) % m
+            np.bitwise_or.at(bloom, pos >> np.uint64(3), np.left_shift(1, pos & np.uint64(7)).astype(np.uint8))
+
+    def _bloom_contains(self, key: bytes) -> bool:
+        for pos in self._bloom_positions(key):
+            if not self._bloom[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def _disk_array(self) -> np.ndarray:
+        if self._mmap is None:
+            return np.empty(0, dtype='V16')
+        return np.frombuffer(self._mmap, dtype='V16')
+
+    def _disk_contains(self, key: bytes) -> bool:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._mmap[mid * RECORD_SIZE:(mid + 1) * RECORD_SIZE]
+            if record < key:
+                lo = mid + 1
+            elif record > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __contains__(self, key: bytes) -> bool:
+        if key in self.pending:
+            return True
+        if not self._bloom_contains(key):
+            return False
+        return self._disk_contains(key)
+
+    def __len__(self) -> int:
+        return self._count + len(self.pending)
+
+    def __enter__(self) -> "VerifiedCache":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def contains(self, event_id: str, sig: str) -> bool:
+        """
+        Check if an (id, sig) pair has already been verified.
+
+        Parameters:
+        - event_id: str, the event ID
+        - sig: str, the event signature
+
+        Example:
+        >>> cache.contains(event.id, event.sig)
+        True
+
+        Returns:
+        - bool, True if the pair is in the cache
+
+        Raises:
+        - None
+        """
+        try:
+            return cache_key(event_id, sig) in self
+        except ValueError:
+            return False
+
+    def add(self, event_id: str, sig: str) -> None:
+        """
+        Record a verified (id, sig) pair.
+
+        Parameters:
+        - event_id: str, the event ID
+        - sig: str, the event signature
+
+        Example:
+        >>> cache.add(event.id, event.sig)
+
+        Returns:
+        - None
+
+        Raises:
+        - ValueError: if event_id or sig are not valid hexadecimal strings
+        """
+        key = cache_key(event_id, sig)
+        if key not in self:
+            self.pending.add(key)
+            self._bloom_add(key)
+
+    def flush(self) -> None:
+        """
+        Merge the pending keys into the sorted on-disk array and persist the Bloom filter.
+
+        Parameters:
+        - None
+
+        Example:
+        >>> cache.flush()
+
+        Returns:
+        - None
+
+        Raises:
+        - None
+        """
+        if not self.pending:
+            return
+        new = np.sort(np.frombuffer(b''.join(self.pending), dtype='V16'))
+        disk = self._disk_array()
+        # position of every new key in the array, then one np.insert per block of the array
+        positions = np.searchsorted(disk, new)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            for start in range(0, max(self._count, 1), BLOCK_RECORDS):
+                end = min(start + BLOCK_RECORDS, self._count)
+                lo, hi = np.searchsorted(positions, [start, end], side='left')
+                if end == self._count:
+                    hi = len(positions)
+                out.write(np.insert(disk[start:end], positions[lo:hi] - start, new[lo:hi]).tobytes())
+        del disk
+        self._close_mmap()
+        os.replace(tmp_path, self.path)
+        self.pending = set()
+        # _open rebuilds the filter from the array if it became too small.
+        self._write_bloom()
+        self._open()
+
+    def close(self) -> None:
+        """
+        Flush the pending keys and release the memory map.
+
+        Parameters:
+        - None
+
+        Example:
+        >>> cache.close()
+
+        Returns:
+        - None
+
+        Raises:
+        - None
+        """
+        self.flush()
+        self._close_mmap()
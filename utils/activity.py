@@ -0,0 +1,201 @@
+import os
+import json
+import numpy as np
+import polars as pl
+
+
+ACTIVITY_FILE = 'activity_runs.parquet'
+ACTIVITY_META = 'activity_runs.json'
+WINDOWS = {'DAU': 1, 'WAU': 7, 'MAU': 30}
+KIND_GROUPS = {'all': None, 'kind_1': [1], 'kind_6': [6], 'kind_7': [7]}
+DAY = 86400
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_activity_runs(data_folder, force=False):
+    """
+    Compress events.csv into runs of consecutive active days per (pubkey, kind).
+
+    A pubkey posting a kind every day for a month is a single row
+    (start, end). The table is rebuilt only when events.csv changes.
+
+    Parameters:
+    - data_folder (str): Folder containing events.csv.
+    - force (bool): Rebuild even if the cache is up to date.
+
+    Returns:
+    - str: Path of activity_runs.parquet (columns pubkey_id, kind, start, end, sorted
+      by pubkey_id, kind and start; days are counted since the epoch, end included).
+    """
+    events_path = os.path.join(data_folder, 'events.csv')
+    path = os.path.join(data_folder, ACTIVITY_FILE)
+    meta_path = os.path.join(data_folder, ACTIVITY_META)
+    if not force and os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f)['fingerprint'] == _fingerprint(events_path):
+                return path
+    (
+        pl.scan_csv(events_path)
+        .select([
+            pl.col('pubkey').rank('dense').cast(pl.UInt32).alias('pubkey_id'),
+            pl.col('kind').cast(pl.Int32),
+            (pl.col('created_at') // DAY).cast(pl.Int32).alias('day'),
+        ])
+        .unique()
+        .sort(['pubkey_id', 'kind', 'day'])
+        # days of a run minus their position in the (pubkey, kind) sequence are constant
+        .with_columns((pl.col('day') - pl.int_range(pl.len()).over(['pubkey_id', 'kind'])).alias('run'))
+        .group_by(['pubkey_id', 'kind', 'run'])
+        .agg(pl.col('day').min().alias('start'), pl.col('day').max().alias('end'))
+        .drop('run')
+        .sort(['pubkey_id', 'kind', 'start'])
+        .collect()
+        .write_parquet(path + '.tmp', compression='zstd')
+    )
+    os.replace(path + '.tmp', path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump({'fingerprint': _fingerprint(events_path)}, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return path
+
+
+class Activity:
+    """
+    Class to compute exact rolling distinct active pubkey counts from activity-day runs.
+
+    A pubkey is active in the window of length w ending on day t if it has
+    an active day in [t - w + 1, t]. Each run [start, end] therefore covers
+    the windows ending in [start, end + w - 1]; the covered ranges of a
+    pubkey are merged, and a +1/-1 difference array over their boundaries
+    is summed once, so every window length costs one linear sweep over the
+    runs (after one sort of the runs by pubkey and start day).
+
+    Attributes:
+    - pubkey_ids: np.ndarray, pubkey id of every run
+    - kinds: np.ndarray, kind of every run
+    - starts: np.ndarray, first day (since the epoch) of every run
+    - ends: np.ndarray, last day of every run (included)
+
+    Methods:
+    - from_runs(df: pl.DataFrame) -> Activity: build the arrays from activity runs
+    - load(data_folder: str) -> Activity: build (or reuse) activity_runs.parquet and load it
+    - rolling_active(window: int, kinds) -> Tuple[np.ndarray, np.ndarray]: days and active pubkeys per window
+    - active_pubkeys(windows: dict, groups: dict) -> pl.DataFrame: rolling counts per day and kind group
+    """
+
+    def __init__(self, pubkey_ids, kinds, starts, ends) -> None:
+        self.pubkey_ids = pubkey_ids
+        self.kinds = kinds
+        self.starts = starts
+        self.ends = ends
+
+    @staticmethod
+    def from_runs(df: pl.DataFrame) -> "Activity":
+        """
+        Build the activity arrays from an activity runs table.
+
+        Parameters:
+        - df: pl.DataFrame, columns pubkey_id, kind, start, end
+
+        Returns:
+        - Activity, the activity arrays
+        """
+        df = df.sort(['pubkey_id', 'kind', 'start'])
+        return Activity(
+            pubkey_ids=df['pubkey_id'].to_numpy().astype(np.int64),
+            kinds=df['kind'].to_numpy().astype(np.int64),
+            starts=df['start'].to_numpy().astype(np.int64),
+            ends=df['end'].to_numpy().astype(np.int64),
+        )
+
+    @staticmethod
+    def load(data_folder: str) -> "Activity":
+        """
+        Build (or reuse) activity_runs.parquet from events.csv and load the activity arrays.
+
+        Parameters:
+        - data_folder: str, folder containing events.csv
+
+        Returns:
+        - Activity, the activity arrays
+        """
+        return Activity.from_runs(pl.read_parquet(build_activity_runs(data_folder)))
+
+    def _runs(self, kinds=None):
+        """Return (pubkey ids, starts, ends) of the selected kinds, sorted by pubkey and start."""
+        mask = np.isin(self.kinds, kinds) if kinds is not None else slice(None)
+        ids, starts, ends = self.pubkey_ids[mask], self.starts[mask], self.ends[mask]
+        order = np.lexsort((starts, ids))
+        return ids[order], starts[order], ends[order]
+
+    def day_range(self):
+        """Return the first and last active day of the data (both included)."""
+        if len(self.starts) == 0:
+            return 0, -1
+        return int(self.starts.min()), int(self.ends.max())
+
+    def rolling_active(self, window: int, kinds=None):
+        """
+        Count the distinct pubkeys active in the window of `window` days ending on every day.
+
+        Parameters:
+        - window: int, window length in days (1 for daily active pubkeys)
+        - kinds: optional list of kinds, only events of these kinds count as activity
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray], days (since the epoch) and exact number of active pubkeys
+        """
+        if window < 1:
+            raise ValueError(f"window must be at least 1 day, not {window}")
+        first, last = self.day_range()
+        days = np.arange(first, last + 1)
+        ids, starts, ends = self._runs(kinds)
+        if len(ids) == 0:
+            return days, np.zeros(len(days), dtype=np.int64)
+        covered = ends + (window - 1)
+        # runs of different kinds may overlap: running maximum of the covered end within each pubkey
+        span = int(covered.max()) + 1
+        running = np.maximum.accumulate(ids * span + covered) - ids * span
+        new_pubkey = np.r_[True, ids[1:] != ids[:-1]]
+        block = new_pubkey | np.r_[True, starts[1:] > running[:-1] + 1]
+        block_starts = starts[block]
+        block_ends = running[np.r_[np.flatnonzero(block)[1:] - 1, len(ids) - 1]]
+        diff = np.bincount(block_starts - first, minlength=len(days) + 1)[:len(days) + 1].astype(np.int64)
+        stops = block_ends + 1 - first
+        diff -= np.bincount(stops[stops <= len(days)], minlength=len(days) + 1)
+        return days, np.cumsum(diff[:len(days)])
+
+    def active_pubkeys(self, windows=None, groups=None) -> pl.DataFrame:
+        """
+        Return the rolling active pubkey counts of every day and kind group.
+
+        Parameters:
+        - windows: dict, column name -> window length in days (WINDOWS by default)
+        - groups: dict, group name -> list of kinds, or None for all kinds (KIND_GROUPS by default)
+
+        Returns:
+        - pl.DataFrame, columns day (date), group and one column per window, by group and day
+        """
+        windows = windows or WINDOWS
+        groups = groups or KIND_GROUPS
+        frames = []
+        for group, kinds in groups.items():
+            columns = {}
+            for name, window in windows.items():
+                days, columns[name] = self.rolling_active(window, kinds)
+            frames.append(pl.DataFrame({
+                'day': pl.Series(days.astype('datetime64[D]')).cast(pl.Date),
+                'group': [group] * len(days),
+                **columns,
+            }))
+        return pl.concat(frames)
+
+
+def generate_active_pubkeys_csv(data_folder):
+    """Generate active_pubkeys.csv (exact DAU, WAU and MAU per kind group) from the activity runs cache."""
+    Activity.load(data_folder).active_pubkeys().write_csv(os.path.join(data_folder, 'active_pubkeys.csv'))
+    print("active_pubkeys.csv generated.")
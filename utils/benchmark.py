@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import multiprocessing
+import polars as pl
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from synthetic_data import generate_dataset
+
+
+HISTORY_FILE = 'benchmark_history.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+MICRO_BENCHMARKS = ['calc_event_id', 'verify_sig', 'Event.from_dict', 'Relay', 'find_websoket_relay_urls', 'sanitize', 'to_bech32']
+# generate_data stages, in pipeline order: every stage reads the files written by the previous ones
+STAGES = ['relay_synchronization', 'events_relays', 'events', 'tag_index', 'timeline_index', 'pubkey_follow_pubkey',
+          'pubkey_rw_relay', 'relay_stats', 'pubkey_stats', 'pubkey_clusters', 'cohorts', 'events_cube',
+          'active_pubkeys', 'relay_cover', 'replication_index']
+
+
+def _peak_rss_mb():
+    import resource
+    # the largest of the process and of its own workers (e.g. the k-means sweep)
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _load_events(snapshot):
+    """Return the events of a snapshot as dicts with parsed tags, as relays send them."""
+    events = pl.read_parquet(os.path.join(snapshot, 'events', '*.parquet'))
+    events = events.with_columns(pl.col('created_at').cast(pl.Int64), pl.col('kind').cast(pl.Int64))
+    rows = events.to_dicts()
+    for row in rows:
+        row['tags'] = json.loads(row['tags'])
+    return rows
+
+
+def _micro_cases(snapshot):
+    """Return the micro benchmarks of the lib hot paths as name -> (function, inputs)."""
+    from utils import calc_event_id, verify_sig, find_websoket_relay_urls, sanitize, to_bech32
+    from event import Event
+    from relay import Relay
+    events = _load_events(snapshot)
+    relay_urls = pl.read_parquet(os.path.join(snapshot, 'relays', '*.parquet'))['url'].to_list()
+    # note-like texts mentioning relays, the input of find_websoket_relay_urls in kind 1 and kind 0 events
+    texts = [f"{event['content']} {relay_urls[i % len(relay_urls)]} {relay_urls[(7 * i) % len(relay_urls)]}/"
+             for i, event in enumerate(events)]
+    return {
+        'calc_event_id': (lambda e: calc_event_id(e['pubkey'], e['created_at'], e['kind'], e['tags'], e['content']), events),
+        'verify_sig': (lambda e: verify_sig(e['id'], e['pubkey'], e['sig']), events),
+        'Event.from_dict': (Event.from_dict, events),
+        'Relay': (Relay, [relay_urls[i % len(relay_urls)] for i in range(len(events))]),
+        'find_websoket_relay_urls': (find_websoket_relay_urls, texts),
+        'sanitize': (sanitize, events),
+        'to_bech32': (lambda e: to_bech32('npub', e['pubkey']), events),
+    }
+
+
+def _run_micro(name, snapshot, repeat):
+    """Time a micro benchmark (best of repeat passes over its inputs); run in a fresh process."""
+    function, inputs = _micro_cases(snapshot)[name]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in inputs:
+            function(value)
+        times.append(time.perf_counter() - start)
+    return {'seconds': min(times), 'items': len(inputs), 'peak_rss_mb': _peak_rss_mb()}
+
+
+def _run_stage(name, snapshot, data_folder):
+    """Time a generate_data stage on a snapshot; run in a fresh process, once (stages skip existing outputs)."""
+    import generate_data
+    from duckdb_backend import DuckDBBackend
+    from relay import Relay
+    from tag_index import TagIndex
+    from timeline_index import TimelineIndex
+    # module globals the stages expect, set by the __main__ block of generate_data
+    generate_data.DATA_FOLDER = data_folder
+    generate_data.Relay = Relay
+    generate_data.TagIndex = TagIndex
+    generate_data.TimelineIndex = TimelineIndex
+    bigbrotr = DuckDBBackend(snapshot)
+    stages = {
+        'relay_synchronization': lambda: generate_data.generate_relay_synchronization_csv(data_folder, bigbrotr),
+        'events_relays': lambda: generate_data.generate_events_relays_csv(data_folder, bigbrotr),
+        'events': lambda: generate_data.generate_events_csv(data_folder, bigbrotr),
+        'tag_index': lambda: generate_data.generate_tag_index(data_folder, bigbrotr),
+        'timeline_index': lambda: generate_data.generate_timeline_index(data_folder),
+        'pubkey_follow_pubkey': lambda: generate_data.generate_pubkey_follow_pubkey_csv(data_folder, bigbrotr),
+        'pubkey_rw_relay': lambda: generate_data.generate_pubkey_rw_relay_csv(data_folder, bigbrotr),
+        'relay_stats': lambda: generate_data.generate_relay_stats_csv(data_folder, bigbrotr),
+        'pubkey_stats': lambda: generate_data.generate_pubkey_stats_csv(data_folder),
+        'pubkey_clusters': lambda: generate_data.generate_pubkey_clusters(data_folder, k=10),
+        'cohorts': lambda: generate_data.generate_cohort_csvs(data_folder),
+        'events_cube': lambda: generate_data.generate_events_cube(data_folder),
+        'active_pubkeys': lambda: generate_data.generate_active_pubkeys_csv(data_folder),
+        'relay_cover': lambda: generate_data.generate_relay_cover_csv(data_folder),
+        'replication_index': lambda: generate_data.generate_replication_index(data_folder, bigbrotr),
+    }
+    start = time.perf_counter()
+    stages[name]()
+    seconds = time.perf_counter() - start
+    bigbrotr.close()
+    return {'seconds': seconds, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def _isolated(function, *args):
+    """Run a function in a new spawned process, so that peak RSS and caches belong to it alone."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def fixture(folder, n_events, seed=0, signed=False):
+    """
+    Return the snapshot folder of a fixed-seed synthetic dataset, generating it on first use.
+
+    Parameters:
+    - folder (str): Benchmark folder.
+    - n_events (int): Number of events.
+    - seed (int): Seed of the dataset.
+    - signed (bool): Valid signatures (needed by the verify_sig and Event.from_dict benchmarks).
+
+    Returns:
+    - str: Snapshot folder.
+    """
+    snapshot = os.path.join(folder, 'fixtures', f"{n_events}-{seed}{'-signed' if signed else ''}")
+    if not os.path.exists(os.path.join(snapshot, 'done')):
+        shutil.rmtree(snapshot, ignore_errors=True)
+        generate_dataset(snapshot, n_events, max(n_events // 20, 100), n_relays=200, signed=signed,
+                         chunk_size=min(n_events, 200000), seed=seed)
+        open(os.path.join(snapshot, 'done'), 'w').close()
+    return snapshot
+
+
+def run_benchmarks(folder, sizes, micro_events=5000, repeat=5, seed=0, only=None):
+    """
+    Run the micro benchmarks of the lib hot paths and the generate_data stages on synthetic fixtures.
+
+    Every benchmark runs in its own process. Micro benchmarks report the
+    best of repeat passes over micro_events signed events; stages run once
+    per size, in pipeline order, on a fresh data folder over a DuckDBBackend
+    snapshot.
+
+    Parameters:
+    - folder (str): Benchmark folder (fixtures, data folders and history).
+    - sizes (list): Numbers of events of the stage fixtures.
+    - micro_events (int): Number of events of the micro benchmark fixture.
+    - repeat (int): Passes per micro benchmark.
+    - seed (int): Seed of the fixtures.
+    - only (list, optional): Names of the benchmarks to run. Defaults to all.
+
+    Returns:
+    - list: One result per benchmark and size (benchmark, size, seconds, throughput, unit, peak_rss_mb).
+    """
+    results = []
+    selected = lambda name: only is None or name in only
+    micro = [name for name in MICRO_BENCHMARKS if selected(name)]
+    if micro:
+        snapshot = fixture(folder, micro_events, seed, signed=True)
+        for name in micro:
+            result = _isolated(_run_micro, name, snapshot, repeat)
+            results.append({'benchmark': name, 'size': micro_events, 'seconds': result['seconds'],
+                            'throughput': result['items'] / result['seconds'], 'unit': 'calls/s',
+                            'peak_rss_mb': result['peak_rss_mb']})
+            print(f"{name}: {results[-1]['throughput']:,.0f} calls/s")
+    stages = [name for name in STAGES if selected(name)]
+    for size in sizes if stages else []:
+        snapshot = fixture(folder, size, seed)
+        data_folder = os.path.join(folder, 'data', str(size))
+        shutil.rmtree(data_folder, ignore_errors=True)
+        os.makedirs(data_folder)
+        # stages depend on the outputs of the previous ones: run the whole pipeline, record the selected stages
+        for name in STAGES:
+            result = _isolated(_run_stage, name, snapshot, data_folder)
+            if name in stages:
+                results.append({'benchmark': name, 'size': size, 'seconds': result['seconds'],
+                                'throughput': size / result['seconds'], 'unit': 'events/s',
+                                'peak_rss_mb': result['peak_rss_mb']})
+                print(f"{name} ({size} events): {result['seconds']:.2f}s")
+    return results
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def append_history(folder, results):
+    """Append a run (environment and results) to benchmark_history.json and return it."""
+    path = os.path.join(folder, HISTORY_FILE)
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    run = {**_environment(), 'results': results}
+    history.append(run)
+    _write_json(path, history)
+    return run
+
+
+def compare(results, baseline, tolerance=0.15):
+    """
+    Flag the results slower or heavier than the baseline by more than the tolerance.
+
+    Parameters:
+    - results (list): Results of run_benchmarks.
+    - baseline (list): Results of the baseline run.
+    - tolerance (float): Relative change considered noise.
+
+    Returns:
+    - list: One row per result also in the baseline, with the throughput and peak RSS
+      ratios (current / baseline) and the regression flags ('throughput', 'memory').
+    """
+    reference = {(row['benchmark'], row['size']): row for row in baseline}
+    rows = []
+    for result in results:
+        base = reference.get((result['benchmark'], result['size']))
+        if base is None:
+            continue
+        speed = result['throughput'] / base['throughput']
+        memory = result['peak_rss_mb'] / base['peak_rss_mb']
+        flags = []
+        if speed < 1 - tolerance:
+            flags.append('throughput')
+        if memory > 1 + tolerance:
+            flags.append('memory')
+        rows.append({'benchmark': result['benchmark'], 'size': result['size'], 'speed': speed, 'memory': memory, 'flags': flags})
+    return rows
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.path.append(os.getenv("LIB_FOLDER"))
+    parser = argparse.ArgumentParser(description="Benchmark the lib hot paths and the generate_data stages.")
+    parser.add_argument('folder', nargs='?', default=os.getenv("BENCHMARK_FOLDER"), help="benchmark folder (fixtures, history and baseline)")
+    parser.add_argument('--sizes', default='10000,100000', help="comma-separated numbers of events of the stage fixtures")
+    parser.add_argument('--micro-events', type=int, default=5000, help="number of events of the micro benchmarks")
+    parser.add_argument('--repeat', type=int, default=5, help="passes per micro benchmark")
+    parser.add_argument('--only', help="comma-separated benchmarks to run (default: all)")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="relative change not flagged as a regression")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    args = parser.parse_args()
+    if not args.folder:
+        parser.error("a benchmark folder is required (argument or BENCHMARK_FOLDER)")
+    os.makedirs(args.folder, exist_ok=True)
+    results = run_benchmarks(args.folder, [int(size) for size in args.sizes.split(',')], args.micro_events,
+                             args.repeat, only=args.only.split(',') if args.only else None)
+    run = append_history(args.folder, results)
+    baseline_path = os.path.join(args.folder, BASELINE_FILE)
+    if args.save_baseline:
+        _write_json(baseline_path, run)
+        print(f"baseline saved ({run['commit']}).")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline['results'], args.tolerance)
+        print(f"compared with baseline {baseline['commit']} ({baseline['timestamp']}):")
+        for row in rows:
+            flag = f"  REGRESSION ({', '.join(row['flags'])})" if row['flags'] else ''
+            print(f"{row['benchmark']:>26} {row['size']:>9}  speed x{row['speed']:.2f}  memory x{row['memory']:.2f}{flag}")
+        if any(row['flags'] for row in rows):
+            sys.exit(1)
+    else:
+        print("no baseline: run with --save-baseline to store one.")
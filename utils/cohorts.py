@@ -0,0 +1,281 @@
+import os
+import json
+import numpy as np
+import polars as pl
+
+
+PUBKEY_DAYS_FILE = 'pubkey_days.parquet'
+PUBKEY_DAYS_META = 'pubkey_days.json'
+LIFESPAN_BUCKETS = ['less_than_1_day', 'between_1_and_30_days', 'more_than_30_days']
+DAY = 86400
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_pubkey_days(data_folder, force=False):
+    """
+    Aggregate events.csv into one row per (pubkey, day) with the events of that day.
+
+    This is the only pass over the events: every cohort and lifespan
+    statistic is computed from this table. It is rebuilt only when
+    events.csv changes.
+
+    Parameters:
+    - data_folder (str): Folder containing events.csv.
+    - force (bool): Rebuild even if the cache is up to date.
+
+    Returns:
+    - str: Path of pubkey_days.parquet (columns pubkey, day, events, first_ts, last_ts,
+      sorted by pubkey and day; day is the number of days since the epoch).
+    """
+    events_path = os.path.join(data_folder, 'events.csv')
+    path = os.path.join(data_folder, PUBKEY_DAYS_FILE)
+    meta_path = os.path.join(data_folder, PUBKEY_DAYS_META)
+    if not force and os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f)['fingerprint'] == _fingerprint(events_path):
+                return path
+    (
+        pl.scan_csv(events_path)
+        .select(['pubkey', 'created_at'])
+        .group_by(['pubkey', (pl.col('created_at') // DAY).cast(pl.Int32).alias('day')])
+        .agg(
+            pl.len().cast(pl.UInt32).alias('events'),
+            pl.col('created_at').min().alias('first_ts'),
+            pl.col('created_at').max().alias('last_ts'),
+        )
+        .sort(['pubkey', 'day'])
+        .collect()
+        .write_parquet(path + '.tmp', compression='zstd')
+    )
+    os.replace(path + '.tmp', path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump({'fingerprint': _fingerprint(events_path)}, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return path
+
+
+def _months(days):
+    """Convert days since the epoch to months since the epoch (calendar months)."""
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def _period_labels(periods, freq):
+    unit = 'datetime64[D]' if freq == 'day' else 'datetime64[M]'
+    return pl.Series(periods.astype(unit).astype('datetime64[D]')).cast(pl.Date)
+
+
+class Cohorts:
+    """
+    Class to compute cohort, lifespan and retention statistics from per-pubkey integer arrays.
+
+    Activity is stored as (pubkey id, day, events) triples sorted by pubkey,
+    and per-pubkey first/last timestamps and event counts are reduced from
+    them once. Every statistic is then a bincount over integer codes, so no
+    event-level join is ever needed.
+
+    Attributes:
+    - pubkeys: pl.Series, pubkey of every id
+    - pubkey_ids: np.ndarray, pubkey id of every active (pubkey, day) pair
+    - days: np.ndarray, day (since the epoch) of every active pair
+    - events: np.ndarray, number of events of every active pair
+    - first_ts: np.ndarray, first created_at of every pubkey
+    - last_ts: np.ndarray, last created_at of every pubkey
+    - count: np.ndarray, number of events of every pubkey
+
+    Methods:
+    - from_pubkey_days(df: pl.DataFrame) -> Cohorts: build the arrays from pubkey_days
+    - load(data_folder: str) -> Cohorts: build (or reuse) pubkey_days.parquet and load it
+    - first_day() -> np.ndarray: day of the first event of every pubkey
+    - last_day() -> np.ndarray: day of the last event of every pubkey
+    - lifespan_days() -> np.ndarray: last minus first event time of every pubkey, in days
+    - lifespan_buckets(short: float, long: float) -> np.ndarray: lifespan bucket code of every pubkey
+    - first_seen(freq: str) -> pl.DataFrame: number of new pubkeys per day or month
+    - counts_by_lifespan(freq: str, weight: str) -> pl.DataFrame: events or active pubkeys per period and lifespan bucket
+    - retention(relative: bool, by_age: bool) -> pl.DataFrame: cohort x month matrix of active pubkeys
+    """
+
+    def __init__(self, pubkeys, pubkey_ids, days, events, first_ts, last_ts, count) -> None:
+        self.pubkeys = pubkeys
+        self.pubkey_ids = pubkey_ids
+        self.days = days
+        self.events = events
+        self.first_ts = first_ts
+        self.last_ts = last_ts
+        self.count = count
+
+    @staticmethod
+    def from_pubkey_days(df: pl.DataFrame) -> "Cohorts":
+        """
+        Build the cohort arrays from a pubkey_days table.
+
+        Parameters:
+        - df: pl.DataFrame, columns pubkey, day, events, first_ts, last_ts
+
+        Returns:
+        - Cohorts, the cohort arrays
+        """
+        df = df.sort(['pubkey', 'day'])
+        pubkey = df['pubkey']
+        starts = np.flatnonzero(np.r_[True, (pubkey[1:] != pubkey[:-1]).to_numpy()]) if len(df) else np.zeros(0, dtype=np.int64)
+        pubkey_ids = np.repeat(np.arange(len(starts), dtype=np.uint32), np.diff(np.r_[starts, len(df)]))
+        events = df['events'].to_numpy().astype(np.int64)
+        return Cohorts(
+            pubkeys=pubkey.gather(starts),
+            pubkey_ids=pubkey_ids,
+            days=df['day'].to_numpy().astype(np.int64),
+            events=events,
+            first_ts=np.minimum.reduceat(df['first_ts'].to_numpy(), starts) if len(starts) else np.zeros(0, dtype=np.int64),
+            last_ts=np.maximum.reduceat(df['last_ts'].to_numpy(), starts) if len(starts) else np.zeros(0, dtype=np.int64),
+            count=np.add.reduceat(events, starts) if len(starts) else np.zeros(0, dtype=np.int64),
+        )
+
+    @staticmethod
+    def load(data_folder: str) -> "Cohorts":
+        """
+        Build (or reuse) pubkey_days.parquet from events.csv and load the cohort arrays.
+
+        Parameters:
+        - data_folder: str, folder containing events.csv
+
+        Returns:
+        - Cohorts, the cohort arrays
+        """
+        return Cohorts.from_pubkey_days(pl.read_parquet(build_pubkey_days(data_folder)))
+
+    def first_day(self) -> np.ndarray:
+        return self.first_ts // DAY
+
+    def last_day(self) -> np.ndarray:
+        return self.last_ts // DAY
+
+    def lifespan_days(self) -> np.ndarray:
+        return (self.last_ts - self.first_ts) / DAY
+
+    def lifespan_buckets(self, short: float = 1, long: float = 30) -> np.ndarray:
+        """
+        Return the lifespan bucket code (index in LIFESPAN_BUCKETS) of every pubkey.
+
+        Parameters:
+        - short: float, lifespans below this many days are bucket 0
+        - long: float, lifespans up to this many days (included) are bucket 1, longer ones bucket 2
+
+        Returns:
+        - np.ndarray, int8 bucket code of every pubkey
+        """
+        lifespan = self.lifespan_days()
+        return ((lifespan >= short).astype(np.int8) + (lifespan > long)).astype(np.int8)
+
+    def _periods(self, days: np.ndarray, freq: str) -> np.ndarray:
+        if freq == 'day':
+            return days
+        if freq == 'month':
+            return _months(days)
+        raise ValueError(f"freq must be 'day' or 'month', not {freq}")
+
+    def first_seen(self, freq: str = 'day') -> pl.DataFrame:
+        """
+        Return the number of pubkeys whose first event falls in every period.
+
+        Parameters:
+        - freq: str, 'day' or 'month'
+
+        Returns:
+        - pl.DataFrame, columns period (date) and count, sorted by period
+        """
+        periods = self._periods(self.first_day(), freq)
+        if len(periods) == 0:
+            return pl.DataFrame(schema={'period': pl.Date, 'count': pl.Int64})
+        start = periods.min()
+        counts = np.bincount(periods - start)
+        present = np.flatnonzero(counts)
+        return pl.DataFrame({
+            'period': _period_labels(present + start, freq),
+            'count': counts[present].astype(np.int64),
+        })
+
+    def counts_by_lifespan(self, freq: str = 'day', weight: str = 'events', short: float = 1, long: float = 30) -> pl.DataFrame:
+        """
+        Count events (or active pubkeys) per period and lifespan bucket of their pubkey.
+
+        Parameters:
+        - freq: str, 'day' or 'month'
+        - weight: str, 'events' to count events, 'pubkeys' to count active pubkeys
+        - short: float, see lifespan_buckets
+        - long: float, see lifespan_buckets
+
+        Returns:
+        - pl.DataFrame, column period plus one column per LIFESPAN_BUCKETS entry, sorted by period
+        """
+        if weight not in ('events', 'pubkeys'):
+            raise ValueError(f"weight must be 'events' or 'pubkeys', not {weight}")
+        buckets = self.lifespan_buckets(short, long)
+        ids = self.pubkey_ids.astype(np.int64)
+        periods = self._periods(self.days, freq)
+        weights = self.events if weight == 'events' else None
+        if len(periods) == 0:
+            return pl.DataFrame(schema={'period': pl.Date, **{b: pl.Int64 for b in LIFESPAN_BUCKETS}})
+        if weight == 'pubkeys' and freq == 'month':
+            # a pubkey active on several days of a month counts once
+            span = int(periods.max() - periods.min() + 1)
+            pairs = np.unique(ids * span + (periods - periods.min()))
+            ids, periods = pairs // span, pairs % span + periods.min()
+        start = periods.min()
+        n = len(LIFESPAN_BUCKETS)
+        matrix = np.bincount((periods - start) * n + buckets[ids], weights=weights).astype(np.int64)
+        matrix = np.pad(matrix, (0, -len(matrix) % n)).reshape(-1, n)
+        present = np.flatnonzero(matrix.sum(axis=1))
+        return pl.DataFrame({
+            'period': _period_labels(present + start, freq),
+            **{bucket: matrix[present, i] for i, bucket in enumerate(LIFESPAN_BUCKETS)},
+        })
+
+    def retention(self, relative: bool = False, by_age: bool = False) -> pl.DataFrame:
+        """
+        Return the month x cohort retention matrix.
+
+        The cohort of a pubkey is the month of its first event; cell
+        (cohort, month) is the number of pubkeys of the cohort with at least
+        one event in that month.
+
+        Parameters:
+        - relative: bool, divide every row by the size of its cohort
+        - by_age: bool, columns are months since the cohort month (0, 1, ...) instead of calendar months
+
+        Returns:
+        - pl.DataFrame, column cohort (date) plus one column per month (YYYY-MM) or age
+        """
+        cohorts = _months(self.first_day())
+        months = _months(self.days)
+        if len(months) == 0:
+            return pl.DataFrame(schema={'cohort': pl.Date})
+        start = cohorts.min()
+        n_months = int(months.max() - start + 1)
+        pairs = np.unique(self.pubkey_ids.astype(np.int64) * n_months + (months - start))
+        ids, month_idx = pairs // n_months, pairs % n_months
+        cohort_idx = cohorts[ids] - start
+        column = month_idx - cohort_idx if by_age else month_idx
+        matrix = np.bincount(cohort_idx * n_months + column, minlength=n_months * n_months).reshape(n_months, n_months)
+        sizes = np.bincount(cohorts - start, minlength=n_months)
+        rows = np.flatnonzero(sizes)
+        values = matrix[rows].astype(np.float64) / sizes[rows, None] if relative else matrix[rows]
+        if by_age:
+            names = [str(age) for age in range(n_months)]
+        else:
+            names = [str(m)[:7] for m in (np.arange(n_months) + start).astype('datetime64[M]')]
+        return pl.DataFrame({
+            'cohort': _period_labels(rows + start, 'month'),
+            **{name: values[:, i] for i, name in enumerate(names)},
+        })
+
+
+def generate_cohort_csvs(data_folder):
+    """Generate daily_lifespan_counts.csv and cohort_retention.csv from the pubkey_days cache."""
+    cohorts = Cohorts.load(data_folder)
+    cohorts.counts_by_lifespan('day').rename({'period': 'day'}).write_csv(
+        os.path.join(data_folder, 'daily_lifespan_counts.csv'))
+    cohorts.retention().write_csv(os.path.join(data_folder, 'cohort_retention.csv'))
+    print("daily_lifespan_counts.csv and cohort_retention.csv generated.")
@@ -1,43 +1,129 @@
 import os
-import subprocess
+import re
+import sys
+import json
+import hashlib
+import argparse
+import nbformat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from nbconvert import HTMLExporter, PDFExporter
+from nbconvert.preprocessors import ExecutePreprocessor
 from dotenv import load_dotenv
 
 
-def convert_notebooks():
+MANIFEST_FILE = '.render_manifest.json'
+DATASET_REGEX = re.compile(r"""['"]([\w\-]+\.(?:csv|parquet))['"]""")
+
+
+def file_digest(path, cache):
+    """Return the sha256 of a file, reusing cache entries whose size and mtime did not change."""
+    stat = os.stat(path)
+    key = f"{stat.st_size}:{stat.st_mtime_ns}"
+    if cache.get(path, {}).get('stat') == key:
+        return cache[path]['sha256']
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    cache[path] = {'stat': key, 'sha256': h.hexdigest()}
+    return cache[path]['sha256']
+
+
+def notebook_fingerprint(notebook_path, data_folder, cache, execute=False):
+    """
+    Hash a notebook together with the datasets it reads and the rendering mode.
+
+    Datasets are the csv/parquet file names quoted in the notebook source that
+    exist in data_folder. The execute flag is part of the hash, so switching
+    between stored and freshly executed outputs renders the notebook again.
+    """
+    h = hashlib.sha256(file_digest(notebook_path, cache).encode())
+    h.update(f"execute:{bool(execute)}".encode())
+    with open(notebook_path, encoding='utf-8') as f:
+        datasets = sorted(set(DATASET_REGEX.findall(f.read())))
+    for name in datasets:
+        path = os.path.join(data_folder or '', name)
+        if data_folder and os.path.exists(path):
+            h.update(f"{name}:{file_digest(path, cache)}".encode())
+    return h.hexdigest()
+
+
+def render_notebook(notebook_path, html_dir, pdf_dir, execute=False, timeout=None):
+    """Load a notebook once and write its HTML and PDF renderings without input cells."""
+    notebook_name = os.path.splitext(os.path.basename(notebook_path))[0]
+    notebook = nbformat.read(notebook_path, as_version=4)
+    if execute:
+        ExecutePreprocessor(timeout=timeout).preprocess(
+            notebook, {'metadata': {'path': os.path.dirname(notebook_path)}})
+    html, _ = HTMLExporter(exclude_input=True).from_notebook_node(notebook)
+    with open(os.path.join(html_dir, notebook_name + '.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+    pdf, _ = PDFExporter(exclude_input=True).from_notebook_node(notebook)
+    with open(os.path.join(pdf_dir, notebook_name + '.pdf'), 'wb') as f:
+        f.write(pdf)
+    return notebook_name
+
+
+def convert_notebooks(workers=None, force=False, execute=False):
+    """Render the changed notebooks of ANALYSIS_FOLDER/src and return the file names of those that failed."""
     load_dotenv()
     analysis_folder = os.getenv('ANALYSIS_FOLDER')
+    data_folder = os.getenv('DATA_FOLDER')
     src_dir = os.path.join(analysis_folder, 'src')
     pdf_dir = os.path.join(analysis_folder, 'pdf')
     html_dir = os.path.join(analysis_folder, 'html')
+    manifest_path = os.path.join(analysis_folder, MANIFEST_FILE)
     # Ensure output directories exist
     os.makedirs(pdf_dir, exist_ok=True)
     os.makedirs(html_dir, exist_ok=True)
-    # Loop through all .ipynb files in the src directory
-    for filename in os.listdir(src_dir):
+    manifest = {'notebooks': {}, 'files': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    # Select the notebooks whose source or input datasets changed
+    pending = {}
+    for filename in sorted(os.listdir(src_dir)):
         if filename.endswith(".ipynb"):
             notebook_path = os.path.join(src_dir, filename)
-            notebook_name = os.path.splitext(filename)[0]
-            print(f"Converting {filename}...")
-            # Convert to HTML
-            subprocess.run([
-                "jupyter", "nbconvert",
-                "--to", "html",
-                "--no-input",
-                "--output", notebook_name,
-                "--output-dir", html_dir,
-                notebook_path
-            ], check=True)
-            # Convert to PDF
-            subprocess.run([
-                "jupyter", "nbconvert",
-                "--to", "pdf",
-                "--no-input",
-                "--output", notebook_name,
-                "--output-dir", pdf_dir,
-                notebook_path
-            ], check=True)
-    print("✅ Conversion completed successfully.")
+            fingerprint = notebook_fingerprint(notebook_path, data_folder, manifest['files'], execute)
+            outputs_exist = all(os.path.exists(os.path.join(d, os.path.splitext(filename)[0] + ext))
+                                for d, ext in [(html_dir, '.html'), (pdf_dir, '.pdf')])
+            if not force and outputs_exist and manifest['notebooks'].get(filename) == fingerprint:
+                print(f"Skipping {filename} (unchanged).")
+                continue
+            pending[notebook_path] = fingerprint
+    # Render in parallel, one notebook load per process
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_notebook, path, html_dir, pdf_dir, execute): path
+            for path in pending
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            filename = os.path.basename(path)
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Failed to convert {filename}: {e}")
+                failed.append(filename)
+                continue
+            manifest['notebooks'][filename] = pending[path]
+            print(f"Converted {filename}.")
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    if failed:
+        print(f"❌ {len(failed)} of {len(pending)} notebooks failed to convert: {', '.join(sorted(failed))}")
+    else:
+        print("✅ Conversion completed successfully.")
+    return failed
 
 
 if __name__ == "__main__":
-    convert_notebooks()
+    parser = argparse.ArgumentParser(description="Render analysis notebooks to HTML and PDF.")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--force', action='store_true', help="render even unchanged notebooks")
+    parser.add_argument('--execute', action='store_true', help="execute notebooks before rendering")
+    args = parser.parse_args()
+    if convert_notebooks(workers=args.workers, force=args.force, execute=args.execute):
+        sys.exit(1)
@@ -0,0 +1,231 @@
+import os
+import re
+import sys
+import glob
+
+
+SNAPSHOT_TABLES = ['events', 'events_relays', 'relays', 'relay_metadata']
+COPY_PATTERN = re.compile(r'^\s*COPY\s*\((.*)\)\s*TO\s+STDOUT\b.*$', re.IGNORECASE | re.DOTALL)
+BATCH_ROWS = 1 << 20
+
+
+def _snapshot_source(folder, table):
+    """Return the DuckDB table function reading the snapshot of a table, or None if there is none."""
+    for pattern, reader in [(f'{table}.parquet', 'read_parquet'),
+                            (os.path.join(table, '*.parquet'), 'read_parquet'),
+                            (f'{table}.csv', 'read_csv_auto'),
+                            (os.path.join(table, '*.csv'), 'read_csv_auto')]:
+        path = os.path.join(folder, pattern)
+        if glob.glob(path):
+            return f"{reader}('{path}')"
+    return None
+
+
+class DuckDBCursor:
+    """
+    Cursor of a DuckDBBackend, with the subset of the psycopg2 cursor API used by the generators.
+
+    %s placeholders are rewritten to ?, and COPY (query) TO STDOUT is
+    streamed to the file in record batches instead of materializing the
+    result.
+
+    Attributes:
+    - connection: duckdb.DuckDBPyConnection, cursor of the embedded database
+
+    Methods:
+    - execute(sql: str, params) -> None: run a statement
+    - fetchall() -> list: rows of the last statement
+    - fetchmany(size: int) -> list: next rows of the last statement
+    - copy_expert(sql: str, file) -> None: write the result of COPY (query) TO STDOUT WITH CSV HEADER to file
+    - close() -> None: close the cursor
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self._result = None
+
+    def __enter__(self) -> "DuckDBCursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def execute(self, sql: str, params=None) -> None:
+        self._result = self.connection.execute(sql.replace('%s', '?'), params or [])
+
+    def fetchall(self) -> list:
+        return self._result.fetchall()
+
+    def fetchmany(self, size: int) -> list:
+        return self._result.fetchmany(size)
+
+    def copy_expert(self, sql: str, file) -> None:
+        import pyarrow as pa
+        import pyarrow.csv as csv
+        match = COPY_PATTERN.match(sql)
+        if match is None:
+            raise ValueError("only COPY (query) TO STDOUT WITH CSV HEADER is supported")
+        reader = self.connection.execute(match.group(1)).fetch_record_batch(BATCH_ROWS)
+        header = True
+        for batch in reader:
+            sink = pa.BufferOutputStream()
+            csv.write_csv(batch, sink, csv.WriteOptions(include_header=header))
+            file.write(sink.getvalue().to_pybytes().decode('utf-8'))
+            header = False
+        if header:
+            file.write(','.join(reader.schema.names) + '\n')
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class DuckDBBackend:
+    """
+    Class to represent an embedded DuckDB database over local table snapshots, usable in place of the bigbrotr connection.
+
+    Every table of the snapshot folder (table.parquet, table.csv or a
+    table/ folder of parquet or csv parts) is exposed as a view, so the
+    generators run their SQL unchanged on the vectorized engine. Tags stored
+    as JSON text are parsed into lists of strings, as psycopg2 returns them.
+    With a memory limit and a temp directory, joins and aggregations larger
+    than the memory spill to disk.
+
+    Attributes:
+    - dialect: str, 'duckdb' (psycopg2 connections have no dialect and are treated as 'postgres')
+    - snapshot_folder: str, folder of the table snapshots
+    - connection: duckdb.DuckDBPyConnection, the embedded database
+    - tables: list, tables found in the snapshot folder
+
+    Methods:
+    - cursor(name) -> DuckDBCursor: new cursor (context manager)
+    - frame(sql: str, params) -> pl.DataFrame: result of a query as a polars frame
+    - commit() -> None: no-op, views are read-only
+    - close() -> None: close the database
+    """
+
+    dialect = 'duckdb'
+
+    def __init__(self, snapshot_folder: str, database: str = ':memory:', memory_limit=None, temp_directory=None, threads=None) -> None:
+        """
+        Open the embedded database and create one view per snapshot table.
+
+        Parameters:
+        - snapshot_folder: str, folder of the table snapshots
+        - database: str, DuckDB database file (':memory:' for none)
+        - memory_limit: Optional[str], e.g. '8GB'; above it operators spill to temp_directory
+        - temp_directory: Optional[str], spill folder
+        - threads: Optional[int], number of worker threads
+
+        Example:
+        >>> bigbrotr = DuckDBBackend("/data/snapshot", memory_limit="4GB", temp_directory="/tmp/duckdb")
+        >>> generate_relay_stats_csv(DATA_FOLDER, bigbrotr)
+
+        Raises:
+        - ImportError: if duckdb is not installed
+        """
+        import duckdb
+        self.snapshot_folder = snapshot_folder
+        self.connection = duckdb.connect(database)
+        if memory_limit:
+            self.connection.execute(f"SET memory_limit = '{memory_limit}'")
+        if temp_directory:
+            os.makedirs(temp_directory, exist_ok=True)
+            self.connection.execute(f"SET temp_directory = '{temp_directory}'")
+        if threads:
+            self.connection.execute(f"SET threads = {int(threads)}")
+        self.connection.execute("SET preserve_insertion_order = false")
+        self.tables = []
+        for table in SNAPSHOT_TABLES:
+            source = _snapshot_source(snapshot_folder, table)
+            if source is None:
+                continue
+            columns = {row[0]: row[1] for row in self.connection.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+            select = '*'
+            if columns.get('tags') in ('VARCHAR', 'JSON'):
+                select = """* REPLACE (from_json(tags, '[["VARCHAR"]]') AS tags)"""
+            self.connection.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT {select} FROM {source}")
+            self.tables.append(table)
+
+    def cursor(self, name=None) -> DuckDBCursor:
+        # name is accepted for psycopg2 server-side cursors; DuckDB results are always read incrementally
+        return DuckDBCursor(self.connection.cursor())
+
+    def frame(self, sql: str, params=None):
+        return self.connection.execute(sql.replace('%s', '?'), params or []).pl()
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def dialect(bigbrotr):
+    """Return 'duckdb' for a DuckDBBackend and 'postgres' for a psycopg2 connection."""
+    return getattr(bigbrotr, 'dialect', 'postgres')
+
+
+def connect_backend():
+    """
+    Connect to the backend selected in the .env settings.
+
+    BACKEND=duckdb opens a DuckDBBackend over SNAPSHOT_FOLDER (with
+    DUCKDB_DATABASE, DUCKDB_MEMORY_LIMIT, DUCKDB_TEMP_DIRECTORY and
+    DUCKDB_THREADS); otherwise the DB_* settings are used to connect to
+    Postgres.
+
+    Returns:
+    - DuckDBBackend or psycopg2.connection: the backend
+    """
+    if os.getenv("BACKEND", "postgres").lower() == 'duckdb':
+        return DuckDBBackend(
+            os.getenv("SNAPSHOT_FOLDER"),
+            database=os.getenv("DUCKDB_DATABASE", ':memory:'),
+            memory_limit=os.getenv("DUCKDB_MEMORY_LIMIT"),
+            temp_directory=os.getenv("DUCKDB_TEMP_DIRECTORY"),
+            threads=os.getenv("DUCKDB_THREADS"),
+        )
+    import psycopg2
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        dbname=os.getenv("DB_NAME")
+    )
+
+
+def export_snapshot(bigbrotr, snapshot_folder, tables=None):
+    """
+    Copy tables of the bigbrotr database to csv snapshots readable by DuckDBBackend.
+
+    Parameters:
+    - bigbrotr (psycopg2.connection): Connection to the bigbrotr database.
+    - snapshot_folder (str): Destination folder.
+    - tables (list, optional): Tables to copy. Defaults to SNAPSHOT_TABLES.
+    """
+    os.makedirs(snapshot_folder, exist_ok=True)
+    for table in tables or SNAPSHOT_TABLES:
+        path = os.path.join(snapshot_folder, f'{table}.csv')
+        with bigbrotr.cursor() as cur, open(path + '.tmp', 'w') as f:
+            cur.copy_expert(f"COPY {table} TO STDOUT WITH CSV HEADER", f)
+        os.replace(path + '.tmp', path)
+        print(f"{table}.csv exported.")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    if len(sys.argv) != 2:
+        print("usage: python duckdb_backend.py SNAPSHOT_FOLDER")
+        sys.exit(1)
+    import psycopg2
+    bigbrotr = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        dbname=os.getenv("DB_NAME")
+    )
+    export_snapshot(bigbrotr, sys.argv[1])
+    bigbrotr.close()
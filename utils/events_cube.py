@@ -0,0 +1,214 @@
+import os
+import json
+import math
+import polars as pl
+from export_state import export_position, read_appended
+
+
+CUBE_FILE = 'events_cube.parquet'
+SKETCH_FILE = 'events_cube_hll.parquet'
+STATE_FILE = 'events_cube_state.json'
+PRECISION = 12
+DAY = 86400
+
+
+def _load_state(data_folder):
+    path = os.path.join(data_folder, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(data_folder, state):
+    path = os.path.join(data_folder, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def _write_parquet(df, path):
+    df.write_parquet(path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+
+def _aggregate(events, precision):
+    """
+    Reduce an events frame (pubkey, created_at, kind) to cube cells and sparse HyperLogLog registers.
+
+    Pubkeys are already uniform 256 bit hashes, so the register of a pubkey
+    is the top `precision` bits of its first 32 bits and its rank is the
+    position of the leftmost 1 bit in the next 32 bits (33 if they are all 0).
+    Only non empty registers are kept, as (day, kind, register, rank) rows.
+
+    Parameters:
+    - events (pl.LazyFrame): Columns pubkey, created_at and kind.
+    - precision (int): Number of index bits (2^precision registers per cell).
+
+    Returns:
+    - tuple: (cells with columns day, kind, events; registers with columns day, kind, register, rank)
+    """
+    events = events.select([
+        (pl.col('created_at') // DAY).cast(pl.Int32).alias('day'),
+        pl.col('kind').cast(pl.Int32),
+        pl.col('pubkey').str.slice(0, 8).str.to_integer(base=16, strict=False).alias('high'),
+        pl.col('pubkey').str.slice(8, 8).str.to_integer(base=16, strict=False).alias('low'),
+    ])
+    cells = events.group_by(['day', 'kind']).agg(pl.len().cast(pl.Int64).alias('events'))
+    # bit length of low is floor(log2(low)) + 1, exact in float64 for 32 bit values
+    bit_length = pl.when(pl.col('low') > 0).then(pl.col('low').cast(pl.Float64).log(2).floor() + 1).otherwise(0)
+    registers = (
+        events
+        .drop_nulls(['high', 'low'])
+        .select([
+            'day',
+            'kind',
+            (pl.col('high') // (1 << (32 - precision))).cast(pl.UInt16).alias('register'),
+            (33 - bit_length).cast(pl.UInt8).alias('rank'),
+        ])
+        .group_by(['day', 'kind', 'register'])
+        .agg(pl.col('rank').max())
+    )
+    return pl.collect_all([cells, registers])
+
+
+def _merge(old, new, keys, values):
+    """Merge two partial tables on keys, adding or maxing the value columns (values: name -> 'sum' or 'max')."""
+    if old is None:
+        return new
+    merged = pl.concat([old, new.select(old.columns)], how='vertical_relaxed')
+    return merged.group_by(keys).agg([getattr(pl.col(name), how)() for name, how in values.items()])
+
+
+def update_events_cube(data_folder, precision=PRECISION):
+    """
+    Build or incrementally update the (day, kind) events cube.
+
+    The cube stores, for every (day, kind) cell, the number of events and a
+    HyperLogLog sketch of its distinct pubkeys. Event counts add and sketches
+    merge by register-wise maximum, so the first run aggregates events.csv
+    once and later runs only aggregate the events appended to it since the
+    stored position (a new export of events.csv rebuilds the cube).
+
+    Parameters:
+    - data_folder (str): Folder containing events.csv and its export state.
+    - precision (int): Sketch precision, 2^precision registers per cell
+      (relative standard error about 1.04 / sqrt(2^precision)).
+
+    Returns:
+    - int: Number of events added to the cube.
+    """
+    cube_path = os.path.join(data_folder, CUBE_FILE)
+    sketch_path = os.path.join(data_folder, SKETCH_FILE)
+    state = _load_state(data_folder)
+    if state is not None and state['precision'] != precision:
+        state = None
+    if state is not None and not (os.path.exists(cube_path) and os.path.exists(sketch_path)):
+        state = None
+    position = export_position(data_folder, 'events.csv')
+    columns = ['pubkey', 'created_at', 'kind']
+    events = None
+    if state is not None:
+        schema = {'pubkey': pl.String, 'created_at': pl.Int64, 'kind': pl.Int64}
+        events = read_appended(data_folder, 'events.csv', state.get('source'), position, columns, schema)
+    if events is None:
+        events = pl.scan_csv(os.path.join(data_folder, 'events.csv')).select(columns)
+        old_cells = old_registers = None
+    else:
+        events = events.lazy()
+        old_cells = pl.read_parquet(cube_path)
+        old_registers = pl.read_parquet(sketch_path)
+    cells, registers = _aggregate(events, precision)
+    added = int(cells['events'].sum())
+    cells = _merge(old_cells, cells, ['day', 'kind'], {'events': 'sum'})
+    registers = _merge(old_registers, registers, ['day', 'kind', 'register'], {'rank': 'max'})
+    _write_parquet(cells.sort(['day', 'kind']), cube_path)
+    _write_parquet(registers.sort(['day', 'kind', 'register']), sketch_path)
+    _save_state(data_folder, {'source': position, 'precision': precision})
+    return added
+
+
+def _period(by):
+    """Return the expressions of the grouping columns (day and month are dates)."""
+    day = pl.col('day').cast(pl.Date)
+    columns = {'day': day.alias('day'), 'month': day.dt.truncate('1mo').alias('month'), 'kind': pl.col('kind')}
+    for name in by:
+        if name not in columns:
+            raise ValueError(f"cannot group the cube by {name}, only by day, month and kind")
+    return [columns[name] for name in by]
+
+
+def estimate(registers, by, precision=PRECISION):
+    """
+    Estimate the distinct count of every group of merged sketches.
+
+    Parameters:
+    - registers (pl.LazyFrame): Sparse registers, columns by + register and rank.
+    - by (list): Grouping columns.
+    - precision (int): Sketch precision.
+
+    Returns:
+    - pl.LazyFrame: Columns by + pubkeys (estimated distinct pubkeys).
+    """
+    m = 1 << precision
+    alpha = 0.7213 / (1 + 1.079 / m)
+    zeros = m - pl.col('filled')
+    raw = alpha * m * m / (pl.col('harmonic') + zeros)
+    # linear counting for small cardinalities
+    small = m * (m / zeros.cast(pl.Float64)).log()
+    return (
+        registers
+        .group_by(by)
+        .agg([
+            pl.len().alias('filled'),
+            (2.0 ** (-pl.col('rank').cast(pl.Float64))).sum().alias('harmonic'),
+        ])
+        .select(by + [
+            pl.when((raw <= 2.5 * m) & (zeros > 0)).then(small).otherwise(raw).round().cast(pl.Int64).alias('pubkeys')
+        ])
+    )
+
+
+def cube_rollup(data_folder, by=('day', 'kind')):
+    """
+    Roll the events cube up to the given dimensions.
+
+    Parameters:
+    - data_folder (str): Folder containing the cube.
+    - by (sequence): Any of 'day', 'month' and 'kind' (empty for the grand total).
+
+    Returns:
+    - pl.DataFrame: Columns by + events (exact) and pubkeys (estimated distinct pubkeys), sorted by by.
+    """
+    by = list(by)
+    state = _load_state(data_folder)
+    precision = state['precision'] if state else PRECISION
+    keys = _period(by)
+    cells = pl.scan_parquet(os.path.join(data_folder, CUBE_FILE)).select(keys + ['events'])
+    registers = pl.scan_parquet(os.path.join(data_folder, SKETCH_FILE)).select(keys + ['register', 'rank'])
+    if not by:
+        cells = cells.select(pl.col('events').sum())
+        registers = registers.group_by('register').agg(pl.col('rank').max())
+        pubkeys = estimate(registers.with_columns(pl.lit(0).alias('all')), ['all'], precision).drop('all')
+        return pl.concat([cells, pubkeys], how='horizontal').collect()
+    cells = cells.group_by(by).agg(pl.col('events').sum())
+    registers = registers.group_by(by + ['register']).agg(pl.col('rank').max())
+    pubkeys = estimate(registers, by, precision)
+    return cells.join(pubkeys, on=by, how='left').sort(by).collect()
+
+
+def relative_error(precision=PRECISION):
+    """Return the relative standard error of the distinct pubkey estimates."""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def generate_events_cube(data_folder):
+    """Update the events cube and write its (day, kind), (month, kind) and kind rollups as csv; return the number of new events."""
+    added = update_events_cube(data_folder)
+    for by, name in [(['day', 'kind'], 'events_cube.csv'),
+                     (['month', 'kind'], 'events_cube_month.csv'),
+                     (['kind'], 'events_cube_kind.csv'),
+                     (['day'], 'events_cube_day.csv')]:
+        cube_rollup(data_folder, by).write_csv(os.path.join(data_folder, name))
+    print(f"events cube updated ({added} new events, pubkey counts within ~{relative_error():.1%}).")
+    return added
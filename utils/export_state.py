@@ -0,0 +1,71 @@
+import os
+import json
+import polars as pl
+
+
+EXPORT_STATE_FILE = 'csv_export_state.json'
+
+
+def load_export_state(data_folder):
+    path = os.path.join(data_folder, EXPORT_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_export_state(data_folder, state):
+    path = os.path.join(data_folder, EXPORT_STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def export_position(data_folder, name):
+    """
+    Return the position of the last committed export of a csv, for the files derived from it.
+
+    Parameters:
+    - data_folder (str): Folder of the csv and of csv_export_state.json.
+    - name (str): File name of the csv.
+
+    Returns:
+    - dict: {'size': committed size in bytes, 'created': time of the full export it extends}
+
+    Raises:
+    - RuntimeError: If the csv has not been exported.
+    """
+    entry = load_export_state(data_folder).get(name)
+    if not isinstance(entry, dict):
+        raise RuntimeError(f"{name} must be generated first")
+    return {'size': entry['size'], 'created': entry['created']}
+
+
+def read_appended(data_folder, name, since, position, columns, schema_overrides=None):
+    """
+    Return the rows appended to an exported csv between two of its positions.
+
+    The incremental exports only append, so the rows a derived file has not
+    seen are the bytes after the position it was last updated from. Rows
+    appended late with an older seen_at are included, unlike a filter on
+    seen_at above a watermark.
+
+    Parameters:
+    - data_folder (str): Folder of the csv.
+    - name (str): File name of the csv.
+    - since (dict): Position the derived file was updated from, or None.
+    - position (dict): Current position (see export_position).
+    - columns (list): Columns to read.
+    - schema_overrides (dict): Column types (inferred if None).
+
+    Returns:
+    - pl.DataFrame: The appended rows, or None if the csv was exported again
+      since (or since is None), i.e. the derived file must be rebuilt.
+    """
+    if not isinstance(since, dict) or since.get('created') != position['created'] or since.get('size', position['size'] + 1) > position['size']:
+        return None
+    with open(os.path.join(data_folder, name), 'rb') as f:
+        header = f.readline()
+        f.seek(since['size'])
+        appended = f.read(position['size'] - since['size'])
+    return pl.read_csv(header + appended, columns=columns, schema_overrides=schema_overrides)
@@ -0,0 +1,187 @@
+import os
+import numpy as np
+import polars as pl
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from relay_cover import dense_ids, build_incidence
+
+
+class FollowGraph:
+    """
+    Class to represent the kind-3 follow graph as CSR adjacency arrays.
+
+    Pubkeys are mapped to dense integer ids (their rank in sorted order), and
+    edges go from the follower (pubkey_src) to the followed pubkey (pubkey_dst).
+
+    Attributes:
+    - pubkeys: pl.Series, pubkey of every node id
+    - indptr: np.ndarray, CSR row pointers of the out-adjacency (int64)
+    - indices: np.ndarray, CSR column ids of the out-adjacency (uint32)
+
+    Methods:
+    - from_edges(src: pl.Series, dst: pl.Series) -> FollowGraph: build the graph from an edge list
+    - from_csv(path: str) -> FollowGraph: build the graph from pubkey_follow_pubkey.csv
+    - out_degree() -> np.ndarray: number of followed pubkeys per node
+    - in_degree() -> np.ndarray: number of followers per node
+    - pagerank(damping: float, tol: float, max_iter: int) -> np.ndarray: PageRank score per node
+    - core_number() -> np.ndarray: k-core number per node on the undirected graph
+    - components() -> np.ndarray: weakly connected component label per node
+    - to_frame() -> pl.DataFrame: all node metrics as a DataFrame keyed by pubkey
+    """
+
+    def __init__(self, pubkeys: pl.Series, indptr: np.ndarray, indices: np.ndarray) -> None:
+        self.pubkeys = pubkeys
+        self.indptr = indptr
+        self.indices = indices
+        self.n = len(pubkeys)
+
+    @staticmethod
+    def from_edges(src: pl.Series, dst: pl.Series) -> "FollowGraph":
+        """
+        Build a FollowGraph from parallel src/dst pubkey series.
+
+        Parameters:
+        - src: pl.Series, follower pubkeys
+        - dst: pl.Series, followed pubkeys
+
+        Returns:
+        - FollowGraph, graph with one node per distinct pubkey in src or dst
+        """
+        codes, pubkeys = dense_ids(pl.concat([src, dst]).rename('pubkey'))
+        src_codes, dst_codes = codes[:len(src)], codes[len(src):]
+        indptr, indices = build_incidence(src_codes, dst_codes, len(pubkeys))
+        return FollowGraph(pubkeys, indptr, indices)
+
+    @staticmethod
+    def from_csv(path: str) -> "FollowGraph":
+        """
+        Build a FollowGraph from pubkey_follow_pubkey.csv.
+
+        Parameters:
+        - path: str, path to the csv with pubkey_src and pubkey_dst columns
+
+        Returns:
+        - FollowGraph, the follow graph without self loops and duplicate edges
+        """
+        edges = (
+            pl.scan_csv(path)
+            .select(['pubkey_src', 'pubkey_dst'])
+            .drop_nulls()
+            .filter(pl.col('pubkey_src') != pl.col('pubkey_dst'))
+            .unique()
+            .collect()
+        )
+        return FollowGraph.from_edges(edges['pubkey_src'], edges['pubkey_dst'])
+
+    def sources(self) -> np.ndarray:
+        """Return the source node id of every edge, aligned with indices."""
+        return np.repeat(np.arange(self.n, dtype=np.uint32), np.diff(self.indptr))
+
+    def out_degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def in_degree(self) -> np.ndarray:
+        return np.bincount(self.indices, minlength=self.n)
+
+    def pagerank(self, damping: float = 0.85, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+        """
+        Compute PageRank by power iteration over the CSR edges.
+
+        Rank mass of nodes that follow nobody is spread uniformly.
+
+        Parameters:
+        - damping: float, probability of following an edge
+        - tol: float, convergence threshold per node: iteration stops when the L1 change of the scores is below n * tol (as in networkx)
+        - max_iter: int, maximum number of iterations
+
+        Returns:
+        - np.ndarray, PageRank score per node (sums to 1)
+        """
+        if self.n == 0:
+            return np.zeros(0)
+        out_degree = self.out_degree()
+        dangling = out_degree == 0
+        inv_degree = np.zeros(self.n)
+        inv_degree[~dangling] = 1.0 / out_degree[~dangling]
+        sources = self.sources()
+        rank = np.full(self.n, 1.0 / self.n)
+        for _ in range(max_iter):
+            contrib = (rank * inv_degree)[sources]
+            new_rank = np.bincount(self.indices, weights=contrib, minlength=self.n)
+            new_rank = damping * (new_rank + rank[dangling].sum() / self.n) + (1 - damping) / self.n
+            err = np.abs(new_rank - rank).sum()
+            rank = new_rank
+            if err < self.n * tol:
+                break
+        return rank
+
+    def core_number(self) -> np.ndarray:
+        """
+        Compute the k-core number of every node on the undirected graph.
+
+        Nodes are peeled level by level: at level k all nodes with remaining
+        degree below k are removed at once and their neighbours' degrees are
+        decremented with a bincount. Edges between removed nodes are dropped
+        after each level so later levels scan a shrinking edge list.
+
+        Returns:
+        - np.ndarray, core number per node
+        """
+        src = self.sources()
+        dst = self.indices
+        lo = np.minimum(src, dst).astype(np.int64)
+        hi = np.maximum(src, dst).astype(np.int64)
+        pairs = np.unique(lo * self.n + hi)
+        u = (pairs // self.n).astype(np.uint32)
+        v = (pairs % self.n).astype(np.uint32)
+        degree = np.bincount(u, minlength=self.n) + np.bincount(v, minlength=self.n)
+        core = np.zeros(self.n, dtype=np.int64)
+        alive = degree > 0
+        k = 1
+        while alive.any():
+            while True:
+                peel = alive & (degree < k)
+                if not peel.any():
+                    break
+                core[peel] = k - 1
+                alive[peel] = False
+                removed_u = peel[u]
+                removed_v = peel[v]
+                degree -= np.bincount(v[removed_u & ~removed_v], minlength=self.n)
+                degree -= np.bincount(u[removed_v & ~removed_u], minlength=self.n)
+                keep = ~(removed_u | removed_v)
+                u, v = u[keep], v[keep]
+            k += 1
+        return core
+
+    def components(self) -> np.ndarray:
+        """Return the weakly connected component label of every node."""
+        adjacency = csr_matrix(
+            (np.ones(len(self.indices), dtype=np.int8), self.indices, self.indptr), shape=(self.n, self.n))
+        _, labels = connected_components(adjacency, directed=True, connection='weak')
+        return labels
+
+    def to_frame(self) -> pl.DataFrame:
+        """
+        Return the graph metrics of every node.
+
+        Returns:
+        - pl.DataFrame, columns pubkey, in_degree, out_degree, pagerank,
+          core_number, component and component_size
+        """
+        labels = self.components()
+        return pl.DataFrame({
+            'pubkey': self.pubkeys,
+            'in_degree': self.in_degree(),
+            'out_degree': self.out_degree(),
+            'pagerank': self.pagerank(),
+            'core_number': self.core_number(),
+            'component': labels,
+            'component_size': np.bincount(labels)[labels],
+        })
+
+
+def follow_graph_stats(data_folder):
+    """Compute follow graph metrics per pubkey from pubkey_follow_pubkey.csv."""
+    graph = FollowGraph.from_csv(os.path.join(data_folder, 'pubkey_follow_pubkey.csv'))
+    return graph.to_frame().select(['pubkey', 'pagerank', 'core_number', 'component', 'component_size'])
@@ -0,0 +1,230 @@
+import os
+import json
+import numpy as np
+import polars as pl
+from follow_graph import FollowGraph
+
+
+HISTORY_FILE = 'follow_history.parquet'
+PUBKEYS_FILE = 'follow_history_pubkeys.parquet'
+STATE_FILE = 'follow_history_state.json'
+HEADS_FILE = 'follow_history_heads.parquet'
+OPEN = np.iinfo(np.int64).max
+FETCH_ROWS = 50000
+
+
+def _follows(tags):
+    result = set()
+    for tag in tags:
+        if len(tag) >= 2 and tag[0] == 'p' and isinstance(tag[1], str) and len(tag[1]) == 64:
+            result.add(tag[1])
+    return sorted(result)
+
+
+def _write_parquet(df, path):
+    df.write_parquet(path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+
+def load_history(data_folder):
+    """
+    Load the follow history and its pubkey dictionary.
+
+    Parameters:
+    - data_folder (str): Folder containing the history files (None for an
+      empty history).
+
+    Returns:
+    - tuple: (history, pubkeys) where history has columns src_id, dst_id,
+      valid_from, valid_to (OPEN for edges still present) and pubkeys maps
+      id -> pubkey.
+    """
+    if data_folder is None or not os.path.exists(os.path.join(data_folder, HISTORY_FILE)):
+        history = pl.DataFrame(schema={
+            'src_id': pl.UInt32, 'dst_id': pl.UInt32, 'valid_from': pl.Int64, 'valid_to': pl.Int64})
+        pubkeys = pl.DataFrame(schema={'id': pl.UInt32, 'pubkey': pl.String})
+        return history, pubkeys
+    return pl.read_parquet(os.path.join(data_folder, HISTORY_FILE)), pl.read_parquet(os.path.join(data_folder, PUBKEYS_FILE))
+
+
+def apply_follow_lists(history, pubkeys, lists):
+    """
+    Merge new kind-3 follow lists into the history.
+
+    Every follow list replaces the previous one of the same pubkey: edges that
+    disappear get valid_to set to its created_at, and edges that appear open a
+    new interval starting at its created_at. Consecutive lists are compared
+    with a vectorized run detection over (src, dst, list sequence number).
+
+    Parameters:
+    - history (pl.DataFrame): Current history as returned by load_history.
+    - pubkeys (pl.DataFrame): Current id -> pubkey dictionary.
+    - lists (pl.DataFrame): New follow lists with columns pubkey, created_at,
+      following (list of pubkeys), at most one per pubkey and second, none
+      older than the current list of its pubkey.
+
+    Returns:
+    - tuple: (history, pubkeys) updated.
+    """
+    if len(lists) == 0:
+        return history, pubkeys
+    seen = pl.concat([lists['pubkey'], lists['following'].explode().drop_nulls()]).unique()
+    new_pubkeys = pl.DataFrame({'pubkey': seen}).join(pubkeys, on='pubkey', how='anti')
+    pubkeys = pl.concat([pubkeys, new_pubkeys.sort('pubkey').with_row_index('id', offset=len(pubkeys))])
+    lists = (
+        lists
+        .join(pubkeys.rename({'id': 'src_id'}), on='pubkey')
+        .sort(['src_id', 'created_at'])
+        .with_columns(pl.int_range(pl.len()).over('src_id').cast(pl.Int64).alias('seq'))
+    )
+    times = lists.select(['src_id', 'seq', 'created_at'])
+    touched = lists['src_id'].unique()
+    is_open = pl.col('valid_to') == OPEN
+    carried = history.filter(is_open & pl.col('src_id').is_in(touched))
+    history = history.filter(~(is_open & pl.col('src_id').is_in(touched)))
+    members = pl.concat([
+        carried.select(['src_id', 'dst_id', pl.lit(-1, pl.Int64).alias('seq'), pl.col('valid_from')]),
+        lists
+        .select(['src_id', 'seq', 'created_at', 'following'])
+        .explode('following')
+        .drop_nulls('following')
+        .join(pubkeys.rename({'id': 'dst_id', 'pubkey': 'following'}), on='following')
+        .select(['src_id', 'dst_id', 'seq', pl.col('created_at').alias('valid_from')]),
+    ])
+    runs = (
+        members
+        .sort(['src_id', 'dst_id', 'seq'])
+        .with_columns(
+            (pl.col('seq').diff().over(['src_id', 'dst_id']) != 1).fill_null(True).cum_sum().alias('run'))
+        .group_by('run')
+        .agg([
+            pl.first('src_id'),
+            pl.first('dst_id'),
+            pl.first('valid_from'),
+            (pl.last('seq') + 1).alias('end_seq'),
+        ])
+        .join(times.rename({'seq': 'end_seq', 'created_at': 'valid_to'}), on=['src_id', 'end_seq'], how='left')
+        .select(['src_id', 'dst_id', 'valid_from', pl.col('valid_to').fill_null(OPEN)])
+    )
+    history = pl.concat([history, runs]).sort(['valid_from', 'src_id', 'dst_id'])
+    return history, pubkeys
+
+
+def _load_heads(data_folder):
+    if data_folder is None or not os.path.exists(os.path.join(data_folder, HEADS_FILE)):
+        return pl.DataFrame(schema={'pubkey': pl.String, 'created_at': pl.Int64, 'id': pl.String})
+    return pl.read_parquet(os.path.join(data_folder, HEADS_FILE))
+
+
+def update_follow_history(data_folder, bigbrotr):
+    """
+    Scan the kind-3 events first seen after the stored watermark into the history.
+
+    The watermark is the largest events_relays.seen_at scanned, so events
+    ingested late (with an old created_at) are not skipped. Every pubkey keeps
+    the created_at and id of its current list (follow_history_heads.parquet):
+    as for replaceable events in NIP-01, a list replaces it if it is newer, or
+    has the same created_at and a lower id. Lists older than the current one
+    are superseded and ignored.
+
+    Parameters:
+    - data_folder (str): Folder containing the history files.
+    - bigbrotr (psycopg2.connection): Connection to the bigbrotr database.
+
+    Returns:
+    - int: Number of kind-3 events applied to the history.
+    """
+    state_path = os.path.join(data_folder, STATE_FILE)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    if 'seen_at' in state:
+        watermark = state['seen_at']
+        history, pubkeys = load_history(data_folder)
+        heads = _load_heads(data_folder)
+    else:
+        # no state, or a created_at watermark of an older version: rebuild from scratch
+        watermark = -1
+        history, pubkeys = load_history(None)
+        heads = _load_heads(None)
+    # the seen_at aggregate only reads the events_relays rows of kind-3 events
+    query = """
+    SELECT e.id, e.pubkey, e.created_at, e.tags, er.seen_at
+    FROM events e
+    JOIN (
+        SELECT er.event_id, max(er.seen_at) AS seen_at
+        FROM events_relays er
+        JOIN events k ON k.id = er.event_id AND k.kind = 3
+        WHERE er.seen_at > %s
+        GROUP BY er.event_id
+    ) er ON er.event_id = e.id
+    ORDER BY e.pubkey, e.created_at, e.id;
+    """
+    applied = 0
+    # a server-side cursor: the lists are read and applied FETCH_ROWS at a time. They come sorted by
+    # pubkey and created_at, so a batch only holds lists newer than the heads left by the previous ones.
+    with bigbrotr.cursor(name='follow_history') as cursor:
+        cursor.execute(query, (watermark,))
+        while events := cursor.fetchmany(FETCH_ROWS):
+            lists = pl.DataFrame(
+                [(event_id, pubkey, created_at, _follows(tags)) for event_id, pubkey, created_at, tags, _ in events],
+                schema={'id': pl.String, 'pubkey': pl.String, 'created_at': pl.Int64, 'following': pl.List(pl.String)},
+                orient='row'
+            )
+            # Replaceable events: keep only the list with the lowest id per pubkey and second.
+            lists = lists.unique(subset=['pubkey', 'created_at'], keep='first', maintain_order=True)
+            lists = (
+                lists
+                .join(heads.rename({'created_at': 'head_created_at', 'id': 'head_id'}), on='pubkey', how='left')
+                .filter(
+                    pl.col('head_created_at').is_null()
+                    | (pl.col('created_at') > pl.col('head_created_at'))
+                    | ((pl.col('created_at') == pl.col('head_created_at')) & (pl.col('id') < pl.col('head_id')))
+                )
+                .drop(['head_created_at', 'head_id'])
+            )
+            history, pubkeys = apply_follow_lists(history, pubkeys, lists)
+            heads = pl.concat([
+                heads.join(lists.select('pubkey'), on='pubkey', how='anti'),
+                lists.sort(['pubkey', 'created_at']).group_by('pubkey').last().select(['pubkey', 'created_at', 'id']),
+            ])
+            watermark = max(watermark, max(int(event[4]) for event in events))
+            applied += len(lists)
+    _write_parquet(history, os.path.join(data_folder, HISTORY_FILE))
+    _write_parquet(pubkeys, os.path.join(data_folder, PUBKEYS_FILE))
+    _write_parquet(heads, os.path.join(data_folder, HEADS_FILE))
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump({'seen_at': watermark}, f)
+    os.replace(state_path + '.tmp', state_path)
+    return applied
+
+
+def edges_as_of(history, pubkeys, timestamp=None):
+    """
+    Materialize the follow edges valid at a given time.
+
+    Parameters:
+    - history (pl.DataFrame): History as returned by load_history.
+    - pubkeys (pl.DataFrame): id -> pubkey dictionary.
+    - timestamp (int, optional): Unix time; None means the latest snapshot.
+
+    Returns:
+    - pl.DataFrame: pubkey_src, pubkey_dst
+    """
+    if timestamp is None:
+        edges = history.filter(pl.col('valid_to') == OPEN)
+    else:
+        edges = history.filter((pl.col('valid_from') <= timestamp) & (pl.col('valid_to') > timestamp))
+    lookup = pubkeys.sort('id')['pubkey']
+    return pl.DataFrame({
+        'pubkey_src': lookup.gather(edges['src_id']),
+        'pubkey_dst': lookup.gather(edges['dst_id']),
+    })
+
+
+def graph_as_of(data_folder, timestamp=None):
+    """Return the FollowGraph valid at timestamp (latest when None)."""
+    history, pubkeys = load_history(data_folder)
+    edges = edges_as_of(history, pubkeys, timestamp)
+    return FollowGraph.from_edges(edges['pubkey_src'], edges['pubkey_dst'])
@@ -1,104 +1,276 @@
 import os
 import sys
-import psycopg2
+import time
 import numpy as np
 import pandas as pd
 import polars as pl
 from dotenv import load_dotenv
+from relay_cover import generate_relay_cover_csv
+from replication_index import generate_replication_index
+from follow_graph import follow_graph_stats
+from follow_history import update_follow_history, load_history, edges_as_of
+from cohorts import generate_cohort_csvs
+from activity import generate_active_pubkeys_csv
+from events_cube import generate_events_cube
+from pubkey_clusters import generate_pubkey_clusters
+from duckdb_backend import connect_backend, dialect
+from telemetry import Telemetry
+from relay_sync import fetch_relay_last_seen, update_relay_sync_history, latest_snapshot
+from export_state import load_export_state, save_export_state, export_position, read_appended
 
 
 def generate_relay_synchronization_csv(data_folder, bigbrotr):
-    """Generate relay_synchronization.csv if it does not exist."""
-    if 'relay_synchronization.csv' not in os.listdir(data_folder):
-        query = """
-        SELECT
-            latest.relay_url AS relay_url,
-            e.created_at AS timestamp,
-            latest.seen_at AS seen_at
-        FROM (
-            SELECT DISTINCT ON (relay_url)
-                relay_url,
-                seen_at,
-                event_id
-            FROM
-                events_relays
-            ORDER BY
-                relay_url,
-                seen_at DESC
-        ) AS latest
-        JOIN events e ON e.id = latest.event_id;
-        """
-        with bigbrotr.cursor() as cursor:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-        df = pd.DataFrame(rows, columns=['relay_url', 'timestamp', 'seen_at'])
-        df['timestamp_month'] = pd.to_datetime(
-            df['timestamp'], unit='s').dt.to_period('M')
-        df['seen_at_day'] = pd.to_datetime(
-            df['seen_at'], unit='s').dt.to_period('D')
-        df = df.sort_values(
-            by=['seen_at_day', 'timestamp_month'], ascending=True)
-        df.to_csv(os.path.join(
-            data_folder, 'relay_synchronization.csv'), index=False)
-        print("relay_synchronization.csv generated.")
+    """Append today's per-relay sync snapshot to the lag history and write relay_synchronization.csv from it; return its rows."""
+    history = update_relay_sync_history(data_folder, fetch_relay_last_seen(bigbrotr))
+    df = latest_snapshot(history).select(['relay_url', 'timestamp', 'seen_at']).to_pandas()
+    df['timestamp_month'] = pd.to_datetime(
+        df['timestamp'], unit='s').dt.to_period('M')
+    df['seen_at_day'] = pd.to_datetime(
+        df['seen_at'], unit='s').dt.to_period('D')
+    df = df.sort_values(
+        by=['seen_at_day', 'timestamp_month'], ascending=True)
+    df.to_csv(os.path.join(
+        data_folder, 'relay_synchronization.csv'), index=False)
+    print("relay_synchronization.csv generated.")
+    return len(df)
+
+
+# seconds of seen_at read again below the watermark: rows committed up to this long after their seen_at are not lost
+EXPORT_LAG = 3600
+
+
+def _committed_export(path, entry):
+    """
+    Return the saved export state of the csv at path, or None if it must be exported again.
+
+    Rows appended after the state was saved (a run that failed between the
+    append and the save, or during the append) are cut off by truncating the
+    file to its saved size.
+    """
+    if not isinstance(entry, dict) or not os.path.exists(path) or os.path.getsize(path) < entry['size']:
+        return None
+    if os.path.getsize(path) > entry['size']:
+        with open(path, 'r+b') as f:
+            f.truncate(entry['size'])
+    return entry
+
+
+def _export_csv(data_folder, bigbrotr, name, query, keys, stamp, watermark=None):
+    """
+    Export a query to a csv of data_folder, or append to it the rows that previous runs have not written.
+
+    Every row has a stamp (its seen_at, or an upper bound of it) and the
+    watermark is the largest stamp written. Rows are read again from
+    EXPORT_LAG seconds below the watermark, since a writer may commit a row
+    after a later seen_at was exported; the keys already written in that
+    window are kept in an overlap parquet, and are not appended twice. The
+    file size, watermark and overlap file are saved together in
+    csv_export_state.json after the append, so a failed run is rolled back
+    (see _committed_export) and repeated. A full export is only scanned (for
+    its watermark and overlap), never loaded.
+
+    Parameters:
+    - data_folder: str, folder of the csv and of the export state
+    - bigbrotr: connection or DuckDBBackend
+    - name: str, file name of the csv
+    - query: callable, lower -> SQL of the rows stamped after lower (every row when lower is None)
+    - keys: list, columns identifying a row
+    - stamp: callable, () -> pl.Expr stamp of a row, called once the query has run
+    - watermark: Optional[int], watermark of this export (the largest stamp if None)
+
+    Returns:
+    - tuple, (number of rows written, watermark, whether the file was exported again)
+    """
+    state = load_export_state(data_folder)
+    path = os.path.join(data_folder, name)
+    entry = _committed_export(path, state.get(name))
+    lower = None if entry is None else entry['watermark'] - EXPORT_LAG
+    chunk = path + '.tmp'
+    with bigbrotr.cursor() as cur:
+        with open(chunk, 'w') as f:
+            cur.copy_expert(f"COPY ({query(lower)}) TO STDOUT WITH CSV HEADER", f)
+    # read as text, so the appended rows are written back unchanged
+    rows = pl.scan_csv(chunk, infer_schema=False).with_columns(stamp().cast(pl.Int64).alias('_stamp'))
+    if entry is None:
+        count, top = rows.select(pl.len(), pl.col('_stamp').max()).collect(engine='streaming').row(0)
+        if watermark is None:
+            watermark = -1 if top is None else int(top)
+        overlap = rows.filter(pl.col('_stamp') > watermark - EXPORT_LAG).select(*keys, '_stamp').collect(engine='streaming')
+        os.replace(chunk, path)
+        run = 0
+        created = int(time.time())
+    else:
+        overlap = pl.read_parquet(os.path.join(data_folder, entry['overlap']))
+        rows = rows.collect().join(overlap, on=keys, how='anti')
+        with open(path, 'ab') as f:
+            rows.drop('_stamp').write_csv(f, include_header=False)
+        os.remove(chunk)
+        count = len(rows)
+        if watermark is None:
+            watermark = max(entry['watermark'], rows['_stamp'].max() if count else -1)
+        overlap = pl.concat([overlap, rows.select(*keys, '_stamp')])
+        run = entry['run'] + 1
+        created = entry['created']
+    overlap_file = f"{name}.overlap.{run}.parquet"
+    overlap.filter(pl.col('_stamp') > watermark - EXPORT_LAG).write_parquet(os.path.join(data_folder, overlap_file))
+    state[name] = {'size': os.path.getsize(path), 'watermark': watermark, 'overlap': overlap_file, 'run': run, 'created': created}
+    save_export_state(data_folder, state)
+    if entry is not None:
+        os.remove(os.path.join(data_folder, entry['overlap']))
+    return count, watermark, entry is None
+
+
+def generate_events_relays_csv(data_folder, bigbrotr):
+    """Export events_relays.csv, or append to it the rows seen since the previous run (see _export_csv); return the rows written."""
+    def query(lower):
+        sql = "SELECT event_id, relay_url, seen_at FROM events_relays"
+        return sql if lower is None else sql + f" WHERE seen_at > {int(lower)}"
+    rows, _, exported = _export_csv(data_folder, bigbrotr, 'events_relays.csv', query,
+                                    ['event_id', 'relay_url'], lambda: pl.col('seen_at'))
+    if exported:
+        print(f"events_relays.csv generated ({rows} rows).")
     else:
-        print("relay_synchronization.csv already exists.")
+        print(f"events_relays.csv updated ({rows} new rows).")
+    return rows
 
 
 def generate_events_csv(data_folder, bigbrotr):
-    """Generate events.csv if it does not exist."""
-    if "events.csv" not in os.listdir(data_folder):
+    """
+    Export events.csv, or append to it the events first seen since the previous run; return the rows written.
+
+    events.csv follows events_relays.csv (generated first): it holds the
+    events with an events_relays row up to the watermark of events_relays.csv,
+    so every event_id of events_relays.csv has its row. That watermark is the
+    watermark of events.csv, and the stamp of the written events that were
+    seen within EXPORT_LAG of it: only those can be read again by the next
+    run, so only they are kept in the overlap (see _export_csv).
+    """
+    entry = load_export_state(data_folder).get('events_relays.csv')
+    if not isinstance(entry, dict):
+        raise RuntimeError("events_relays.csv must be generated before events.csv")
+    upper = int(entry['watermark'])
+
+    def query(lower):
+        sql = f"""
+        SELECT e.id, e.pubkey, e.created_at, e.kind
+        FROM events e
+        WHERE """
+        if lower is None:
+            return sql + f"EXISTS (SELECT 1 FROM events_relays er WHERE er.event_id = e.id AND er.seen_at <= {upper})"
+        return sql + f"""e.id IN (
+            SELECT event_id FROM events_relays WHERE seen_at > {int(lower)} AND seen_at <= {upper})
+        AND NOT EXISTS (SELECT 1 FROM events_relays er WHERE er.event_id = e.id AND er.seen_at <= {int(lower)})"""
+
+    def stamp():
+        # read after the export, so it includes every row the export could see
         with bigbrotr.cursor() as cur:
-            with open(os.path.join(data_folder, 'events.csv'), 'w') as f:
-                cur.copy_expert(
-                    "COPY (SELECT id, pubkey, created_at, kind FROM events) TO STDOUT WITH CSV HEADER", f)
-        print("events.csv generated.")
+            cur.execute(f"SELECT DISTINCT event_id FROM events_relays WHERE seen_at > {upper - EXPORT_LAG} AND seen_at <= {upper}")
+            recent = pl.Series([row[0] for row in cur.fetchall()], dtype=pl.String)
+        return pl.when(pl.col('id').is_in(recent.implode())).then(upper).otherwise(-1)
+    rows, _, exported = _export_csv(data_folder, bigbrotr, 'events.csv', query, ['id'], stamp, watermark=upper)
+    if exported:
+        print(f"events.csv generated ({rows} rows).")
     else:
-        print("events.csv already exists.")
+        print(f"events.csv updated ({rows} new events).")
+    return rows
 
 
-def generate_events_relays_csv(data_folder, bigbrotr):
-    """Generate events_relays.csv if it does not exist."""
-    if "events_relays.csv" not in os.listdir(data_folder):
-        with bigbrotr.cursor() as cur:
-            with open(os.path.join(data_folder, 'events_relays.csv'), 'w') as f:
-                cur.copy_expert(
-                    "COPY (SELECT event_id, relay_url FROM events_relays) TO STDOUT WITH CSV HEADER", f)
-        print("events_relays.csv generated.")
+def _export_tags(bigbrotr, path, where):
+    """Copy the single-letter tags of the events matching where (on events e) to the csv at path."""
+    with bigbrotr.cursor() as cur:
+        with open(path, 'w') as f:
+            if dialect(bigbrotr) == 'duckdb':
+                cur.copy_expert(f"""
+                    COPY (
+                        SELECT e.id, e.pubkey, e.created_at, e.kind,
+                               t.tag[1] AS name, t.tag[2] AS value, t.tag[4] AS marker
+                        FROM events e, LATERAL (SELECT unnest(e.tags) AS tag) AS t
+                        WHERE length(t.tag[1]) = 1 AND {where}
+                    ) TO STDOUT WITH CSV HEADER""", f)
+            else:
+                cur.copy_expert(f"""
+                    COPY (
+                        SELECT e.id, e.pubkey, e.created_at, e.kind,
+                               t.tag->>0 AS name, t.tag->>1 AS value, t.tag->>3 AS marker
+                        FROM events e
+                        CROSS JOIN LATERAL jsonb_array_elements(e.tags) AS t(tag)
+                        WHERE jsonb_typeof(t.tag) = 'array' AND length(t.tag->>0) = 1 AND {where}
+                    ) TO STDOUT WITH CSV HEADER""", f)
+
+
+def generate_tag_index(data_folder, bigbrotr):
+    """
+    Build the inverted tag index (tag_index*.parquet) of the events of events.csv, or merge into it the events appended since.
+
+    The index records the position (see export_position) and watermark of
+    events.csv it covers. The events appended to events.csv since then all
+    have an events_relays row seen within EXPORT_LAG of that watermark (see
+    generate_events_csv), so only the tags of events seen since are
+    exported, and those of the appended events are merged. A new export of
+    events.csv rebuilds the index.
+    Returns the number of postings added.
+    """
+    position = export_position(data_folder, 'events.csv')
+    watermark = int(load_export_state(data_folder)['events.csv']['watermark'])
+    source = {**position, 'watermark': watermark}
+    index = TagIndex(data_folder) if TagIndex.exists(data_folder) else None
+    new_ids = None
+    if index is not None:
+        indexed = index.meta['source'] or {}
+        if {key: indexed.get(key) for key in position} == position:
+            print("tag index already up to date.")
+            return 0
+        new_ids = read_appended(data_folder, 'events.csv', indexed, position, ['id'], {'id': pl.String})
+    path = os.path.join(data_folder, 'tags.csv.tmp')
+    schema = {'id': pl.String, 'name': pl.String, 'value': pl.String, 'marker': pl.String}
+    if new_ids is None:
+        _export_tags(bigbrotr, path, f"EXISTS (SELECT 1 FROM events_relays er WHERE er.event_id = e.id AND er.seen_at <= {watermark})")
+        postings = 0
+        index = TagIndex.build(data_folder, pl.scan_csv(path, schema_overrides=schema), source)
+        print("tag index generated.")
     else:
-        print("events_relays.csv already exists.")
+        lower = int(indexed['watermark']) - EXPORT_LAG
+        _export_tags(bigbrotr, path, f"e.id IN (SELECT event_id FROM events_relays WHERE seen_at > {lower})")
+        tags = pl.scan_csv(path, schema_overrides=schema).join(new_ids.lazy(), on='id', how='semi')
+        postings = index.meta['n_postings']
+        index = index.merge(tags, source)
+        print(f"tag index updated ({len(new_ids)} new events, {index.meta['n_events']} tagged events).")
+    os.remove(path)
+    return index.meta['n_postings'] - postings
+
+
+def generate_timeline_index(data_folder):
+    """Build the per-pubkey timeline index, or merge into it the events appended to events.csv since its last update; return the events added."""
+    position = export_position(data_folder, 'events.csv')
+    columns = ['id', 'pubkey', 'created_at', 'kind']
+    index = TimelineIndex(data_folder) if TimelineIndex.exists(data_folder) else None
+    new_events = None
+    if index is not None:
+        schema = {'id': pl.String, 'pubkey': pl.String, 'created_at': pl.Int64, 'kind': pl.Int32}
+        new_events = read_appended(data_folder, 'events.csv', index.meta.get('source'), position, columns, schema)
+    if new_events is None:
+        if index is not None:
+            index.close()
+        events = pl.scan_csv(os.path.join(data_folder, 'events.csv')).select(columns)
+        index = TimelineIndex.build(data_folder, events.collect(), position)
+        print("timeline index generated.")
+        return index.meta['n_events']
+    index.merge(new_events, position)
+    print(f"timeline index updated ({len(new_events)} new events).")
+    return len(new_events)
 
 
 def generate_pubkey_follow_pubkey_csv(data_folder, bigbrotr):
-    """Generate pubkey_follow_pubkey.csv if it does not exist."""
-    def process_tags_3(tags):
-        result = set()
-        for tag in tags:
-            if len(tag) >= 2 and tag[0] == 'p' and len(tag[1]) == 64:
-                result.add(tag[1])
-        return list(result)
-    if 'pubkey_follow_pubkey.csv' not in os.listdir(data_folder):
-        query = """
-        SELECT DISTINCT ON (pubkey) pubkey, tags
-        FROM events
-        WHERE kind = 3
-        ORDER BY pubkey, created_at DESC;
-        """
-        with bigbrotr.cursor() as cursor:
-            cursor.execute(query)
-            events = cursor.fetchall()
-        events_df = pd.DataFrame(events, columns=['pubkey', 'tags'])
-        events_df['following'] = events_df['tags'].apply(process_tags_3)
-        events_df = events_df.drop(columns=['tags'])
-        events_df = events_df.explode('following')
-        events_df = events_df.rename(
-            columns={'pubkey': 'pubkey_src', 'following': 'pubkey_dst'})
-        events_df = events_df.drop_duplicates()
-        events_df.to_csv(os.path.join(
-            data_folder, 'pubkey_follow_pubkey.csv'), index=False)
+    """Update the follow history and generate pubkey_follow_pubkey.csv from its latest snapshot."""
+    new_events = update_follow_history(data_folder, bigbrotr)
+    print(f"follow_history.parquet updated ({new_events} kind-3 events applied).")
+    if 'pubkey_follow_pubkey.csv' not in os.listdir(data_folder) or new_events > 0:
+        history, pubkeys = load_history(data_folder)
+        edges_as_of(history, pubkeys).write_csv(
+            os.path.join(data_folder, 'pubkey_follow_pubkey.csv'))
         print("pubkey_follow_pubkey.csv generated.")
     else:
-        print("pubkey_follow_pubkey.csv already exists.")
+        print("pubkey_follow_pubkey.csv already up to date.")
 
 
 def generate_pubkey_rw_relay_csv(data_folder, bigbrotr):
@@ -152,25 +324,45 @@ def generate_relay_stats_csv(data_folder, bigbrotr):
     # TODO: add all relay_metadata information to relay_stats.csv
     """Generate relay_stats.csv if it does not exist."""
     if 'relay_stats.csv' not in os.listdir(data_folder):
-        events_relays = pl.read_csv(
-            os.path.join(DATA_FOLDER, 'events_relays.csv'))
-        events = pl.read_csv(os.path.join(
-            DATA_FOLDER, 'events.csv')).rename({'id': 'event_id'})
-        events_relays = events_relays.join(events, on='event_id', how='left')
-        relay_stats = events_relays.group_by("relay_url").agg([
-            pl.col("event_id").n_unique().alias("num_events"),
-            pl.col("pubkey").n_unique().alias("num_pubkeys"),
-            pl.col("created_at").min().alias("first_eventdate"),
-            pl.col("created_at").max().alias("last_eventdate")
-        ])
-        nunique_pubkeys = events_relays.select(
-            pl.col("pubkey").n_unique()).to_numpy()[0][0]
-        nunique_events = events_relays.select(
-            pl.col("event_id").n_unique()).to_numpy()[0][0]
-        relay_stats = relay_stats.with_columns([
-            (pl.col("num_events") / nunique_events * 100).alias("pct_events"),
-            (pl.col("num_pubkeys") / nunique_pubkeys * 100).alias("pct_pubkeys"),
-        ])
+        if dialect(bigbrotr) == 'duckdb':
+            # Same aggregation on the embedded engine, which spills to disk instead of loading both csvs.
+            relay_stats = bigbrotr.frame("""
+            WITH joined AS (
+                SELECT er.relay_url, er.event_id, e.pubkey, e.created_at
+                FROM events_relays er
+                LEFT JOIN events e ON e.id = er.event_id
+            )
+            SELECT
+                relay_url,
+                count(DISTINCT event_id) AS num_events,
+                count(DISTINCT pubkey) AS num_pubkeys,
+                min(created_at) AS first_eventdate,
+                max(created_at) AS last_eventdate,
+                count(DISTINCT event_id) * 100.0 / (SELECT count(DISTINCT event_id) FROM joined) AS pct_events,
+                count(DISTINCT pubkey) * 100.0 / (SELECT count(DISTINCT pubkey) FROM joined) AS pct_pubkeys
+            FROM joined
+            GROUP BY relay_url
+            """)
+        else:
+            events_relays = pl.read_csv(
+                os.path.join(DATA_FOLDER, 'events_relays.csv'))
+            events = pl.read_csv(os.path.join(
+                DATA_FOLDER, 'events.csv')).rename({'id': 'event_id'})
+            events_relays = events_relays.join(events, on='event_id', how='left')
+            relay_stats = events_relays.group_by("relay_url").agg([
+                pl.col("event_id").n_unique().alias("num_events"),
+                pl.col("pubkey").n_unique().alias("num_pubkeys"),
+                pl.col("created_at").min().alias("first_eventdate"),
+                pl.col("created_at").max().alias("last_eventdate")
+            ])
+            nunique_pubkeys = events_relays.select(
+                pl.col("pubkey").n_unique()).to_numpy()[0][0]
+            nunique_events = events_relays.select(
+                pl.col("event_id").n_unique()).to_numpy()[0][0]
+            relay_stats = relay_stats.with_columns([
+                (pl.col("num_events") / nunique_events * 100).alias("pct_events"),
+                (pl.col("num_pubkeys") / nunique_pubkeys * 100).alias("pct_pubkeys"),
+            ])
         query = """
         SELECT
             url AS relay_url,
@@ -193,34 +385,11 @@ def generate_pubkey_stats_csv(data_folder):
     # TODO: add for example n_relay_coverage and other stats to pubkey_stats.csv
     """Generate pubkey_stats.csv if it does not exist."""
     if 'pubkey_stats.csv' not in os.listdir(data_folder):
-        events = pl.read_csv(os.path.join(data_folder, 'events.csv'))
         pubkey_follow_pubkey = pl.read_csv(
             os.path.join(data_folder, 'pubkey_follow_pubkey.csv'))
         pubkey_rw_relay = pl.read_csv(
             os.path.join(data_folder, 'pubkey_rw_relay.csv'))
-        pubkey_stats = (
-            events
-            .sort(["pubkey", "created_at"])
-            .group_by("pubkey")
-            .agg([
-                pl.len().alias("event_count"),
-                pl.min("created_at").alias("first_eventdate"),
-                pl.max("created_at").alias("last_eventdate"),
-                pl.col("created_at").diff().alias("intervals")
-            ])
-            .explode("intervals")
-            .group_by("pubkey")
-            .agg([
-                pl.first("event_count"),
-                pl.first("first_eventdate"),
-                pl.first("last_eventdate"),
-                (pl.first("last_eventdate") -
-                 pl.first("first_eventdate")).alias("lifespan"),
-                pl.mean("intervals").alias("mean_interval"),
-                pl.median("intervals").alias("median_interval"),
-                pl.std("intervals").alias("std_interval")
-            ])
-        )
+        pubkey_stats = TimelineIndex(data_folder).interval_stats().drop('max_interval')
         pubkey_stats = pubkey_stats.join(
             pubkey_rw_relay.group_by("pubkey").agg([
                 (pl.when(pl.col("read")).then(1).otherwise(
@@ -245,9 +414,15 @@ def generate_pubkey_stats_csv(data_folder):
             on="pubkey",
             how="left"
         )
+        pubkey_stats = pubkey_stats.join(
+            follow_graph_stats(data_folder),
+            on="pubkey",
+            how="left"
+        )
         pubkey_stats = pubkey_stats.with_columns(
             pl.col('followers_count').fill_null(0),
-            pl.col('following_count').fill_null(0)
+            pl.col('following_count').fill_null(0),
+            pl.col('core_number').fill_null(0)
         )
         pubkey_stats.write_csv(os.path.join(data_folder, 'pubkey_stats.csv'))
         print("pubkey_stats.csv generated.")
@@ -261,19 +436,36 @@ if __name__ == "__main__":
     LIB_FOLDER = os.getenv("LIB_FOLDER")
     sys.path.append(LIB_FOLDER)
     from relay import Relay
-    bigbrotr = psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        dbname=os.getenv("DB_NAME")
+    from tag_index import TagIndex
+    from timeline_index import TimelineIndex
+    telemetry = Telemetry(
+        DATA_FOLDER,
+        explain=os.getenv("TELEMETRY_EXPLAIN", "false").lower() == "true",
+        profile_stage=os.getenv("TELEMETRY_PROFILE_STAGE")
     )
-    generate_relay_synchronization_csv(DATA_FOLDER, bigbrotr)
-    generate_events_csv(DATA_FOLDER, bigbrotr)
-    generate_events_relays_csv(DATA_FOLDER, bigbrotr)
-    generate_pubkey_follow_pubkey_csv(DATA_FOLDER, bigbrotr)
-    generate_pubkey_rw_relay_csv(DATA_FOLDER, bigbrotr)
-    generate_relay_stats_csv(DATA_FOLDER, bigbrotr)
-    generate_pubkey_stats_csv(DATA_FOLDER)
-    print("All data files generated successfully.")
-    bigbrotr.close()
+    bigbrotr = telemetry.trace(connect_backend())
+    stages = [
+        ('relay_synchronization', lambda: generate_relay_synchronization_csv(DATA_FOLDER, bigbrotr)),
+        ('events_relays', lambda: generate_events_relays_csv(DATA_FOLDER, bigbrotr)),
+        ('events', lambda: generate_events_csv(DATA_FOLDER, bigbrotr)),
+        ('tag_index', lambda: generate_tag_index(DATA_FOLDER, bigbrotr)),
+        ('timeline_index', lambda: generate_timeline_index(DATA_FOLDER)),
+        ('pubkey_follow_pubkey', lambda: generate_pubkey_follow_pubkey_csv(DATA_FOLDER, bigbrotr)),
+        ('pubkey_rw_relay', lambda: generate_pubkey_rw_relay_csv(DATA_FOLDER, bigbrotr)),
+        ('relay_stats', lambda: generate_relay_stats_csv(DATA_FOLDER, bigbrotr)),
+        ('pubkey_stats', lambda: generate_pubkey_stats_csv(DATA_FOLDER)),
+        ('pubkey_clusters', lambda: generate_pubkey_clusters(DATA_FOLDER, k=10)),
+        ('cohorts', lambda: generate_cohort_csvs(DATA_FOLDER)),
+        ('events_cube', lambda: generate_events_cube(DATA_FOLDER)),
+        ('active_pubkeys', lambda: generate_active_pubkeys_csv(DATA_FOLDER)),
+        ('relay_cover', lambda: generate_relay_cover_csv(DATA_FOLDER)),
+        ('replication_index', lambda: generate_replication_index(DATA_FOLDER, bigbrotr)),
+    ]
+    try:
+        for name, stage in stages:
+            with telemetry.stage(name) as record:
+                record['rows_out'] = stage()
+        print("All data files generated successfully.")
+    finally:
+        telemetry.write_report()
+        bigbrotr.close()
@@ -0,0 +1,338 @@
+import os
+import json
+import numpy as np
+import polars as pl
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial.distance import cdist
+
+
+FEATURES_FILE = 'pubkey_features.f32'
+FEATURES_META = 'pubkey_features.json'
+FEATURES_INDEX = 'pubkey_features_pubkeys.parquet'
+SWEEP_FILE = 'pubkey_clusters_sweep.csv'
+
+FEATURE_COLUMNS = [
+    'event_count',
+    'first_eventdate',
+    'last_eventdate',
+    'lifespan',
+    'mean_interval',
+    'median_interval',
+    'std_interval',
+    'followers_count',
+    'following_count',
+    'read_relay_count',
+    'write_relay_count',
+]
+MIN_EVENT_COUNT = 2
+MIN_FIRST_EVENTDATE = 1669852800  # 2022-12-01
+
+CHUNK = 1 << 16
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_feature_matrix(data_folder, force=False):
+    """
+    Build (or reuse) the standardized float32 feature matrix of pubkey_stats.csv.
+
+    Pubkeys with more than MIN_EVENT_COUNT events and a first event after
+    MIN_FIRST_EVENTDATE are kept. Every column is centered and scaled to unit
+    variance (nulls become 0, the mean) and the matrix is stored row-major in
+    pubkey_features.f32, together with the pubkey of every row. The cache is
+    rebuilt only when pubkey_stats.csv changes.
+
+    Parameters:
+    - data_folder (str): Folder containing pubkey_stats.csv.
+    - force (bool): Rebuild even if the cache is up to date.
+
+    Returns:
+    - dict: Metadata (columns, mean, std, shape, fingerprint).
+    """
+    stats_path = os.path.join(data_folder, 'pubkey_stats.csv')
+    meta_path = os.path.join(data_folder, FEATURES_META)
+    if not force and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['fingerprint'] == _fingerprint(stats_path) and meta['columns'] == FEATURE_COLUMNS:
+            return meta
+    df = (
+        pl.scan_csv(stats_path)
+        .filter((pl.col('event_count') > MIN_EVENT_COUNT) & (pl.col('first_eventdate') > MIN_FIRST_EVENTDATE))
+        .select(['pubkey'] + [pl.col(c).cast(pl.Float64) for c in FEATURE_COLUMNS])
+        .collect()
+    )
+    x = df.select(FEATURE_COLUMNS).to_numpy()
+    mean = np.nan_to_num(df.select(pl.col(FEATURE_COLUMNS).mean()).to_numpy()[0].astype(np.float64))
+    std = df.select(pl.col(FEATURE_COLUMNS).std(ddof=0)).to_numpy()[0].astype(np.float64)
+    std[~(std > 0)] = 1.0
+    x = np.nan_to_num((x - mean) / std).astype(np.float32)
+    path = os.path.join(data_folder, FEATURES_FILE)
+    x.tofile(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    index_path = os.path.join(data_folder, FEATURES_INDEX)
+    df.select('pubkey').write_parquet(index_path + '.tmp', compression='zstd')
+    os.replace(index_path + '.tmp', index_path)
+    meta = {
+        'columns': FEATURE_COLUMNS,
+        'mean': mean.tolist(),
+        'std': std.tolist(),
+        'shape': list(x.shape),
+        'fingerprint': _fingerprint(stats_path),
+    }
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return meta
+
+
+def load_feature_matrix(data_folder):
+    """Return the cached feature matrix as a read-only float32 memmap (see build_feature_matrix)."""
+    with open(os.path.join(data_folder, FEATURES_META)) as f:
+        shape = tuple(json.load(f)['shape'])
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=np.float32)
+    return np.memmap(os.path.join(data_folder, FEATURES_FILE), dtype=np.float32, mode='r', shape=shape)
+
+
+def _squared_distances(x, centers, centers_sq):
+    d = (x * x).sum(axis=1)[:, None] - 2 * x @ centers.T + centers_sq[None, :]
+    return np.maximum(d, 0, out=d)
+
+
+def assign(x, centers):
+    """
+    Assign every row of x to its nearest center, streaming over chunks of rows.
+
+    Parameters:
+    - x (np.ndarray): Feature matrix (a memmap is read chunk by chunk).
+    - centers (np.ndarray): Centers, shape (k, d).
+
+    Returns:
+    - tuple: (labels int32 array, inertia float).
+    """
+    centers = centers.astype(np.float32)
+    centers_sq = (centers * centers).sum(axis=1)
+    labels = np.empty(len(x), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(x), CHUNK):
+        d = _squared_distances(np.asarray(x[start:start + CHUNK]), centers, centers_sq)
+        labels[start:start + CHUNK] = d.argmin(axis=1)
+        inertia += float(d.min(axis=1).sum())
+    return labels, inertia
+
+
+def _kmeans_plus_plus(x, k, rng):
+    centers = np.empty((k, x.shape[1]), dtype=np.float32)
+    centers[0] = x[rng.integers(len(x))]
+    closest = ((x - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        j = rng.choice(len(x), p=closest / total) if total > 0 else rng.integers(len(x))
+        centers[i] = x[j]
+        closest = np.minimum(closest, ((x - centers[i]) ** 2).sum(axis=1))
+    return centers
+
+
+def minibatch_kmeans(x, k, batch_size=4096, max_iter=300, tol=1e-4, patience=10, n_init=3, seed=42):
+    """
+    Mini-batch k-means (Sculley, 2010) with k-means++ initialization on a sample.
+
+    The best of n_init k-means++ seedings (by inertia on the sample) is kept.
+
+    Every iteration moves the centers towards the mean of a random batch with
+    a per-center learning rate 1/count, so only batch_size rows are read per
+    iteration. It stops after max_iter iterations or when the centers moved
+    less than tol (squared, relative to the number of features) for patience
+    consecutive iterations.
+
+    Parameters:
+    - x (np.ndarray): Standardized feature matrix (may be a memmap).
+    - k (int): Number of clusters.
+    - batch_size (int): Rows per iteration.
+    - max_iter (int): Maximum number of iterations.
+    - tol (float): Convergence threshold on the center shift.
+    - patience (int): Iterations below tol needed to stop.
+    - n_init (int): Number of k-means++ seedings.
+    - seed (int): Random seed.
+
+    Returns:
+    - np.ndarray: Centers, shape (k, d), float32.
+    """
+    n = len(x)
+    if not 0 < k <= n:
+        raise ValueError(f"k must be between 1 and the number of rows ({n}), not {k}")
+    rng = np.random.default_rng(seed)
+    init_idx = np.sort(rng.choice(n, min(n, max(10 * k, batch_size)), replace=False))
+    init_sample = np.asarray(x[init_idx], dtype=np.float32)
+    centers = min(
+        (_kmeans_plus_plus(init_sample, k, rng) for _ in range(max(1, n_init))),
+        key=lambda c: assign(init_sample, c)[1]
+    )
+    counts = np.zeros(k, dtype=np.float64)
+    quiet = 0
+    for _ in range(max_iter):
+        batch = np.asarray(x[np.sort(rng.integers(0, n, min(batch_size, n)))], dtype=np.float32)
+        labels = _squared_distances(batch, centers, (centers * centers).sum(axis=1)).argmin(axis=1)
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=batch[:, j], minlength=k) for j in range(x.shape[1])], axis=1)
+        counts += batch_counts
+        hit = batch_counts > 0
+        new = centers.astype(np.float64)
+        new[hit] += (sums[hit] - batch_counts[hit, None] * new[hit]) / counts[hit, None]
+        shift = float(((new - centers) ** 2).sum()) / x.shape[1]
+        centers = new.astype(np.float32)
+        quiet = quiet + 1 if shift < tol else 0
+        if quiet >= patience:
+            break
+    return centers
+
+
+def sampled_silhouette(x, labels, sample_size=10000, seed=42):
+    """
+    Estimate the silhouette score on a sample stratified by cluster.
+
+    Every cluster contributes rows in proportion to its size (at least 2 when
+    possible), so small clusters are not lost and memory is
+    O(sample_size^2 / chunks) instead of O(n^2).
+
+    Parameters:
+    - x (np.ndarray): Feature matrix.
+    - labels (np.ndarray): Cluster of every row.
+    - sample_size (int): Number of rows to sample.
+    - seed (int): Random seed.
+
+    Returns:
+    - float: Mean silhouette of the sampled rows (nan with fewer than 2 clusters).
+    """
+    rng = np.random.default_rng(seed)
+    clusters, sizes = np.unique(labels, return_counts=True)
+    if len(clusters) < 2:
+        return float('nan')
+    quota = np.minimum(sizes, np.maximum(2, np.round(sample_size * sizes / sizes.sum()).astype(np.int64)))
+    idx = np.sort(np.concatenate([
+        rng.choice(np.flatnonzero(labels == c), q, replace=False) for c, q in zip(clusters, quota)
+    ]))
+    sample = np.asarray(x[idx], dtype=np.float64)
+    sample_labels = np.searchsorted(clusters, labels[idx])
+    sample_sizes = np.bincount(sample_labels, minlength=len(clusters)).astype(np.float64)
+    onehot = np.zeros((len(idx), len(clusters)))
+    onehot[np.arange(len(idx)), sample_labels] = 1.0
+    scores = np.empty(len(idx))
+    for start in range(0, len(idx), 1024):
+        d = cdist(sample[start:start + 1024], sample)
+        sums = d @ onehot
+        own = sample_labels[start:start + 1024]
+        rows = np.arange(len(d))
+        own_size = sample_sizes[own] - 1
+        a = np.divide(sums[rows, own], own_size, out=np.zeros(len(d)), where=own_size > 0)
+        means = sums / sample_sizes
+        means[rows, own] = np.inf
+        b = means.min(axis=1)
+        s = (b - a) / np.maximum(a, b)
+        scores[start:start + 1024] = np.where(own_size > 0, np.nan_to_num(s), 0.0)
+    return float(scores.mean())
+
+
+def _evaluate_k(args):
+    data_folder, k, sample_size, seed = args
+    x = load_feature_matrix(data_folder)
+    centers = minibatch_kmeans(x, k, seed=seed)
+    labels, inertia = assign(x, centers)
+    return k, inertia, sampled_silhouette(x, labels, sample_size, seed), centers
+
+
+def kmeans_sweep(data_folder, k_range=range(2, 25), workers=None, sample_size=10000, seed=42):
+    """
+    Fit mini-batch k-means for every k in k_range in parallel and score each fit.
+
+    Workers open the cached feature matrix as a memmap, so it is shared
+    through the page cache instead of being pickled to every process.
+
+    Parameters:
+    - data_folder (str): Folder containing pubkey_stats.csv.
+    - k_range (iterable): Values of k to try.
+    - workers (int, optional): Number of processes. Defaults to os.cpu_count().
+    - sample_size (int): Rows of the sampled silhouette.
+    - seed (int): Random seed.
+
+    Returns:
+    - tuple: (pl.DataFrame with columns k, inertia, silhouette; dict k -> centers).
+    """
+    build_feature_matrix(data_folder)
+    tasks = [(data_folder, k, sample_size, seed) for k in k_range]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = sorted(pool.map(_evaluate_k, tasks), key=lambda r: r[0])
+    sweep = pl.DataFrame(
+        [(k, inertia, silhouette) for k, inertia, silhouette, _ in results],
+        schema={'k': pl.Int64, 'inertia': pl.Float64, 'silhouette': pl.Float64},
+        orient='row'
+    )
+    return sweep, {k: centers for k, _, _, centers in results}
+
+
+def best_k(sweep):
+    """Return the k maximizing 0.5 * normalized (inverted) inertia + 0.5 * normalized silhouette."""
+    inertia = sweep['inertia'].to_numpy()
+    silhouette = sweep['silhouette'].to_numpy()
+
+    def normalize(a):
+        span = a.max() - a.min()
+        return (a - a.min()) / span if span > 0 else np.zeros_like(a)
+
+    combined = 0.5 * (1 - normalize(inertia)) + 0.5 * normalize(silhouette)
+    return int(sweep['k'][int(np.argmax(combined))])
+
+
+def write_cluster_labels(data_folder, labels, column='cluster'):
+    """
+    Write cluster labels back to pubkey_stats.csv as a column (null for pubkeys not clustered).
+
+    Parameters:
+    - data_folder (str): Folder containing pubkey_stats.csv and the feature cache.
+    - labels (np.ndarray): Cluster of every row of the feature matrix.
+    - column (str): Name of the column.
+    """
+    stats_path = os.path.join(data_folder, 'pubkey_stats.csv')
+    pubkeys = pl.read_parquet(os.path.join(data_folder, FEATURES_INDEX))
+    clusters = pubkeys.with_columns(pl.Series(column, labels, dtype=pl.Int32))
+    pubkey_stats = pl.read_csv(stats_path)
+    if column in pubkey_stats.columns:
+        pubkey_stats = pubkey_stats.drop(column)
+    pubkey_stats = pubkey_stats.join(clusters, on='pubkey', how='left')
+    pubkey_stats.write_csv(stats_path + '.tmp')
+    os.replace(stats_path + '.tmp', stats_path)
+    # Only the new column changed: keep the feature cache valid.
+    meta_path = os.path.join(data_folder, FEATURES_META)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta['fingerprint'] = _fingerprint(stats_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def generate_pubkey_clusters(data_folder, k=None, k_range=range(2, 25), workers=None):
+    """
+    Cluster pubkeys and add the cluster column to pubkey_stats.csv if it is missing.
+
+    Parameters:
+    - data_folder (str): Folder containing pubkey_stats.csv.
+    - k (int, optional): Number of clusters. If None it is chosen with best_k over k_range.
+    - k_range (iterable): Values of k of the sweep (written to pubkey_clusters_sweep.csv).
+    - workers (int, optional): Number of processes of the sweep.
+    """
+    with open(os.path.join(data_folder, 'pubkey_stats.csv')) as f:
+        if 'cluster' in f.readline().rstrip('\n').split(','):
+            print("pubkey_stats.csv already has clusters.")
+            return
+    sweep, centers = kmeans_sweep(data_folder, k_range, workers)
+    sweep.write_csv(os.path.join(data_folder, SWEEP_FILE))
+    k = best_k(sweep) if k is None else k
+    x = load_feature_matrix(data_folder)
+    labels, _ = assign(x, centers[k] if k in centers else minibatch_kmeans(x, k))
+    write_cluster_labels(data_folder, labels)
+    print(f"pubkey_stats.csv clusters generated (k={k}).")
@@ -0,0 +1,282 @@
+import os
+import heapq
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# bytes of csv read per batch when streaming events.csv and events_relays.csv
+CSV_BLOCK = 16 << 20
+
+
+def dense_ids(series):
+    """
+    Encode a column of strings as dense integer ids.
+
+    Parameters:
+    - series (pl.Series): The values to encode (e.g. event ids, relay urls).
+
+    Returns:
+    - tuple: (codes, values) where codes is a uint32 numpy array with one id
+      per row and values is the sorted pl.Series of distinct values, so that
+      values[codes[i]] == series[i].
+    """
+    codes = (series.rank('dense') - 1).cast(pl.UInt32).to_numpy()
+    values = series.unique().sort()
+    return codes, values
+
+
+def build_incidence(set_codes, element_codes, n_sets):
+    """
+    Build the CSR incidence structure set -> elements.
+
+    Parameters:
+    - set_codes (np.ndarray): Integer set id (relay) of every membership.
+    - element_codes (np.ndarray): Integer element id (event/pubkey) of every membership.
+    - n_sets (int): Number of distinct sets.
+
+    Returns:
+    - tuple: (indptr, indices) where the elements of set s are
+      indices[indptr[s]:indptr[s + 1]].
+    """
+    order = np.argsort(set_codes, kind='stable')
+    indices = element_codes[order]
+    indptr = np.zeros(n_sets + 1, dtype=np.int64)
+    np.cumsum(np.bincount(set_codes, minlength=n_sets), out=indptr[1:])
+    return indptr, indices
+
+
+def _csv_batches(path, columns):
+    """Read columns of a csv as text, in polars frames of about CSV_BLOCK bytes of the file."""
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK),
+        convert_options=pacsv.ConvertOptions(include_columns=columns, column_types={c: pa.string() for c in columns}),
+    )
+    for batch in reader:
+        yield pl.from_arrow(batch)
+
+
+def hex_keys(series):
+    """
+    Return 64-bit integer keys of hex strings (their first 16 digits).
+
+    Event ids are sha256 hashes and pubkeys are curve points, so the keys of
+    distinct values collide with negligible probability (about 1e-3 for 2e8
+    values) and stand in for the strings when encoding them as dense ids.
+
+    Parameters:
+    - series (pl.Series): Hex strings of at least 16 digits.
+
+    Returns:
+    - np.ndarray: uint64 key of every value.
+    """
+    high = series.str.slice(0, 8).str.to_integer(base=16).to_numpy().astype(np.uint64)
+    low = series.str.slice(8, 8).str.to_integer(base=16).to_numpy().astype(np.uint64)
+    return (high << np.uint64(32)) | low
+
+
+def _unique_rows(indptr, indices):
+    """Sort and deduplicate the elements of every CSR row, compacting indices in place."""
+    new_indptr = np.zeros_like(indptr)
+    end = 0
+    for s in range(len(indptr) - 1):
+        row = np.unique(indices[indptr[s]:indptr[s + 1]])
+        indices[end:end + len(row)] = row
+        end += len(row)
+        new_indptr[s + 1] = end
+    return new_indptr, indices[:end]
+
+
+def load_relay_incidence(data_folder, element='event_id'):
+    """
+    Load the relay x element incidence from events_relays.csv.
+
+    The csv files are streamed: relay urls are encoded with a dictionary of
+    the (few) distinct urls, and events and pubkeys with their hex_keys
+    against the events of events.csv. Only int32 codes are kept per
+    membership, and the CSR is filled by a counting sort, so the memory is
+    about 12 bytes per membership. Memberships of events without a row in
+    events.csv are ignored (generate_data.py exports every event of
+    events_relays.csv).
+
+    Parameters:
+    - data_folder (str): Folder containing events_relays.csv and events.csv.
+    - element (str): 'event_id' or 'pubkey'.
+
+    Returns:
+    - tuple: (relay_urls, indptr, indices, n_elements)
+
+    Raises:
+    - ValueError: if element is not 'event_id' or 'pubkey'
+    """
+    if element not in ['event_id', 'pubkey']:
+        raise ValueError(f"element must be 'event_id' or 'pubkey', not {element}")
+    # event dictionary: sorted keys of the events, with the element of each event
+    event_keys, element_keys = [], []
+    for batch in _csv_batches(os.path.join(data_folder, 'events.csv'), ['id', 'pubkey'] if element == 'pubkey' else ['id']):
+        event_keys.append(hex_keys(batch['id']))
+        if element == 'pubkey':
+            element_keys.append(hex_keys(batch['pubkey']))
+    event_keys = np.concatenate(event_keys) if event_keys else np.zeros(0, dtype=np.uint64)
+    order = np.argsort(event_keys)
+    event_keys = event_keys[order]
+    if element == 'pubkey':
+        _, element_of = np.unique(np.concatenate(element_keys)[order], return_inverse=True)
+        element_of = element_of.astype(np.int32)
+    del order, element_keys
+    # memberships as int32 (relay, element) codes, relays in order of appearance
+    relays = {}
+    relay_batches, element_batches = [], []
+    for batch in _csv_batches(os.path.join(data_folder, 'events_relays.csv'), ['event_id', 'relay_url']):
+        for url in batch['relay_url'].unique():
+            relays.setdefault(url, len(relays))
+        keys = hex_keys(batch['event_id'])
+        positions = np.minimum(np.searchsorted(event_keys, keys), max(len(event_keys) - 1, 0))
+        found = event_keys[positions] == keys if len(event_keys) else np.zeros(len(keys), dtype=bool)
+        relay_batches.append(batch['relay_url'].replace_strict(relays, return_dtype=pl.Int32).to_numpy()[found])
+        positions = positions[found].astype(np.int32)
+        element_batches.append(positions if element == 'event_id' else element_of[positions])
+    del event_keys
+    relay_urls = pl.Series('relay_url', list(relays), dtype=pl.String).sort()
+    remap = np.zeros(len(relays), dtype=np.int32)
+    remap[[relays[url] for url in relay_urls]] = np.arange(len(relays), dtype=np.int32)
+    # counting sort of the memberships by relay
+    counts = np.zeros(len(relays), dtype=np.int64)
+    for i, codes in enumerate(relay_batches):
+        relay_batches[i] = remap[codes]
+        counts += np.bincount(relay_batches[i], minlength=len(relays))
+    indptr = np.zeros(len(relays) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    cursor = indptr[:-1].copy()
+    while relay_batches:
+        codes, elements = relay_batches.pop(0), element_batches.pop(0)
+        order = np.argsort(codes, kind='stable')
+        codes, elements = codes[order], elements[order]
+        batch_counts = np.bincount(codes, minlength=len(relays))
+        first = np.cumsum(batch_counts) - batch_counts
+        indices[cursor[codes] + np.arange(len(codes)) - first[codes]] = elements
+        cursor += batch_counts
+    indptr, indices = _unique_rows(indptr, indices)
+    # dense element ids: only the elements with a membership
+    present = np.zeros(int(indices.max()) + 1 if len(indices) else 0, dtype=bool)
+    present[indices] = True
+    dense = np.cumsum(present, dtype=np.int64).astype(np.int32) - 1
+    return relay_urls, indptr, dense[indices], int(present.sum())
+
+
+def lazy_greedy_cover(indptr, indices, n_elements, k=None, target=None):
+    """
+    Select relays greedily by marginal coverage using lazy evaluation.
+
+    Coverage is submodular, so a marginal gain computed in an earlier round is
+    an upper bound of the current one: a relay is only re-evaluated when it
+    reaches the top of the priority queue, and it is selected as soon as its
+    fresh gain is not smaller than the next stale bound.
+
+    Parameters:
+    - indptr (np.ndarray): CSR row pointers (one row per relay).
+    - indices (np.ndarray): CSR element ids.
+    - n_elements (int): Total number of distinct elements.
+    - k (int, optional): Maximum number of relays to select.
+    - target (float, optional): Stop once this fraction (0-1] of the elements is covered.
+
+    Returns:
+    - tuple: (selected, gains) numpy arrays with the relay ids in selection
+      order and the number of new elements each one covered.
+    """
+    n_sets = len(indptr) - 1
+    k = n_sets if k is None else min(k, n_sets)
+    needed = n_elements if target is None else int(np.ceil(target * n_elements))
+    covered = np.zeros(n_elements, dtype=bool)
+    sizes = np.diff(indptr)
+    heap = [(-int(size), int(s)) for s, size in enumerate(sizes) if size > 0]
+    heapq.heapify(heap)
+    selected = []
+    gains = []
+    n_covered = 0
+    while heap and len(selected) < k and n_covered < needed:
+        _, s = heapq.heappop(heap)
+        members = indices[indptr[s]:indptr[s + 1]]
+        gain = len(members) - int(np.count_nonzero(covered[members]))
+        if gain == 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, s))
+            continue
+        covered[members] = True
+        n_covered += gain
+        selected.append(s)
+        gains.append(gain)
+    return np.array(selected, dtype=np.int64), np.array(gains, dtype=np.int64)
+
+
+def max_coverage(data_folder, k, element='event_id'):
+    """
+    Find the K relays that together cover the most distinct events or pubkeys.
+
+    Parameters:
+    - data_folder (str): Folder containing the exported csv files.
+    - k (int): Number of relays to select.
+    - element (str): 'event_id' or 'pubkey'.
+
+    Returns:
+    - pl.DataFrame: relay_url, gain, covered and pct_covered in selection order.
+    """
+    relay_urls, indptr, indices, n_elements = load_relay_incidence(data_folder, element)
+    selected, gains = lazy_greedy_cover(indptr, indices, n_elements, k=k)
+    return _cover_frame(relay_urls, selected, gains, n_elements)
+
+
+def min_cover(data_folder, target, element='event_id'):
+    """
+    Find a small relay set covering at least a fraction of the events or pubkeys.
+
+    The greedy solution is within a ln(n) factor of the optimal set cover.
+
+    Parameters:
+    - data_folder (str): Folder containing the exported csv files.
+    - target (float): Fraction of elements to cover, in (0, 1].
+    - element (str): 'event_id' or 'pubkey'.
+
+    Returns:
+    - pl.DataFrame: relay_url, gain, covered and pct_covered in selection order.
+
+    Raises:
+    - ValueError: if target is not in (0, 1]
+    """
+    if not 0 < target <= 1:
+        raise ValueError(f"target must be in (0, 1], not {target}")
+    relay_urls, indptr, indices, n_elements = load_relay_incidence(data_folder, element)
+    selected, gains = lazy_greedy_cover(indptr, indices, n_elements, target=target)
+    return _cover_frame(relay_urls, selected, gains, n_elements)
+
+
+def _cover_frame(relay_urls, selected, gains, n_elements):
+    covered = np.cumsum(gains)
+    return pl.DataFrame({
+        'relay_url': relay_urls.gather(selected),
+        'gain': gains,
+        'covered': covered,
+        'pct_covered': covered / max(n_elements, 1) * 100,
+    })
+
+
+def generate_relay_cover_csv(data_folder):
+    """Generate relay_cover.csv if it does not exist."""
+    if 'relay_cover.csv' not in os.listdir(data_folder):
+        frames = []
+        for element, name in [('event_id', 'events'), ('pubkey', 'pubkeys')]:
+            relay_urls, indptr, indices, n_elements = load_relay_incidence(data_folder, element)
+            selected, gains = lazy_greedy_cover(indptr, indices, n_elements)
+            frames.append(
+                _cover_frame(relay_urls, selected, gains, n_elements)
+                .with_row_index('step', offset=1)
+                .with_columns(pl.lit(name).alias('element'))
+            )
+        pl.concat(frames).select(['element', 'step', 'relay_url', 'gain', 'covered', 'pct_covered']).write_csv(
+            os.path.join(data_folder, 'relay_cover.csv'))
+        print("relay_cover.csv generated.")
+    else:
+        print("relay_cover.csv already exists.")
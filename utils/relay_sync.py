@@ -0,0 +1,223 @@
+import os
+import datetime
+import polars as pl
+from duckdb_backend import dialect
+
+
+HISTORY_FILE = 'relay_sync_history.parquet'
+RELAY_SEEN_INDEX = 'events_relays_relay_url_seen_at_idx'
+
+SCHEMA = {
+    'day': pl.Date,
+    'relay_url': pl.String,
+    'timestamp': pl.Int64,
+    'seen_at': pl.Int64,
+    'lag': pl.Int64,
+}
+
+
+def relay_seen_index_state(bigbrotr):
+    """
+    Return the state of the (relay_url, seen_at DESC) index on events_relays.
+
+    Parameters:
+    - bigbrotr (psycopg2.connection): Connection to the bigbrotr database.
+
+    Returns:
+    - str: 'valid', 'invalid' (left by an interrupted concurrent build) or 'missing'.
+    """
+    with bigbrotr.cursor() as cursor:
+        cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s);", (RELAY_SEEN_INDEX,))
+        rows = cursor.fetchall()
+    bigbrotr.commit()
+    if not rows:
+        return 'missing'
+    return 'valid' if rows[0][0] else 'invalid'
+
+
+def create_relay_seen_index(bigbrotr):
+    """
+    Create the (relay_url, seen_at DESC) index on events_relays used by the skip scan.
+
+    This is an explicit migration (python relay_sync.py --create-index), never
+    run by generate_data.py, which may connect with a read-only role. The index
+    is built with CREATE INDEX CONCURRENTLY, so writers of events_relays are not
+    blocked; as the statement cannot run in a transaction block, the connection
+    is switched to autocommit for its duration. An invalid index left by an
+    interrupted build is dropped and built again.
+
+    Parameters:
+    - bigbrotr (psycopg2.connection): Connection to the bigbrotr database.
+
+    Raises:
+    - psycopg2.Error: if the role cannot create the index.
+    """
+    state = relay_seen_index_state(bigbrotr)
+    if state == 'valid':
+        return
+    autocommit = bigbrotr.autocommit
+    bigbrotr.autocommit = True
+    try:
+        with bigbrotr.cursor() as cursor:
+            if state == 'invalid':
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {RELAY_SEEN_INDEX};")
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {RELAY_SEEN_INDEX} ON events_relays (relay_url, seen_at DESC);")
+    finally:
+        bigbrotr.autocommit = autocommit
+
+
+def fetch_relay_last_seen(bigbrotr):
+    """
+    Return the latest events_relays row of every relay with the created_at of its event.
+
+    When the (relay_url, seen_at DESC) index exists (see
+    create_relay_seen_index), relays are enumerated with a recursive CTE skip
+    scan (one index probe per relay) and each relay's newest row is read with
+    a LIMIT 1 lateral lookup, so the cost grows with the number of relays
+    instead of the size of events_relays. Without it every probe would be a
+    scan, so the DISTINCT ON query (one sort of events_relays) is used. On a
+    DuckDB backend, which scans instead of probing indexes, the newest row of
+    every relay is a single arg_max aggregation.
+
+    Parameters:
+    - bigbrotr (psycopg2.connection): Connection to the bigbrotr database.
+
+    Returns:
+    - pl.DataFrame: Columns relay_url, timestamp (event created_at) and seen_at.
+    """
+    query = """
+    WITH RECURSIVE relays AS (
+        (SELECT relay_url FROM events_relays ORDER BY relay_url LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT er.relay_url
+            FROM events_relays er
+            WHERE er.relay_url > relays.relay_url
+            ORDER BY er.relay_url
+            LIMIT 1
+        )
+        FROM relays
+        WHERE relays.relay_url IS NOT NULL
+    )
+    SELECT relays.relay_url, e.created_at, latest.seen_at
+    FROM relays
+    CROSS JOIN LATERAL (
+        SELECT er.event_id, er.seen_at
+        FROM events_relays er
+        WHERE er.relay_url = relays.relay_url
+        ORDER BY er.seen_at DESC
+        LIMIT 1
+    ) AS latest
+    JOIN events e ON e.id = latest.event_id
+    WHERE relays.relay_url IS NOT NULL;
+    """
+    if dialect(bigbrotr) == 'postgres' and relay_seen_index_state(bigbrotr) != 'valid':
+        query = """
+        SELECT latest.relay_url, e.created_at, latest.seen_at
+        FROM (
+            SELECT DISTINCT ON (relay_url) relay_url, seen_at, event_id
+            FROM events_relays
+            ORDER BY relay_url, seen_at DESC
+        ) AS latest
+        JOIN events e ON e.id = latest.event_id;
+        """
+    elif dialect(bigbrotr) == 'duckdb':
+        query = """
+        SELECT latest.relay_url, e.created_at, latest.seen_at
+        FROM (
+            SELECT relay_url, arg_max(event_id, seen_at) AS event_id, max(seen_at) AS seen_at
+            FROM events_relays
+            GROUP BY relay_url
+        ) AS latest
+        JOIN events e ON e.id = latest.event_id;
+        """
+    with bigbrotr.cursor() as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    return pl.DataFrame(
+        rows, schema={'relay_url': pl.String, 'timestamp': pl.Int64, 'seen_at': pl.Int64}, orient='row')
+
+
+def load_relay_sync_history(data_folder):
+    """Return the stored relay synchronization history (empty if it does not exist yet)."""
+    path = os.path.join(data_folder, HISTORY_FILE)
+    if not os.path.exists(path):
+        return pl.DataFrame(schema=SCHEMA)
+    return pl.read_parquet(path)
+
+
+def update_relay_sync_history(data_folder, snapshot, day=None):
+    """
+    Append a per-relay synchronization snapshot to the daily lag history.
+
+    A second snapshot taken on the same day replaces the first one, so the
+    history holds at most one row per relay and day. The lag is seen_at minus
+    the created_at of the last event seen, in seconds.
+
+    Parameters:
+    - data_folder (str): Folder where relay_sync_history.parquet is stored.
+    - snapshot (pl.DataFrame): Output of fetch_relay_last_seen.
+    - day (datetime.date, optional): Day of the snapshot. Defaults to today (UTC).
+
+    Returns:
+    - pl.DataFrame: The updated history.
+    """
+    day = day or datetime.datetime.now(datetime.timezone.utc).date()
+    snapshot = snapshot.select(
+        pl.lit(day, dtype=pl.Date).alias('day'),
+        'relay_url',
+        'timestamp',
+        'seen_at',
+        (pl.col('seen_at') - pl.col('timestamp')).alias('lag'),
+    ).cast(SCHEMA)
+    history = load_relay_sync_history(data_folder).filter(pl.col('day') != day)
+    history = pl.concat([history, snapshot]).sort(['day', 'relay_url'])
+    path = os.path.join(data_folder, HISTORY_FILE)
+    history.write_parquet(path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+    return history
+
+
+def latest_snapshot(history):
+    """Return the rows of the most recent day of the history."""
+    if history.is_empty():
+        return history
+    return history.filter(pl.col('day') == pl.col('day').max())
+
+
+def daily_lag(history, unit='d'):
+    """
+    Pivot the history into a relay x day lag matrix.
+
+    Parameters:
+    - history (pl.DataFrame): Output of load_relay_sync_history.
+    - unit (str): 's' for seconds, 'h' for hours or 'd' for days.
+
+    Returns:
+    - pl.DataFrame: One row per relay_url, one column per day.
+    """
+    divisor = {'s': 1, 'h': 3600, 'd': 86400}[unit]
+    return (
+        history
+        .with_columns((pl.col('lag') / divisor).alias('lag'), pl.col('day').cast(pl.String))
+        .pivot(on='day', index='relay_url', values='lag')
+        .sort('relay_url')
+    )
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    from duckdb_backend import connect_backend
+    load_dotenv()
+    if sys.argv[1:] != ['--create-index']:
+        print("usage: python relay_sync.py --create-index")
+        sys.exit(1)
+    bigbrotr = connect_backend()
+    if dialect(bigbrotr) != 'postgres':
+        print("the index is only used on Postgres.")
+        sys.exit(1)
+    create_relay_seen_index(bigbrotr)
+    print(f"{RELAY_SEEN_INDEX} is {relay_seen_index_state(bigbrotr)}.")
+    bigbrotr.close()
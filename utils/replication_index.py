@@ -0,0 +1,165 @@
+import os
+import json
+import polars as pl
+from export_state import export_position, read_appended
+
+
+EVENT_INDEX = 'event_replication.parquet'
+PUBKEY_RELAY_INDEX = 'pubkey_relay.parquet'
+STATE_FILE = 'replication_state.json'
+
+
+def _load_state(data_folder):
+    path = os.path.join(data_folder, STATE_FILE)
+    if not os.path.exists(path):
+        return {'source': None, 'readable_relays': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(data_folder, state):
+    path = os.path.join(data_folder, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def _write_parquet(df, path):
+    df.write_parquet(path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+
+def fetch_readable_relays(bigbrotr):
+    """
+    Return the relays whose latest relay_metadata row says they are readable.
+
+    Parameters:
+    - bigbrotr (psycopg2.connection): Connection to the bigbrotr database.
+
+    Returns:
+    - list: Sorted list of relay urls.
+    """
+    query = """
+    SELECT relay_url
+    FROM (
+        SELECT DISTINCT ON (relay_url) relay_url, readable
+        FROM relay_metadata
+        ORDER BY relay_url, generated_at DESC
+    ) AS latest
+    WHERE readable;
+    """
+    with bigbrotr.cursor() as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def update_replication_index(data_folder, readable_relays):
+    """
+    Incrementally update the event replication index.
+
+    Only the events_relays rows appended to events_relays.csv since the
+    stored position are aggregated (a new export of events_relays.csv
+    rebuilds the index). Rows already indexed, the first rows of the csv,
+    are re-read only for relays whose readability changed since the last
+    run, to adjust num_readable.
+
+    Parameters:
+    - data_folder (str): Folder containing events_relays.csv, events.csv and their export state.
+    - readable_relays (list): Relay urls currently considered readable.
+
+    Returns:
+    - tuple: (number of new memberships, number of relays whose readability changed)
+    """
+    state = _load_state(data_folder)
+    indexed = state.get('source')
+    position = export_position(data_folder, 'events_relays.csv')
+    old_readable = set(state['readable_relays'])
+    new_readable = set(readable_relays)
+    changed = sorted(old_readable ^ new_readable)
+    event_path = os.path.join(data_folder, EVENT_INDEX)
+    pairs_path = os.path.join(data_folder, PUBKEY_RELAY_INDEX)
+    events_relays = pl.scan_csv(os.path.join(data_folder, 'events_relays.csv')).select(
+        ['event_id', 'relay_url', 'seen_at'])
+    schema = {'event_id': pl.String, 'relay_url': pl.String, 'seen_at': pl.Int64}
+    new = read_appended(data_folder, 'events_relays.csv', indexed, position, list(schema), schema)
+    if new is None or not os.path.exists(event_path) or not os.path.exists(pairs_path):
+        # first run, or events_relays.csv was exported again: index every row
+        new = events_relays.collect()
+        indexed = None
+    readable = pl.col('relay_url').is_in(sorted(new_readable))
+    delta = new.group_by('event_id').agg([
+        pl.len().cast(pl.UInt16).alias('num_relays'),
+        readable.sum().cast(pl.Int32).alias('num_readable'),
+        pl.col('seen_at').min().alias('first_seen_at'),
+        pl.col('seen_at').max().alias('last_seen_at'),
+    ])
+    if changed and indexed is not None:
+        flips = (
+            events_relays
+            .head(indexed['rows'])
+            .filter(pl.col('relay_url').is_in(changed))
+            .group_by('event_id')
+            .agg(readable.cast(pl.Int32).mul(2).sub(1).sum().alias('num_readable'))
+            .with_columns([
+                pl.lit(0, pl.UInt16).alias('num_relays'),
+                pl.lit(None, pl.Int64).alias('first_seen_at'),
+                pl.lit(None, pl.Int64).alias('last_seen_at'),
+            ])
+            .collect()
+        )
+        delta = pl.concat([delta, flips.select(delta.columns)], how='vertical_relaxed')
+    if indexed is not None:
+        index = pl.read_parquet(event_path).with_columns(pl.col('num_readable').cast(pl.Int32))
+        delta = pl.concat([index.select(delta.columns), delta], how='vertical_relaxed')
+    index = delta.group_by('event_id').agg([
+        pl.col('num_relays').sum().cast(pl.UInt16),
+        pl.col('num_readable').sum().cast(pl.UInt16),
+        pl.col('first_seen_at').min(),
+        pl.col('last_seen_at').max(),
+    ]).sort('event_id')
+    pubkeys = pl.scan_csv(os.path.join(data_folder, 'events.csv')).select([
+        pl.col('id').alias('event_id'), 'pubkey'])
+    pairs = new.lazy().join(pubkeys, on='event_id', how='inner').select(
+        ['pubkey', 'relay_url']).unique().collect()
+    if indexed is not None:
+        pairs = pl.concat([pl.read_parquet(pairs_path), pairs]).unique()
+    _write_parquet(index, event_path)
+    _write_parquet(pairs.sort(['pubkey', 'relay_url']), pairs_path)
+    rows = len(new) + (indexed['rows'] if indexed is not None else 0)
+    _save_state(data_folder, {'source': {**position, 'rows': rows}, 'readable_relays': sorted(new_readable)})
+    return len(new), len(changed)
+
+
+def event_replication(data_folder):
+    """Lazily scan the per-event replication index."""
+    return pl.scan_parquet(os.path.join(data_folder, EVENT_INDEX))
+
+
+def pubkey_replication(data_folder):
+    """
+    Per-pubkey number of distinct relays and of currently readable relays.
+
+    Parameters:
+    - data_folder (str): Folder containing the replication index.
+
+    Returns:
+    - pl.LazyFrame: pubkey, num_relays, num_readable
+    """
+    readable_relays = _load_state(data_folder)['readable_relays']
+    return pl.scan_parquet(os.path.join(data_folder, PUBKEY_RELAY_INDEX)).group_by('pubkey').agg([
+        pl.len().alias('num_relays'),
+        pl.col('relay_url').is_in(readable_relays).sum().alias('num_readable'),
+    ])
+
+
+def events_with_live_replicas(data_folder, n=1):
+    """Return the events that have exactly n currently readable replicas."""
+    return event_replication(data_folder).filter(pl.col('num_readable') == n).collect()
+
+
+def generate_replication_index(data_folder, bigbrotr):
+    """Create or incrementally update the event replication index; return the number of new memberships."""
+    new_rows, changed = update_replication_index(data_folder, fetch_readable_relays(bigbrotr))
+    print(f"{EVENT_INDEX} updated ({new_rows} new memberships, {changed} relays changed readability).")
+    return new_rows
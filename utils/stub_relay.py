@@ -0,0 +1,123 @@
+import json
+import asyncio
+import argparse
+from aiohttp import web, WSMsgType
+
+
+def match_filter(event, flt):
+    """Return True if event matches a NIP-01 filter (ids, authors, kinds, #x tags, since, until)."""
+    if 'ids' in flt and event['id'] not in flt['ids']:
+        return False
+    if 'authors' in flt and event['pubkey'] not in flt['authors']:
+        return False
+    if 'kinds' in flt and event['kind'] not in flt['kinds']:
+        return False
+    if 'since' in flt and event['created_at'] < flt['since']:
+        return False
+    if 'until' in flt and event['created_at'] > flt['until']:
+        return False
+    for key, values in flt.items():
+        if key.startswith('#') and len(key) == 2:
+            if not any(len(tag) >= 2 and tag[0] == key[1] and tag[1] in values for tag in event['tags']):
+                return False
+    return True
+
+
+class StubRelay:
+    """
+    Minimal local stand-in for a nostr relay, to test and benchmark probers and syncers.
+
+    It answers NIP-11 requests over HTTP and REQ/EVENT/CLOSE messages over
+    websocket on the same port, replaying a fixed list of events (newest first,
+    as real relays do) and accepting every published event.
+    """
+
+    def __init__(self, events=None, name='stub relay', latency=0.0, max_limit=500):
+        self.events = sorted(events or [], key=lambda e: e['created_at'], reverse=True)
+        self.name = name
+        self.latency = latency
+        self.max_limit = max_limit
+        self.runner = None
+        self.port = None
+
+    def nip11(self):
+        return {
+            'name': self.name,
+            'description': 'local stand-in relay',
+            'supported_nips': [1, 11],
+            'software': 'bigbrotr-stub-relay',
+            'version': '0',
+            'limitation': {'max_limit': self.max_limit},
+        }
+
+    async def handle(self, request):
+        if request.headers.get('Upgrade', '').lower() != 'websocket':
+            await asyncio.sleep(self.latency)
+            return web.Response(text=json.dumps(self.nip11()), content_type='application/nostr+json')
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                message = json.loads(msg.data)
+            except ValueError:
+                await ws.send_str(json.dumps(['NOTICE', 'invalid message']))
+                continue
+            await asyncio.sleep(self.latency)
+            if message[0] == 'REQ':
+                sub_id, filters = message[1], message[2:]
+                for flt in filters:
+                    limit = min(flt.get('limit', self.max_limit), self.max_limit)
+                    sent = 0
+                    for event in self.events:
+                        if sent >= limit:
+                            break
+                        if match_filter(event, flt):
+                            await ws.send_str(json.dumps(['EVENT', sub_id, event]))
+                            sent += 1
+                await ws.send_str(json.dumps(['EOSE', sub_id]))
+            elif message[0] == 'EVENT':
+                event = message[1]
+                self.events.insert(0, event)
+                await ws.send_str(json.dumps(['OK', event.get('id'), True, '']))
+            elif message[0] == 'CLOSE':
+                await ws.send_str(json.dumps(['CLOSED', message[1], '']))
+        return ws
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start serving and return the relay url (wss:// form, to be reached with scheme 'ws')."""
+        app = web.Application()
+        app.router.add_get('/', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"wss://{host}:{self.port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def load_ndjson(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def serve(n, events, port, latency):
+    relays = [StubRelay(events, name=f'stub relay {i}', latency=latency) for i in range(n)]
+    for i, relay in enumerate(relays):
+        print(await relay.start(port=port + i if port else 0))
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-in nostr relays.")
+    parser.add_argument('--relays', type=int, default=1, help="number of relays (one port each)")
+    parser.add_argument('--events', help="NDJSON file with the events to replay")
+    parser.add_argument('--port', type=int, default=0, help="first port (0 = random ports)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of delay per message")
+    args = parser.parse_args()
+    events = load_ndjson(args.events) if args.events else []
+    asyncio.run(serve(args.relays, events, args.port, args.latency))
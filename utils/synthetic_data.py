@@ -0,0 +1,337 @@
+import io
+import os
+import sys
+import json
+import base64
+import hashlib
+import argparse
+import numpy as np
+import polars as pl
+import multiprocessing
+
+
+TABLES = ['events', 'events_relays', 'relays', 'relay_metadata']
+# share of every kind in the public network (approximate)
+KIND_MIX = {
+    1: 0.40, 7: 0.25, 6: 0.05, 9735: 0.05, 4: 0.04, 1059: 0.03, 3: 0.03, 30078: 0.02,
+    9734: 0.02, 22242: 0.02, 0: 0.02, 10002: 0.01, 10000: 0.01, 1063: 0.01, 5: 0.01,
+    30023: 0.005, 1984: 0.005,
+}
+HASHTAGS = ['nostr', 'bitcoin', 'zap', 'plebchain', 'grownostr', 'art', 'photography', 'music',
+            'news', 'meme', 'foodstr', 'asknostr', 'introductions', 'lightning', 'dev']
+WORDS = ['gm', 'nostr', 'the', 'relay', 'zap', 'bitcoin', 'is', 'a', 'to', 'of', 'and', 'freedom',
+         'protocol', 'note', 'keys', 'sats', 'pura', 'vida', 'hello', 'world', 'client', 'today']
+DAY = 86400
+
+# set in every worker by _init_worker
+_state = {}
+
+
+def zipf_sampler(n, exponent, rng):
+    """
+    Return a function drawing ranks in [0, n) with probability proportional to (rank + 1) ** -exponent.
+
+    The distribution is truncated at n and sampled by inverse CDF, so any
+    exponent (also below 1) is allowed.
+
+    Parameters:
+    - n (int): Number of ranks.
+    - exponent (float): Zipf exponent.
+    - rng (np.random.Generator): Random generator.
+
+    Returns:
+    - callable: size -> np.ndarray of ranks.
+    """
+    cdf = np.cumsum(np.arange(1, n + 1, dtype=np.float64) ** -exponent)
+    cdf /= cdf[-1]
+    return lambda size: np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), n - 1)
+
+
+def _keypairs(chunk):
+    """Return the (seckey, pubkey) pairs of a range of pubkey ranks, derived from the seed."""
+    start, stop, seed, signed = chunk
+    import secp256k1
+    pairs = []
+    for rank in range(start, stop):
+        seckey = hashlib.sha256(b'%d:%d' % (seed, rank)).digest()
+        if signed:
+            pubkey = secp256k1.PrivateKey(seckey).pubkey.serialize(compressed=True)[1:]
+            pairs.append((seckey.hex(), pubkey.hex()))
+        else:
+            pairs.append((None, hashlib.sha256(seckey).hexdigest()))
+    return pairs
+
+
+def _onion_host(index):
+    """Return a well-formed v3 onion host (56 base32 characters) for a relay index."""
+    return base64.b32encode(hashlib.sha512(b'relay%d' % index).digest()[:35]).decode().lower()
+
+
+def _init_worker(state):
+    _state.update(state)
+
+
+def _tags(kind, rng, samplers, targets):
+    """Return the tags of a synthetic event of a kind: follow lists, relay lists, replies, reactions and hashtags."""
+    pubkeys, relays = _state['pubkeys'], _state['relays']
+    if kind == 3:
+        follows = np.unique(samplers['pubkey'](int(min(rng.lognormal(4.0, 1.2), 5000)) + 1))
+        return [['p', pubkeys[i]] for i in follows.tolist()]
+    if kind == 10002:
+        tags = []
+        for i in np.unique(samplers['relay'](int(rng.integers(1, 9)))).tolist():
+            marker = rng.random()
+            tags.append(['r', relays[i]] if marker < 0.7 else ['r', relays[i], 'read' if marker < 0.85 else 'write'])
+        return tags
+    if kind in (6, 7, 9735) and targets:
+        target_id, target_pubkey = targets[int(rng.integers(len(targets)))]
+        return [['e', target_id], ['p', target_pubkey]]
+    if kind == 1:
+        tags = []
+        if targets and rng.random() < 0.3:
+            target_id, target_pubkey = targets[int(rng.integers(len(targets)))]
+            tags += [['e', target_id, '', 'root'], ['p', target_pubkey]]
+        if rng.random() < 0.2:
+            tags += [['t', HASHTAGS[i]] for i in np.unique(samplers['hashtag'](int(rng.integers(1, 4)))).tolist()]
+        return tags
+    return []
+
+
+def _content(kind, rng):
+    if kind == 1:
+        return ' '.join(WORDS[i] for i in rng.integers(0, len(WORDS), int(rng.integers(3, 40))).tolist())
+    if kind == 7:
+        return '+' if rng.random() < 0.8 else '🤙'
+    if kind == 0:
+        return json.dumps({'name': f'user{int(rng.integers(10 ** 9))}', 'about': 'synthetic'})
+    return ''
+
+
+def _generate_chunk(chunk):
+    """
+    Generate a chunk of events and their events_relays rows.
+
+    Events are generated in created_at order, so replies, reposts,
+    reactions and zaps can reference earlier notes of the chunk.
+
+    Parameters:
+    - chunk (tuple): (chunk index, number of events, seed).
+
+    Returns:
+    - tuple: (chunk index, events, events_relays), frames with fmt 'postgres' and row counts otherwise
+    """
+    from utils import serialize_event, sig_event_id
+    index, n_events, seed = chunk
+    config, pubkeys, seckeys, relays = _state['config'], _state['pubkeys'], _state['seckeys'], _state['relays']
+    rng = np.random.default_rng(seed)
+    samplers = {
+        'pubkey': zipf_sampler(len(pubkeys), config['pubkey_exponent'], rng),
+        'relay': zipf_sampler(len(relays), config['relay_exponent'], rng),
+        'hashtag': zipf_sampler(len(HASHTAGS), 1.2, rng),
+    }
+    kind_values = np.array(list(config['kind_mix']))
+    weights = np.array(list(config['kind_mix'].values()), dtype=np.float64)
+    authors = samplers['pubkey'](n_events)
+    kinds = kind_values[rng.choice(len(kind_values), n_events, p=weights / weights.sum())]
+    # every pubkey posts uniformly inside its own active window: first seen time and lognormal lifespan
+    first_seen, lifespan = _state['first_seen'], _state['lifespan']
+    created_at = (first_seen[authors] + rng.random(n_events) * lifespan[authors]).astype(np.int64)
+    order = np.argsort(created_at, kind='stable')
+    authors, kinds, created_at = authors[order], kinds[order], created_at[order]
+    ids, tags, contents, sigs, targets = [], [], [], [], []
+    buf = bytearray()
+    for author, kind, ts in zip(authors.tolist(), kinds.tolist(), created_at.tolist()):
+        event_tags = _tags(kind, rng, samplers, targets)
+        content = _content(kind, rng)
+        event_id = hashlib.sha256(serialize_event(pubkeys[author], ts, kind, event_tags, content, buf)).hexdigest()
+        if config['signed']:
+            sigs.append(sig_event_id(event_id, seckeys[author]))
+        if kind == 1:
+            targets.append((event_id, pubkeys[author]))
+        ids.append(event_id)
+        tags.append(json.dumps(event_tags, separators=(',', ':'), ensure_ascii=False))
+        contents.append(content)
+    if not config['signed']:
+        sigs = pl.Series(np.frombuffer(rng.bytes(64 * n_events), dtype='V64').tolist(), dtype=pl.Binary).bin.encode('hex')
+    events = pl.DataFrame({
+        'id': ids,
+        'pubkey': pl.Series(pubkeys).gather(authors),
+        'created_at': created_at,
+        'kind': kinds.astype(np.int32),
+        'tags': tags,
+        'content': contents,
+        'sig': sigs,
+    })
+    # every event is seen on a geometric number of relays picked by popularity, some time after its creation
+    copies = rng.geometric(config['relay_p'], n_events)
+    rows = np.repeat(np.arange(n_events), copies)
+    pairs = np.unique(rows * len(relays) + samplers['relay'](len(rows)))
+    rows, relay_idx = pairs // len(relays), pairs % len(relays)
+    events_relays = pl.DataFrame({
+        'event_id': pl.Series(ids).gather(rows),
+        'relay_url': pl.Series(relays).gather(relay_idx),
+        'seen_at': created_at[rows] + rng.exponential(config['mean_lag'], len(rows)).astype(np.int64),
+    })
+    if config['format'] != 'postgres':
+        _write_part(events, config['output'], 'events', index, config['format'])
+        _write_part(events_relays, config['output'], 'events_relays', index, config['format'])
+        return index, len(events), len(events_relays)
+    return index, events, events_relays
+
+
+def _write_part(df, output, table, index, fmt):
+    """Write a part of a table in the snapshot layout read by DuckDBBackend (table/part-NNNNN.fmt)."""
+    folder = os.path.join(output, table)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'part-{index:05d}.{fmt}')
+    if fmt == 'parquet':
+        df.write_parquet(path + '.tmp', compression='zstd')
+    else:
+        df.write_csv(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def _copy(bigbrotr, table, df):
+    """COPY a frame into a table of the bigbrotr database."""
+    buf = io.StringIO()
+    df.write_csv(buf)
+    buf.seek(0)
+    with bigbrotr.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH CSV HEADER", buf)
+    bigbrotr.commit()
+
+
+def generate_dataset(output, n_events, n_pubkeys, n_relays=500, fmt='parquet', signed=False, processes=None,
+                     chunk_size=200000, start=1609459200, end=1735689600, pubkey_exponent=1.1,
+                     relay_exponent=1.0, relay_p=0.35, mean_lag=3600, kind_mix=None, seed=0, bigbrotr=None):
+    """
+    Generate a synthetic nostr dataset with the skew of the real network.
+
+    Pubkey activity and relay popularity are Zipf-distributed, kinds follow
+    KIND_MIX, kind 3 events carry follow lists ('p' tags) and kind 10002
+    events relay lists ('r' tags with read/write markers), replies, reposts,
+    reactions and zaps reference earlier notes, and every event is seen on
+    a geometric number of relays. Event ids are real NIP-01 ids; signatures
+    are random bytes unless signed is True (valid BIP-340 signatures, much
+    slower). Chunks are generated by a pool of processes and written as
+    part files in the snapshot layout read by DuckDBBackend, or copied into
+    the bigbrotr database. The output only depends on the seed.
+
+    Parameters:
+    - output (str): Snapshot folder (unused with fmt 'postgres').
+    - n_events (int): Number of events.
+    - n_pubkeys (int): Number of pubkeys.
+    - n_relays (int): Number of relays.
+    - fmt (str): 'parquet', 'csv' or 'postgres'.
+    - signed (bool): Derive secp256k1 keys and sign the events.
+    - processes (int, optional): Number of worker processes. Defaults to os.cpu_count().
+    - chunk_size (int): Events per chunk (and per part file).
+    - start (int): Start of the period of the events (unix time).
+    - end (int): End of the period of the events (unix time).
+    - pubkey_exponent (float): Zipf exponent of the pubkey activity.
+    - relay_exponent (float): Zipf exponent of the relay popularity.
+    - relay_p (float): Success probability of the geometric number of relays per event (mean 1 / relay_p).
+    - mean_lag (float): Mean delay in seconds between created_at and seen_at.
+    - kind_mix (dict, optional): kind -> weight. Defaults to KIND_MIX.
+    - seed (int): Seed of the dataset.
+    - bigbrotr (psycopg2.connection, optional): Connection to the bigbrotr database, required with fmt 'postgres'.
+
+    Example:
+    >>> generate_dataset('/data/synthetic', 20_000_000, 1_000_000, processes=16)
+    {'events': 20000000, 'events_relays': ..., 'relays': 500, 'relay_metadata': 500}
+
+    Returns:
+    - dict: Number of rows written per table.
+
+    Raises:
+    - ValueError: if fmt is unknown or no connection is given with fmt 'postgres'
+    """
+    if fmt not in ('parquet', 'csv', 'postgres'):
+        raise ValueError(f"fmt must be 'parquet', 'csv' or 'postgres', not {fmt}")
+    if fmt == 'postgres' and bigbrotr is None:
+        raise ValueError("a bigbrotr connection is required with fmt 'postgres'")
+    processes = processes or os.cpu_count()
+    # polars is not fork-safe once its thread pool has started: workers are spawned
+    context = multiprocessing.get_context('spawn')
+    rng = np.random.default_rng(seed)
+    key_chunks = [(i, min(i + chunk_size, n_pubkeys), seed, signed) for i in range(0, n_pubkeys, chunk_size)]
+    with context.Pool(processes) as pool:
+        keypairs = [pair for pairs in pool.map(_keypairs, key_chunks) for pair in pairs]
+    first_seen = rng.integers(start, end, n_pubkeys)
+    lifespan = np.minimum(rng.lognormal(np.log(60 * DAY), 1.5, n_pubkeys), end - first_seen)
+    tor = rng.random(n_relays) < 0.1
+    relays = [f'ws://{_onion_host(i)}.onion' if onion else f'wss://relay{i}.example.com' for i, onion in enumerate(tor.tolist())]
+    relays_df = pl.DataFrame({'url': relays, 'network': np.where(tor, 'tor', 'clearnet').tolist()})
+    relay_metadata_df = pl.DataFrame({
+        'relay_url': relays,
+        'generated_at': np.full(n_relays, end, dtype=np.int64),
+        'readable': rng.random(n_relays) < 0.85,
+        'writable': rng.random(n_relays) < 0.7,
+    })
+    counts = {'events': 0, 'events_relays': 0, 'relays': n_relays, 'relay_metadata': n_relays}
+    if fmt == 'postgres':
+        _copy(bigbrotr, 'relays', relays_df)
+        counts['relay_metadata'] = 0
+    else:
+        _write_part(relays_df, output, 'relays', 0, fmt)
+        _write_part(relay_metadata_df, output, 'relay_metadata', 0, fmt)
+    state = {
+        'config': {
+            'format': fmt, 'output': output, 'signed': signed, 'kind_mix': kind_mix or KIND_MIX,
+            'pubkey_exponent': pubkey_exponent, 'relay_exponent': relay_exponent,
+            'relay_p': relay_p, 'mean_lag': mean_lag,
+        },
+        'pubkeys': [pair[1] for pair in keypairs],
+        'seckeys': [pair[0] for pair in keypairs] if signed else None,
+        'relays': relays,
+        'first_seen': first_seen,
+        'lifespan': lifespan,
+    }
+    chunks = [(index, min(chunk_size, n_events - offset), [seed, index])
+              for index, offset in enumerate(range(0, n_events, chunk_size))]
+    with context.Pool(processes, initializer=_init_worker, initargs=(state,)) as pool:
+        for index, events, events_relays in pool.imap_unordered(_generate_chunk, chunks):
+            if fmt == 'postgres':
+                _copy(bigbrotr, 'events', events)
+                _copy(bigbrotr, 'events_relays', events_relays)
+                events, events_relays = len(events), len(events_relays)
+            counts['events'] += events
+            counts['events_relays'] += events_relays
+            print(f"chunk {index + 1}/{len(chunks)} generated.")
+    return counts
+
+
+if __name__ == "__main__":
+    import time
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.path.append(os.getenv("LIB_FOLDER"))
+    parser = argparse.ArgumentParser(description="Generate a synthetic nostr dataset.")
+    parser.add_argument('output', nargs='?', default=os.getenv("SNAPSHOT_FOLDER"), help="snapshot folder (unused with --format postgres)")
+    parser.add_argument('--events', type=int, default=1_000_000, help="number of events")
+    parser.add_argument('--pubkeys', type=int, default=100_000, help="number of pubkeys")
+    parser.add_argument('--relays', type=int, default=500, help="number of relays")
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'csv', 'postgres'])
+    parser.add_argument('--signed', action='store_true', help="valid keys and signatures (slow)")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=200_000, help="events per chunk")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    bigbrotr = None
+    if args.format == 'postgres':
+        import psycopg2
+        bigbrotr = psycopg2.connect(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            dbname=os.getenv("DB_NAME")
+        )
+    started = time.perf_counter()
+    counts = generate_dataset(args.output, args.events, args.pubkeys, n_relays=args.relays, fmt=args.format,
+                              signed=args.signed, processes=args.processes, chunk_size=args.chunk_size,
+                              seed=args.seed, bigbrotr=bigbrotr)
+    elapsed = time.perf_counter() - started
+    print(json.dumps(counts), f"in {elapsed:.1f}s ({counts['events'] / elapsed:.0f} events/s)")
+    if bigbrotr is not None:
+        bigbrotr.close()
@@ -0,0 +1,422 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+import polars as pl
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from duckdb_backend import dialect
+
+
+TELEMETRY_FOLDER = 'telemetry'
+PROMETHEUS_FILE = 'bigbrotr_pipeline.prom'
+COPY_PATTERN = re.compile(r'^\s*COPY\s*\((.*)\)\s*TO\s+STDOUT\b.*$', re.IGNORECASE | re.DOTALL)
+RSS_INTERVAL = 0.05
+SAMPLE_INTERVAL = 0.005
+# outputs a stage does not report rows for are only counted if new and at most this large
+COUNT_ROWS_BYTES = 64 << 20
+
+
+def _peak_children_rss():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak * (1 if sys.platform == 'darwin' else 1024)
+
+
+class _RssSampler(threading.Thread):
+    """Thread polling the resident set size of the process, to get the peak of a stage rather than of the process lifetime."""
+
+    def __init__(self, process) -> None:
+        super().__init__(daemon=True)
+        self.process = process
+        self.peak = process.memory_info().rss
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return max(self.peak, self.process.memory_info().rss)
+
+
+class _StackSampler(threading.Thread):
+    """Thread sampling the stack of a thread, counting the folded stacks (flamegraph.pl / speedscope input)."""
+
+    def __init__(self, thread_id: int) -> None:
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+class _CountingFile:
+    """File wrapper counting the bytes and lines written through it (the rows of a COPY ... WITH CSV HEADER)."""
+
+    def __init__(self, file) -> None:
+        self.file = file
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.lines += data.count('\n') if isinstance(data, str) else data.count(b'\n')
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class TracedCursor:
+    """
+    Cursor wrapper recording the duration and row count of every statement in the Telemetry of the connection.
+
+    Attributes:
+    - cursor: the wrapped psycopg2 or DuckDBCursor cursor
+    - telemetry: Telemetry, the run telemetry
+
+    Methods:
+    - execute(sql: str, params) -> None: run and record a statement
+    - fetchall() -> list: rows of the last statement (recorded as rows in)
+    - fetchmany(size: int) -> list: next rows of the last statement (recorded as rows in)
+    - copy_expert(sql: str, file) -> None: run and record a COPY
+    """
+
+    def __init__(self, cursor, telemetry: "Telemetry") -> None:
+        self.cursor = cursor
+        self.telemetry = telemetry
+        self._fetched = False
+
+    def __enter__(self) -> "TracedCursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def execute(self, sql: str, params=None) -> None:
+        # a server-side (named) psycopg2 cursor runs a single statement, so it is not explained
+        plan = None if getattr(self.cursor, 'name', None) else self.telemetry._explain(self.cursor, sql, params)
+        start = time.perf_counter()
+        self.cursor.execute(sql, params)
+        self.telemetry._record_query(sql, time.perf_counter() - start, None, plan)
+        self._fetched = False
+
+    def fetchall(self) -> list:
+        rows = self.cursor.fetchall()
+        self.telemetry._add_rows(len(rows))
+        return rows
+
+    def fetchmany(self, size: int) -> list:
+        rows = self.cursor.fetchmany(size)
+        self.telemetry._add_rows(len(rows), more=self._fetched)
+        self._fetched = True
+        return rows
+
+    def copy_expert(self, sql: str, file) -> None:
+        match = COPY_PATTERN.match(sql)
+        plan = self.telemetry._explain(self.cursor, match.group(1)) if match else None
+        counting = _CountingFile(file)
+        start = time.perf_counter()
+        self.cursor.copy_expert(sql, counting)
+        # the header line is not a row
+        rows = max(counting.lines - 1, 0) if match else None
+        self.telemetry._record_query(sql, time.perf_counter() - start, rows, plan, counting.bytes if match else None)
+
+
+class TracedConnection:
+    """
+    Connection wrapper (psycopg2 or DuckDBBackend) returning TracedCursor cursors.
+
+    Every other attribute (commit, close, dialect, ...) is the one of the
+    wrapped connection, so the generators use it unchanged.
+    """
+
+    def __init__(self, connection, telemetry: "Telemetry") -> None:
+        self.connection = connection
+        self.telemetry = telemetry
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def cursor(self, *args, **kwargs) -> TracedCursor:
+        return TracedCursor(self.connection.cursor(*args, **kwargs), self.telemetry)
+
+    def frame(self, sql: str, params=None):
+        start = time.perf_counter()
+        df = self.connection.frame(sql, params)
+        self.telemetry._record_query(sql, time.perf_counter() - start, len(df), None)
+        return df
+
+
+class Telemetry:
+    """
+    Class to record the wall and CPU time, rows, bytes written and peak memory of every stage of a generate_data run.
+
+    A stage is a `with telemetry.stage(name)` block. During a stage the
+    resident set size is polled in a thread, so the peak is the one of the
+    stage; the queries of a traced connection are timed and their rows
+    counted; the files of the data folder created or modified by the stage
+    are its outputs (size, and rows of the new ones of at most
+    COUNT_ROWS_BYTES if the stage reports none). The rows written are the ones the stage reports as
+    rows_out of the yielded record (e.g. the return value of a generator),
+    or else the rows counted in its outputs, so a large or appended file is
+    never read again. With explain, every SELECT sent to Postgres is first
+    run with EXPLAIN (ANALYZE, BUFFERS), which executes it twice: use it to
+    diagnose a run, not in production. With
+    profile_stage, the stack of the stage is sampled and written as folded
+    stacks for flamegraph.pl or speedscope.
+
+    Attributes:
+    - data_folder: str, folder of the generated files
+    - folder: str, folder of the reports (data_folder/telemetry)
+    - explain: bool, add Postgres EXPLAIN (ANALYZE, BUFFERS) timings to the queries
+    - profile_stage: Optional[str], name of the stage to profile
+    - run: dict, the report of the run (started_at, finished_at, stages)
+
+    Methods:
+    - trace(connection) -> TracedConnection: wrap the bigbrotr connection to record its queries
+    - stage(name: str) -> context manager: record a stage
+    - write_report() -> str: write the JSON report and the Prometheus textfile of the run
+    """
+
+    def __init__(self, data_folder: str, explain: bool = False, profile_stage=None) -> None:
+        """
+        Start the telemetry of a run.
+
+        Parameters:
+        - data_folder: str, folder of the generated files
+        - explain: bool, add Postgres EXPLAIN (ANALYZE, BUFFERS) timings to the queries
+        - profile_stage: Optional[str], name of the stage to profile
+
+        Example:
+        >>> telemetry = Telemetry(DATA_FOLDER)
+        >>> bigbrotr = telemetry.trace(connect_backend())
+        >>> with telemetry.stage('events'):
+        ...     generate_events_csv(DATA_FOLDER, bigbrotr)
+        >>> telemetry.write_report()
+
+        Raises:
+        - ImportError: if psutil is not installed
+        """
+        import psutil
+        self.process = psutil.Process()
+        self.data_folder = data_folder
+        self.folder = os.path.join(data_folder, TELEMETRY_FOLDER)
+        self.explain = explain
+        self.profile_stage = profile_stage
+        self.run = {'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'stages': []}
+        self.dialect = None
+        self._current = None
+
+    def trace(self, connection) -> TracedConnection:
+        self.dialect = dialect(connection)
+        return TracedConnection(connection, self)
+
+    def _files(self):
+        """Return path -> (size, mtime) of the files of the data folder, outside the telemetry folder."""
+        files = {}
+        for root, dirs, names in os.walk(self.data_folder):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.folder]
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    @staticmethod
+    def _rows(path):
+        """Return the number of rows of a csv or parquet output (None for other files)."""
+        try:
+            if path.endswith('.parquet'):
+                return pl.scan_parquet(path).select(pl.len()).collect().item()
+            if path.endswith('.csv'):
+                return pl.scan_csv(path, infer_schema=False).select(pl.len()).collect().item()
+        except Exception:
+            return None
+        return None
+
+    def _explain(self, cursor, sql: str, params=None):
+        """Return the EXPLAIN (ANALYZE, BUFFERS) summary of a Postgres SELECT, if explain is on."""
+        if not self.explain or self._current is None or self.dialect != 'postgres':
+            return None
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+        plan = cursor.fetchall()[0][0]
+        plan = json.loads(plan)[0] if isinstance(plan, str) else plan[0]
+        root = plan['Plan']
+        return {
+            'planning_ms': plan.get('Planning Time'),
+            'execution_ms': plan.get('Execution Time'),
+            'shared_hit_blocks': root.get('Shared Hit Blocks'),
+            'shared_read_blocks': root.get('Shared Read Blocks'),
+            'temp_written_blocks': root.get('Temp Written Blocks'),
+            'plan_rows': root.get('Plan Rows'),
+            'actual_rows': root.get('Actual Rows'),
+            'node': root.get('Node Type'),
+        }
+
+    def _record_query(self, sql: str, seconds: float, rows, plan, bytes_written=None) -> None:
+        if self._current is None:
+            return
+        query = {'sql': ' '.join(sql.split())[:500], 'seconds': seconds, 'rows': rows}
+        if bytes_written is not None:
+            query['bytes'] = bytes_written
+        if plan is not None:
+            query['explain'] = plan
+        self._current['queries'].append(query)
+        if rows is not None:
+            self._current['rows_in'] += rows
+
+    def _add_rows(self, rows: int, more: bool = False) -> None:
+        """Add fetched rows to the stage and to the last query (more: a further batch of the same query)."""
+        if self._current is not None:
+            self._current['rows_in'] += rows
+            if self._current['queries'] and self._current['queries'][-1]['rows'] is None:
+                self._current['queries'][-1]['rows'] = rows
+            elif self._current['queries'] and more:
+                self._current['queries'][-1]['rows'] += rows
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Record a stage of the pipeline.
+
+        Parameters:
+        - name: str, name of the stage
+
+        Example:
+        >>> with telemetry.stage('events') as record:
+        ...     record['rows_out'] = generate_events_csv(DATA_FOLDER, bigbrotr)
+        """
+        before = self._files()
+        io_before = self._write_bytes()
+        self._current = {'name': name, 'rows_in': 0, 'rows_out': None, 'queries': [], 'status': 'ok'}
+        rss = _RssSampler(self.process)
+        rss.start()
+        sampler = None
+        if name == self.profile_stage:
+            sampler = _StackSampler(threading.get_ident())
+            sampler.start()
+        cpu = self.process.cpu_times()
+        start = time.perf_counter()
+        try:
+            yield self._current
+        except BaseException as e:
+            self._current['status'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            cpu_after = self.process.cpu_times()
+            peak = rss.stop()
+            stage = self._current
+            self._current = None
+            stage['wall_seconds'] = wall
+            stage['cpu_seconds'] = (cpu_after.user - cpu.user) + (cpu_after.system - cpu.system)
+            stage['children_cpu_seconds'] = (cpu_after.children_user - cpu.children_user) + (cpu_after.children_system - cpu.children_system)
+            stage['peak_rss_bytes'] = peak
+            # largest finished child process of the run so far (e.g. the workers of the k-means sweep)
+            stage['peak_children_rss_bytes'] = _peak_children_rss()
+            io_after = self._write_bytes()
+            stage['write_bytes'] = io_after - io_before if io_before is not None else None
+            outputs = []
+            for path, (size, mtime) in self._files().items():
+                if before.get(path) != (size, mtime):
+                    new = path not in before and size <= COUNT_ROWS_BYTES
+                    outputs.append({'file': os.path.relpath(path, self.data_folder), 'bytes': size,
+                                    'rows': self._rows(path) if new and stage['rows_out'] is None else None})
+            stage['outputs'] = outputs
+            stage['bytes_out'] = sum(output['bytes'] for output in outputs)
+            if stage['rows_out'] is None:
+                stage['rows_out'] = sum(output['rows'] or 0 for output in outputs)
+            if sampler is not None:
+                stage['profile'] = self._write_profile(name, sampler.stop())
+            self.run['stages'].append(stage)
+            print(f"[telemetry] {name}: {wall:.2f}s wall, {stage['cpu_seconds']:.2f}s cpu, "
+                  f"peak rss {peak / 2 ** 20:.0f} MiB, {stage['rows_out']} rows out")
+
+    def _write_bytes(self):
+        try:
+            return self.process.io_counters().write_bytes
+        except (AttributeError, NotImplementedError):
+            return None
+
+    def _write_profile(self, name: str, stacks: Counter) -> str:
+        """Write the folded stacks of a stage (one 'frame;frame;frame count' line per stack) and return the path."""
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"{self._run_id()}-{name}.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _run_id(self) -> str:
+        return self.run['started_at'].replace(':', '').replace('-', '').replace('+0000', 'Z')
+
+    def write_report(self) -> str:
+        """
+        Write the JSON report of the run and the Prometheus textfile of its stages.
+
+        The JSON report is telemetry/run-<start>.json; the textfile
+        (telemetry/bigbrotr_pipeline.prom) is overwritten at every run, for
+        the node_exporter textfile collector.
+
+        Returns:
+        - str, path of the JSON report
+        """
+        self.run['finished_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"run-{self._run_id()}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.run, f, indent=1)
+        os.replace(path + '.tmp', path)
+        metrics = [
+            ('wall_seconds', 'gauge', 'Wall time of the stage.'),
+            ('cpu_seconds', 'gauge', 'CPU time of the stage (user and system).'),
+            ('peak_rss_bytes', 'gauge', 'Peak resident set size during the stage.'),
+            ('rows_in', 'gauge', 'Rows read from the database by the stage.'),
+            ('rows_out', 'gauge', 'Rows written by the stage.'),
+            ('bytes_out', 'gauge', 'Size of the files written by the stage.'),
+        ]
+        lines = []
+        for metric, kind, help_text in metrics:
+            lines.append(f"# HELP bigbrotr_stage_{metric} {help_text}")
+            lines.append(f"# TYPE bigbrotr_stage_{metric} {kind}")
+            for stage in self.run['stages']:
+                lines.append(f'bigbrotr_stage_{metric}{{stage="{stage["name"]}"}} {stage[metric]}')
+        lines.append("# HELP bigbrotr_pipeline_last_run_timestamp_seconds End of the last run.")
+        lines.append("# TYPE bigbrotr_pipeline_last_run_timestamp_seconds gauge")
+        lines.append(f"bigbrotr_pipeline_last_run_timestamp_seconds {time.time():.0f}")
+        prom_path = os.path.join(self.folder, PROMETHEUS_FILE)
+        with open(prom_path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(prom_path + '.tmp', prom_path)
+        print(f"telemetry report written to {path}.")
+        return path